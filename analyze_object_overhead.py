@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import time
+
+import h5py
+
+import hdf5_overhead
+import layout_writers
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup analysis parameters
+paths = vr_params.parameter("paths", None) # To analyze existing files, set this to a list of paths (otherwise, the test BAGs are converted to all the layouts).
+layouts = vr_params.parameter("layouts", list(layout_writers.layouts)) # Select the layouts to convert to.
+ziptype = vr_params.parameter("ziptype", None) # To analyze compressed layouts, set this to "gzip", "lzf" or a vr_codecs codec.
+details = vr_params.parameter("details", False) # To list the profile of every object in the results, set this to True.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "object_overhead.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+# convert the test BAGs to all the layouts (with a single read of each input)
+
+if paths is None:
+    paths = list()
+    for bag_path in sorted(bag_paths):
+        logger.info("input BAG file: %s" % bag_path)
+        bag_name = os.path.basename(bag_path)
+        writers = list()
+        for layout in layouts:
+            test_suffix = layout
+            if ziptype != None:
+                test_suffix += "_" + ziptype
+            out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + test_suffix +
+                                    os.path.splitext(bag_name)[1])
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            writers.append(layout_writers.layouts[layout](h5py.File(out_path, 'w'), ziptype=ziptype))
+            paths.append(out_path)
+        logging.getLogger("layout_writers").setLevel(logging.WARNING)
+        with h5py.File(bag_path, 'r') as fid:
+            layout_writers.convert(fid, writers)
+        for writer in writers:
+            writer.fod.close()
+
+# profile the object overhead of each file
+
+results = list()
+for path in paths:
+    result = hdf5_overhead.profile_file(path, details=details)
+    results.append(result)
+    totals = result["totals"]
+    tiles = result["tiles"]
+    logger.info("- %d groups, %d datasets, %d attributes (%d bytes)"
+                % (totals["groups"], totals["datasets"], totals["attributes"], totals["attribute_bytes"]))
+    logger.info("- header: %d bytes, dense attributes: %d bytes, index: %d bytes, heap: %d bytes, raw data: %d bytes, "
+                "unaccounted: %d bytes"
+                % (totals["header_bytes"], totals["dense_attribute_bytes"], totals["index_bytes"],
+                   totals["heap_bytes"], totals["raw_bytes"], result["unaccounted_bytes"]))
+    if result["nr_tiles"] > 0:
+        logger.info("- per tile: %.1f objects, %.0f metadata bytes -> tile overhead ratio: %.3f"
+                    % (result["objects_per_tile"], result["metadata_bytes_per_tile"], tiles["overhead_ratio"] or 0))
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "hdf5": h5py.version.hdf5_version,
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
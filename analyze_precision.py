@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_params
+import vr_precision
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup analysis parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to analyze.
+layouts = vr_params.parameter("layouts", ["ATT", "CMP"]) # Select the layouts to analyze.
+precisions = vr_params.parameter("precisions", [None, {"decimals": 3}, {"decimals": 2}, {"bits": 16}, {"bits": 12}]) # The precisions to analyze (None: lossless, as reference).
+ziptype = vr_params.parameter("ziptype", "gzip") # The compression of the tile datasets (the bit rounding relies on it).
+filters = vr_params.parameter("filters", {"shuffle": True}) # Additional creation options of the tile datasets.
+keep_outputs = vr_params.parameter("keep_outputs", False) # To inspect the analyzed files, set this to True.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "precision_report.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# the name of a precision setting (as used in the results)
+
+
+def precision_name(precision):
+    if precision is None:
+        return "lossless"
+    mode, digits = vr_precision.parse(precision)
+    return "%s%d" % (mode, digits)
+
+
+# the per-tile report of a converted BAG: stored bytes (of the unique payloads), compression ratio, error bound (from
+# the tile attributes) and max absolute error against the input tiles
+
+
+def tile_report(reader, tiles, refs):
+    results = list()
+    for tile in tiles:
+        name = "%d_%d" % (tile["row"], tile["col"])
+        nodes = int(tile["dimensions_x"]) * int(tile["dimensions_y"])
+        stored_bytes = 0
+        bound = 0.0
+        for path in reader.tile_dataset_paths(name):
+            dataset = reader.resolve_dataset(reader.group[path])
+            stored_bytes += dataset.id.get_storage_size()
+            bound = max(bound, float(reader.group[path].attrs.get("error_bound", 0.0)))
+        expected = vr_tiles.tile_arrays(refs, tile)
+        error = max(vr_precision.max_error(values, decoded) for values, decoded in zip(expected, reader.read_tile(name)))
+        raw_bytes = nodes * 2 * np.dtype(np.float32).itemsize
+        results.append({"tile": name, "nodes": nodes, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes,
+                        "compression_ratio": raw_bytes / stored_bytes if stored_bytes > 0 else None,
+                        "error_bound": bound, "max_error": error, "within_bound": error <= bound})
+    return results
+
+
+def analyze_setting(fid, bag_path, layout, precision, tiles, refs):
+    name = precision_name(precision)
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout + "_precision_" + name +
+                            os.path.splitext(bag_name)[1])
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    result = {"input": bag_path, "layout": layout, "precision": name}
+
+    try:
+        with h5py.File(out_path, 'w') as fod:
+            writer = layout_writers.layouts[layout](fod, ziptype=ziptype, filters=filters, precision=precision)
+            layout_writers.convert(fid, [writer])
+        result["file_size"] = os.path.getsize(out_path)
+        with h5py.File(out_path, 'r') as fod:
+            result["tiles"] = tile_report(layout_readers.layouts[layout](fod), tiles, refs)
+    except Exception as e:
+        logger.warning("- %s [%s]: failed: %s" % (layout, name, e))
+        result["error"] = str(e)
+        return result
+    finally:
+        if not keep_outputs and os.path.exists(out_path):
+            os.remove(out_path)
+
+    result["raw_bytes"] = sum(tile["raw_bytes"] for tile in result["tiles"])
+    result["stored_bytes"] = sum(tile["stored_bytes"] for tile in result["tiles"])
+    result["compression_ratio"] = result["raw_bytes"] / result["stored_bytes"] if result["stored_bytes"] > 0 else None
+    result["max_error"] = max([tile["max_error"] for tile in result["tiles"]] or [0.0])
+    result["tiles_over_bound"] = [tile["tile"] for tile in result["tiles"] if not tile["within_bound"]]
+    return result
+
+
+# the converters log each tile: only the report is of interest here
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+
+results = list()
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+
+    with h5py.File(bag_path, 'r') as fid:
+        tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+        refs = fid["BAG_root/varres_refinements"][0]
+
+        for layout in layouts:
+            for precision in precisions:
+                result = analyze_setting(fid, bag_path, layout, precision, tiles, refs)
+                results.append(result)
+                if "error" in result:
+                    continue
+                ratios = [tile["compression_ratio"] for tile in result["tiles"] if tile["compression_ratio"] is not None]
+                logger.info("- %s [%s]: %d tiles, ratio %.2f (per tile: %.2f to %.2f), max error %g, %d tiles over "
+                            "their error bound" % (layout, result["precision"], len(result["tiles"]),
+                                                   result["compression_ratio"] or 0, min(ratios or [0]),
+                                                   max(ratios or [0]), result["max_error"],
+                                                   len(result["tiles_over_bound"])))
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+        },
+        "parameters": {
+            "ziptype": ziptype,
+            "filters": filters,
+            "precisions": precisions,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
+
+if any(len(result.get("tiles_over_bound", [])) > 0 for result in results):
+    raise RuntimeError("Some tiles exceed the error bound recorded in their attributes (see: %s)" % json_path)
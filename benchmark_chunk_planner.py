@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_bench
+import vr_chunks
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", ["ATT", "CMP", "SHP"]) # Select the layouts to benchmark.
+chunk_accesses = vr_params.parameter("chunk_accesses", [None] + vr_chunks.access_patterns) # The planned access patterns to benchmark (None: the h5py defaults).
+ziptypes = vr_params.parameter("ziptypes", [None, "gzip"]) # The compressions of the tile datasets to benchmark.
+chunk_bytes = vr_params.parameter("chunk_bytes", vr_chunks.default_chunk_bytes) # The nr. of bytes of the planned chunks (rows and bbox).
+upsampling_factors = vr_params.parameter("upsampling_factors", [1, 16]) # The factors the tiles are upsampled by in a copy of each input (to benchmark larger tiles).
+bbox_fraction = vr_params.parameter("bbox_fraction", 0.25) # The side of the read windows, as a fraction of the tile side.
+samples = vr_params.parameter("samples", 200) # The nr. of random reads timed for each access pattern.
+chunk_cache_bytes = vr_params.parameter("chunk_cache_bytes", 0) # The size of the HDF5 chunk cache of each dataset while reading (0: each read decodes its chunks).
+keep_outputs = vr_params.parameter("keep_outputs", False) # To inspect the benchmarked files, set this to True.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_chunk_planner.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# the median latency (in seconds) of the passed reads, each one timed on its own
+
+
+def median_latency(reads):
+    timings = list()
+    for read in reads:
+        start = time.perf_counter()
+        read()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) if len(timings) > 0 else None
+
+
+# the random reads of an access pattern: whole tiles, single rows or windows (of all the datasets of a tile)
+
+
+def random_reads(rng, reader, names, access):
+    reads = list()
+    for name in rng.choice(names, size=samples):
+        datasets = [reader.resolve_dataset(reader.group[path]) for path in reader.tile_dataset_paths(name)]
+        rows, cols = datasets[0].shape[:2]
+        if access == "tile":
+            reads.append(lambda datasets=datasets: [dataset[()] for dataset in datasets])
+        elif access == "rows":
+            row = int(rng.integers(rows))
+            reads.append(lambda datasets=datasets, row=row: [dataset[row] for dataset in datasets])
+        else:
+            size_y = max(int(rows * bbox_fraction), 1)
+            size_x = max(int(cols * bbox_fraction), 1)
+            row = int(rng.integers(rows - size_y + 1))
+            col = int(rng.integers(cols - size_x + 1))
+            window = np.s_[row:row + size_y, col:col + size_x]
+            reads.append(lambda datasets=datasets, window=window: [dataset[window] for dataset in datasets])
+    return reads
+
+
+def benchmark_setting(fid, bag_path, layout, ziptype, access):
+    name = "planned_" + access if access is not None else "default"
+    if ziptype is not None:
+        name += "_" + ziptype
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout + "_bench_" + name +
+                            os.path.splitext(bag_name)[1])
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    result = {"input": bag_path, "layout": layout, "setting": name, "ziptype": ziptype, "chunk_access": access}
+
+    try:
+        start = time.perf_counter()
+        with h5py.File(out_path, 'w') as fod:
+            writer = layout_writers.layouts[layout](fod, ziptype=ziptype, chunk_access=access, chunk_bytes=chunk_bytes)
+            layout_writers.convert(fid, [writer])
+        result["write_time"] = time.perf_counter() - start
+        result["file_size"] = os.path.getsize(out_path)
+
+        with h5py.File(out_path, 'r', rdcc_nbytes=chunk_cache_bytes) as fod:
+            reader = layout_readers.layouts[layout](fod)
+            names = sorted(reader.tile_names())
+            chunk_counts = list()
+            for tile_name in names:
+                for path in reader.tile_dataset_paths(tile_name):
+                    dataset = reader.group[path]
+                    chunk_counts.append(dataset.id.get_num_chunks() if dataset.chunks is not None else 0)
+            result["chunked_datasets"] = sum(1 for count in chunk_counts if count > 0)
+            result["chunks"] = sum(chunk_counts)
+            for pattern in vr_chunks.access_patterns:
+                rng = np.random.default_rng(0)  # the same reads for every setting
+                result[pattern + "_read_p50"] = median_latency(random_reads(rng, reader, names, pattern))
+    except Exception as e:
+        logger.warning("- %s [%s]: failed: %s" % (layout, name, e))
+        result["error"] = str(e)
+        return result
+    finally:
+        if not keep_outputs and os.path.exists(out_path):
+            os.remove(out_path)
+    return result
+
+
+# the converters log each tile: only the benchmark results are of interest here
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+
+results = list()
+for source_path in bag_paths:
+    for factor in upsampling_factors:
+        bag_path = vr_bench.upsampled_copy(source_path, factor, test_output_folder) if factor > 1 else source_path
+        logger.info("input BAG file: %s (tiles upsampled x%d)" % (bag_path, factor))
+
+        with h5py.File(bag_path, 'r') as fid:
+            for layout in layouts:
+                for ziptype in ziptypes:
+                    for access in chunk_accesses:
+                        result = benchmark_setting(fid, bag_path, layout, ziptype, access)
+                        result["source"] = source_path
+                        result["upsampling_factor"] = factor
+                        results.append(result)
+                        if "error" in result:
+                            continue
+                        logger.info("- %s [%s]: %d bytes, %d chunks, p50 reads: tile %.1f us, row %.1f us, "
+                                    "bbox %.1f us" % (layout, result["setting"], result["file_size"], result["chunks"],
+                                                      result["tile_read_p50"] * 1e6, result["rows_read_p50"] * 1e6,
+                                                      result["bbox_read_p50"] * 1e6))
+
+        if factor > 1 and not keep_outputs:
+            os.remove(bag_path)
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+        },
+        "parameters": {
+            "chunk_bytes": chunk_bytes,
+            "upsampling_factors": upsampling_factors,
+            "bbox_fraction": bbox_fraction,
+            "samples": samples,
+            "chunk_cache_bytes": chunk_cache_bytes,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
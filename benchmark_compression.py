@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import layout_writers
+import vr_bench
+import vr_codecs
+import vr_params
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", list(layout_writers.layouts)) # Select the layouts to benchmark.
+gzip_levels = vr_params.parameter("gzip_levels", [1, 4, 6, 9]) # The gzip levels to sweep.
+scaleoffset_digits = vr_params.parameter("scaleoffset_digits", 2) # The decimal digits kept by the (lossy) scale-offset filter.
+codecs = vr_params.parameter("codecs", None) # The filter plugin codecs to benchmark, when available (None: all of them, see vr_codecs).
+repeats = vr_params.parameter("repeats", 3) # The nr. of repetitions of the read timings.
+keep_outputs = vr_params.parameter("keep_outputs", False) # To inspect the benchmarked files, set this to True.
+label = vr_params.parameter("label", None) # A free label stored in the results (e.g., a version tag).
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_compression.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+# the sweep of filter settings: (name, ziptype, filters)
+
+
+def filter_settings():
+    settings = [("none", None, {})]
+    for level in gzip_levels:
+        settings.append(("gzip%d" % level, "gzip", {"compression_opts": level}))
+        settings.append(("gzip%d_shuffle" % level, "gzip", {"compression_opts": level, "shuffle": True}))
+    settings.append(("lzf", "lzf", {}))
+    settings.append(("lzf_shuffle", "lzf", {"shuffle": True}))
+    settings.append(("fletcher32", None, {"fletcher32": True}))
+    settings.append(("gzip4_shuffle_fletcher32", "gzip", {"compression_opts": 4, "shuffle": True, "fletcher32": True}))
+    settings.append(("scaleoffset%d" % scaleoffset_digits, None, {"scaleoffset": scaleoffset_digits}))
+    settings.append(("scaleoffset%d_gzip4" % scaleoffset_digits, "gzip",
+                     {"scaleoffset": scaleoffset_digits, "compression_opts": 4}))
+    for name in vr_codecs.report():
+        if codecs is not None and name not in codecs:
+            continue
+        settings.append((name, name, {}))
+        if name in ["lz4", "zstd", "bzip2"]:  # the blosc and bitshuffle codecs shuffle inside the filter
+            settings.append((name + "_shuffle", name, {"shuffle": True}))
+    return settings
+
+
+def benchmark_setting(fid, bag_path, layout, setting, reference, nr_nodes):
+    name, ziptype, filters = setting
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout + "_bench_" + name +
+                            os.path.splitext(bag_name)[1])
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    result = {"input": bag_path, "layout": layout, "setting": name, "ziptype": ziptype,
+              "filters": {key: value for key, value in filters.items()}, "nodes": nr_nodes}
+
+    try:
+        start = time.perf_counter()
+        with h5py.File(out_path, 'w') as fod:
+            writer = layout_writers.layouts[layout](fod, ziptype=ziptype, filters=filters)
+            layout_writers.convert(fid, [writer])
+        result["write_time"] = time.perf_counter() - start
+        result["file_size"] = os.path.getsize(out_path)
+
+        result["read_time"], nodes, max_error = vr_bench.timed_scan(out_path, layout, reference, repeats)
+        result["max_error"] = max_error
+        result["lossless"] = max_error == 0.0
+        if nodes != nr_nodes:
+            raise RuntimeError("read %d nodes, expected %d" % (nodes, nr_nodes))
+    except Exception as e:
+        logger.warning("- %s [%s]: failed: %s" % (layout, name, e))
+        result["error"] = str(e)
+        return result
+    finally:
+        if not keep_outputs and os.path.exists(out_path):
+            os.remove(out_path)
+
+    result["write_nodes_per_s"] = vr_bench.nodes_per_s(nr_nodes, result["write_time"])
+    result["read_nodes_per_s"] = vr_bench.nodes_per_s(nr_nodes, result["read_time"])
+    return result
+
+
+# the converters log each tile: only the benchmark results are of interest here
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+
+settings = filter_settings()
+logger.info("nr. of filter settings: %d (%s)" % (len(settings), ", ".join(setting[0] for setting in settings)))
+
+results = list()
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+
+    with h5py.File(bag_path, 'r') as fid:
+        tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+        refs = fid["BAG_root/varres_refinements"][0]
+        reference = dict()
+        for tile in tiles:
+            reference["%d_%d" % (tile["row"], tile["col"])] = vr_tiles.tile_arrays(refs, tile)
+        nr_nodes = int((tiles["dimensions_x"].astype(np.int64) * tiles["dimensions_y"]).sum())
+
+        for layout in layouts:
+            for setting in settings:
+                result = benchmark_setting(fid, bag_path, layout, setting, reference, nr_nodes)
+                results.append(result)
+                if "error" in result:
+                    continue
+                logger.info("- %s [%s]: %d bytes, write %.0f nodes/s, read %.0f nodes/s, max error %g"
+                            % (layout, result["setting"], result["file_size"], result["write_nodes_per_s"] or 0,
+                               result["read_nodes_per_s"] or 0, result["max_error"]))
+
+# the smallest and the fastest-reading lossless settings of each layout (on all the inputs)
+for layout in layouts:
+    totals = dict()
+    read_times = dict()
+    for result in results:
+        if result["layout"] != layout or "error" in result or not result["lossless"]:
+            continue
+        totals[result["setting"]] = totals.get(result["setting"], 0) + result["file_size"]
+        read_times[result["setting"]] = read_times.get(result["setting"], 0.0) + result["read_time"]
+    if len(totals) > 0:
+        best = min(totals, key=totals.get)
+        logger.info("smallest lossless setting for %s: %s (%d bytes)" % (layout, best, totals[best]))
+        fastest = min(read_times, key=read_times.get)
+        logger.info("fastest-reading lossless setting for %s: %s (%.3f s, %d bytes)"
+                    % (layout, fastest, read_times[fastest], totals[fastest]))
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "label": label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+            "hdf5plugin": vr_codecs.hdf5plugin.version if vr_codecs.hdf5plugin is not None else None,
+        },
+        "parameters": {
+            "repeats": repeats,
+            "gzip_levels": gzip_levels,
+            "scaleoffset_digits": scaleoffset_digits,
+            "codecs": codecs,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
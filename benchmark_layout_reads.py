@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", list(layout_readers.layouts)) # Select the layouts to benchmark.
+ziptype = vr_params.parameter("ziptype", None) # To benchmark compressed layouts, set this to "gzip", "lzf" or a vr_codecs codec.
+convert = vr_params.parameter("convert", True) # To benchmark outputs already in the output folder, set this to False.
+repeats = vr_params.parameter("repeats", 5) # The nr. of repetitions of the open, enumerate, scan and bbox timings.
+random_reads = vr_params.parameter("random_reads", 200) # The nr. of random single-tile reads.
+bbox_fraction = vr_params.parameter("bbox_fraction", 0.25) # The side of the (centered) query bbox, as fraction of the surface extent.
+pan_steps = vr_params.parameter("pan_steps", 20) # The nr. of steps of the simulated panning (with the query bbox) across the surface.
+cache_bytes = vr_params.parameter("cache_bytes", 64 * 1024 * 1024) # The budget of the tile cache used when panning.
+seed = vr_params.parameter("seed", 0) # The seed of the random single-tile reads.
+label = vr_params.parameter("label", None) # A free label stored in the results (e.g., a version tag).
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_layout_reads.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# the output BAG path for an input BAG and a layout (as named by the converter scripts)
+
+
+def layout_path(bag_path, layout):
+    bag_name = os.path.basename(bag_path)
+    test_suffix = layout
+    if ziptype != None:
+        test_suffix += "_" + ziptype
+    return os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + test_suffix +
+                        os.path.splitext(bag_name)[1])
+
+
+# time the repeated calls of a function (the files are re-opened at each call), return the median time
+
+
+def median_time(function, path):
+    timings = list()
+    for _ in range(repeats):
+        with h5py.File(path, 'r') as fod:
+            start = time.perf_counter()
+            function(fod)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+# time the opening of an output BAG up to the access to its tiles group
+
+
+def open_time(path, reader_class):
+    timings = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with h5py.File(path, 'r') as fod:
+            reader_class(fod)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+# read all the tiles (in enumeration order), return the nr. of nodes
+
+
+def scan_tiles(reader):
+    nodes = 0
+    for name in reader.tile_names():
+        elevation, _ = reader.read_tile(name)
+        nodes += elevation.size
+    return nodes
+
+
+# retrieve and read all the tiles intersecting the bbox, return the nr. of tiles
+
+
+def query_tiles(reader, bbox):
+    names = reader.query_bbox(*bbox)
+    for name in names:
+        reader.read_tile(name)
+    return len(names)
+
+
+# pan the bbox across the surface (west to east, with overlapping steps), reading the tiles in view
+
+
+def pan_tiles(tile_reader, bbox, surface_bbox):
+    width = bbox[2] - bbox[0]
+    span = surface_bbox[2] - surface_bbox[0] - width
+    for step in range(pan_steps):
+        west = surface_bbox[0] + span * step / max(pan_steps - 1, 1)
+        for _ in tile_reader.query(west, bbox[1], west + width, bbox[3]):
+            pass
+
+
+# the query bbox: the central fraction of the extent of the passed tiles
+
+
+def central_bbox(bounds, fraction=None):
+    if fraction is None:
+        fraction = bbox_fraction
+    west, east = bounds["west"].min(), bounds["east"].max()
+    south, north = bounds["south"].min(), bounds["north"].max()
+    half_x = (east - west) * fraction / 2
+    half_y = (north - south) * fraction / 2
+    center_x, center_y = (west + east) / 2, (south + north) / 2
+    return [float(center_x - half_x), float(center_y - half_y), float(center_x + half_x), float(center_y + half_y)]
+
+
+def benchmark_layout(path, layout, bbox):
+    reader_class = layout_readers.layouts[layout]
+    result = {"layout": layout, "output": path, "file_size": os.path.getsize(path)}
+
+    result["open_time"] = open_time(path, reader_class)
+    result["enumerate_time"] = median_time(lambda fod: reader_class(fod).tile_names(), path)
+
+    with h5py.File(path, 'r') as fod:
+        reader = reader_class(fod)
+        names = reader.tile_names()
+        result["tiles"] = len(names)
+
+        # random single-tile reads (with the same sequence of tiles for all the layouts)
+        rng = np.random.default_rng(seed)
+        latencies = list()
+        for index in rng.integers(0, len(names), size=random_reads if len(names) > 0 else 0):
+            start = time.perf_counter()
+            reader.read_tile(names[index])
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies) if len(latencies) > 0 else np.zeros(1)
+        result["tile_read_p50"] = float(np.percentile(latencies, 50))
+        result["tile_read_p99"] = float(np.percentile(latencies, 99))
+
+        bounds = reader.tile_bounds()
+        surface_bbox = central_bbox(bounds, fraction=1.0)
+        if bbox is None:
+            bbox = central_bbox(bounds)
+
+    with h5py.File(path, 'r') as fod:
+        result["nodes"] = scan_tiles(reader_class(fod))
+    result["scan_time"] = median_time(lambda fod: scan_tiles(reader_class(fod)), path)
+    result["scan_nodes_per_s"] = result["nodes"] / result["scan_time"] if result["scan_time"] > 0 else None
+    result["scan_mb_per_s"] = result["nodes"] * 8 / 1e6 / result["scan_time"] if result["scan_time"] > 0 else None
+
+    with h5py.File(path, 'r') as fod:
+        result["bbox_tiles"] = query_tiles(reader_class(fod), bbox)
+    result["bbox"] = bbox
+    result["bbox_time"] = median_time(lambda fod: query_tiles(reader_class(fod), bbox), path)
+
+    # panning without and with the tile cache
+    for name, budget in [("pan_uncached", 0), ("pan_cached", cache_bytes)]:
+        with h5py.File(path, 'r') as fod:
+            tile_reader = layout_readers.TileReader(fod, layout=layout, cache_bytes=budget)
+            start = time.perf_counter()
+            pan_tiles(tile_reader, bbox, surface_bbox)
+            result[name + "_time"] = time.perf_counter() - start
+            result[name + "_counters"] = tile_reader.counters()
+    return result
+
+
+results = list()
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+
+    # write all the layouts with a single read of the input BAG
+    if convert:
+        writers = list()
+        for layout in layouts:
+            out_path = layout_path(bag_path, layout)
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            writers.append(layout_writers.layouts[layout](h5py.File(out_path, 'w'), ziptype=ziptype))
+        with h5py.File(bag_path, 'r') as fid:
+            layout_writers.convert(fid, writers)
+        for writer in writers:
+            writer.fod.close()
+
+    # the same bbox (from the first layout) is queried in all the layouts
+    bbox = None
+    for layout in layouts:
+        result = benchmark_layout(layout_path(bag_path, layout), layout, bbox)
+        bbox = result["bbox"]
+        result["input"] = bag_path
+        results.append(result)
+        logger.info("- %s: open %.2f ms, enumerate %.2f ms, tile read p50/p99 %.3f/%.3f ms, "
+                    "scan %.0f nodes/s, bbox %d tiles in %.2f ms, pan %.2f/%.2f ms (uncached/cached)"
+                    % (layout, result["open_time"] * 1e3, result["enumerate_time"] * 1e3,
+                       result["tile_read_p50"] * 1e3, result["tile_read_p99"] * 1e3,
+                       result["scan_nodes_per_s"] or 0, result["bbox_tiles"], result["bbox_time"] * 1e3,
+                       result["pan_uncached_time"] * 1e3, result["pan_cached_time"] * 1e3))
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "label": label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+        },
+        "parameters": {
+            "ziptype": ziptype,
+            "repeats": repeats,
+            "random_reads": random_reads,
+            "bbox_fraction": bbox_fraction,
+            "pan_steps": pan_steps,
+            "cache_bytes": cache_bytes,
+            "seed": seed,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", ["UNG", "CMP", "SHP", "ATT", "GSC"]) # Select the layouts to benchmark.
+ziptypes = vr_params.parameter("ziptypes", [None, "gzip"]) # The compressed tiles are read with the h5py fallback.
+random_reads = vr_params.parameter("random_reads", 500) # The nr. of random single-tile reads.
+repeats = vr_params.parameter("repeats", 3) # The nr. of repetitions of the scan timings.
+seed = vr_params.parameter("seed", 0) # The seed of the random single-tile reads.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_memmap_reads.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# read a tile and touch its values (the memory-mapped views are lazily paged in)
+
+
+def read_tile(reader, name):
+    elevation, uncertainty = reader.read_tile(name)
+    return float(elevation.sum()) + float(uncertainty.sum())
+
+
+# the latencies of random single-tile reads (with the same sequence of tiles for both modes)
+
+
+def random_latencies(reader, names):
+    rng = np.random.default_rng(seed)
+    latencies = list()
+    for index in rng.integers(0, len(names), size=random_reads):
+        start = time.perf_counter()
+        read_tile(reader, names[index])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+# the median time to read (and touch) all the tiles
+
+
+def scan_time(reader, names):
+    timings = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for name in names:
+            read_tile(reader, name)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+# the heap bytes held when keeping all the tiles in memory (e.g., a viewer showing the whole surface)
+
+
+def resident_bytes(reader, names):
+    tracemalloc.start()
+    tiles = [reader.read_tile(name) for name in names]
+    for elevation, uncertainty in tiles:
+        elevation.sum()
+        uncertainty.sum()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak
+
+
+results = list()
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+    bag_name = os.path.basename(bag_path)
+
+    for ziptype in ziptypes:
+        paths = dict()
+        writers = list()
+        for layout in layouts:
+            test_suffix = layout
+            if ziptype != None:
+                test_suffix += "_" + ziptype
+            paths[layout] = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + test_suffix +
+                                         os.path.splitext(bag_name)[1])
+            if os.path.exists(paths[layout]):
+                os.remove(paths[layout])
+            writers.append(layout_writers.layouts[layout](h5py.File(paths[layout], 'w'), ziptype=ziptype))
+        with h5py.File(bag_path, 'r') as fid:
+            layout_writers.convert(fid, writers)
+        for writer in writers:
+            writer.fod.close()
+
+        for layout in layouts:
+            result = {"input": bag_path, "layout": layout, "ziptype": ziptype}
+            for mode, memmap in [("h5py", False), ("memmap", True)]:
+                with h5py.File(paths[layout], 'r') as fod:
+                    reader = layout_readers.layouts[layout](fod, memmap=memmap)
+                    names = reader.tile_names()
+                    if len(names) == 0:
+                        continue
+
+                    # the first pass resolves the file offsets of the tiles
+                    start = time.perf_counter()
+                    for name in names:
+                        read_tile(reader, name)
+                    result[mode + "_first_scan_time"] = time.perf_counter() - start
+
+                    latencies = random_latencies(reader, names)
+                    result[mode + "_tile_read_p50"] = float(np.percentile(latencies, 50))
+                    result[mode + "_tile_read_p99"] = float(np.percentile(latencies, 99))
+                    result[mode + "_scan_time"] = scan_time(reader, names)
+                    current, peak = resident_bytes(reader, names)
+                    result[mode + "_resident_bytes"] = current
+                    result[mode + "_peak_bytes"] = peak
+                    result[mode + "_memmap_reads"] = reader.memmap_reads
+                    result[mode + "_h5py_reads"] = reader.h5py_reads
+            results.append(result)
+            if "memmap_scan_time" not in result:
+                continue
+            logger.info("- %s [%s]: tile read p50 %.3f -> %.3f ms, p99 %.3f -> %.3f ms, scan %.2f -> %.2f ms, "
+                        "resident %d -> %d bytes (%d memmap reads, %d h5py fallbacks)"
+                        % (layout, ziptype, result["h5py_tile_read_p50"] * 1e3, result["memmap_tile_read_p50"] * 1e3,
+                           result["h5py_tile_read_p99"] * 1e3, result["memmap_tile_read_p99"] * 1e3,
+                           result["h5py_scan_time"] * 1e3, result["memmap_scan_time"] * 1e3,
+                           result["h5py_resident_bytes"], result["memmap_resident_bytes"],
+                           result["memmap_memmap_reads"], result["memmap_h5py_reads"]))
+
+with open(json_path, "w") as fod:
+    json.dump(results, fod, indent=2)
+logger.info("results written to: %s" % json_path)
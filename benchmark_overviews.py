@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", ["UNG", "CMP", "GSC"]) # Select the layouts to benchmark.
+ziptype = vr_params.parameter("ziptype", None) # To benchmark compressed layouts, set this to "gzip", "lzf" or a vr_codecs codec.
+viewports = vr_params.parameter("viewports", [16, 64, 256, 1024]) # The sides (in pixels) of the simulated viewports.
+repeats = vr_params.parameter("repeats", 5) # The nr. of repetitions of the read timings.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_overviews.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# convert the input to all the layouts (with or without overviews), return the conversion time and the output paths
+
+
+def convert_layouts(bag_path, overviews):
+    bag_name = os.path.basename(bag_path)
+    paths = dict()
+    writers = list()
+    for layout in layouts:
+        test_suffix = layout + ("_overviews" if overviews else "")
+        if ziptype != None:
+            test_suffix += "_" + ziptype
+        paths[layout] = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + test_suffix +
+                                     os.path.splitext(bag_name)[1])
+        if os.path.exists(paths[layout]):
+            os.remove(paths[layout])
+        writers.append(layout_writers.layouts[layout](h5py.File(paths[layout], 'w'), ziptype=ziptype,
+                                                      overviews=overviews))
+    start = time.perf_counter()
+    with h5py.File(bag_path, 'r') as fid:
+        layout_writers.convert(fid, writers)
+    for writer in writers:
+        writer.fod.close()
+    return time.perf_counter() - start, paths
+
+
+# the median time of a read function (the file is re-opened at each repetition), and the nr. of values it read
+
+
+def median_time(function, path, layout):
+    timings = list()
+    for _ in range(repeats):
+        with h5py.File(path, 'r') as fod:
+            reader = layout_readers.layouts[layout](fod)
+            start = time.perf_counter()
+            values = function(reader)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), values
+
+
+# read all the tiles at full refinement resolution (what a viewer does without overviews)
+
+
+def read_all_tiles(reader):
+    values = 0
+    for name in reader.tile_names():
+        elevation, uncertainty = reader.read_tile(name)
+        values += elevation.size + uncertainty.size
+    return values
+
+
+results = list()
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+    plain_time, plain_paths = convert_layouts(bag_path, overviews=False)
+    overviews_time, paths = convert_layouts(bag_path, overviews=True)
+    logger.info("- conversion of %d layouts: %.3f s -> %.3f s with overviews"
+                % (len(layouts), plain_time, overviews_time))
+
+    for layout in layouts:
+        result = {
+            "input": bag_path,
+            "layout": layout,
+            "conversion_time": plain_time,
+            "conversion_time_with_overviews": overviews_time,
+            "file_size": os.path.getsize(plain_paths[layout]),
+            "file_size_with_overviews": os.path.getsize(paths[layout]),
+        }
+        with h5py.File(paths[layout], 'r') as fod:
+            levels = layout_readers.layouts[layout](fod).group["overviews"]
+            result["levels"] = [list(levels[name].shape) for name in sorted(levels, key=lambda name: int(name[6:]))]
+        result["full_read_time"], result["full_read_values"] = median_time(read_all_tiles, paths[layout], layout)
+
+        result["viewports"] = list()
+        for side in viewports:
+            read_time, cells = median_time(lambda reader: reader.read_overview(side, side)[0], paths[layout],
+                                          layout)
+            result["viewports"].append({"side": side, "shape": list(cells.shape), "read_time": read_time,
+                                        "speed_up": result["full_read_time"] / read_time if read_time > 0 else None})
+            logger.info("- %s: %dpx viewport -> %s level read in %.3f ms (full refinements: %.3f ms, %d values)"
+                        % (layout, side, cells.shape, read_time * 1e3, result["full_read_time"] * 1e3,
+                           result["full_read_values"]))
+        results.append(result)
+
+with open(json_path, "w") as fod:
+    json.dump(results, fod, indent=2)
+logger.info("results written to: %s" % json_path)
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import layout_writers
+import vr_bench
+import vr_params
+import vr_tiles
+import vr_verify
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", ["ATT", "CMP"]) # Select the layouts to benchmark.
+thread_counts = vr_params.parameter("thread_counts", [None, 1, 2, 4, 8]) # The nr. of compression threads to sweep (None: compression in the HDF5 write path).
+settings = vr_params.parameter("settings", {"gzip4": {}, "gzip6_shuffle": {"compression_opts": 6, "shuffle": True}}) # The gzip filter settings to benchmark (by name).
+upsampling_factors = vr_params.parameter("upsampling_factors", [1, 8]) # The factors the tiles are upsampled by in a copy of each input (to benchmark larger surfaces).
+repeats = vr_params.parameter("repeats", 3) # The nr. of repetitions of the write timings.
+keep_outputs = vr_params.parameter("keep_outputs", False) # To inspect the benchmarked files, set this to True.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_parallel_compression.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+def benchmark_setting(fid, bag_path, layout, name, filters, threads, nr_nodes):
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout + "_bench_" + name +
+                            "_threads%s" % threads + os.path.splitext(bag_name)[1])
+    result = {"input": bag_path, "layout": layout, "setting": name, "filters": filters, "threads": threads,
+              "nodes": nr_nodes}
+
+    try:
+        timings = list()
+        for _ in range(repeats):
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            start = time.perf_counter()
+            with h5py.File(out_path, 'w') as fod:
+                writer = layout_writers.layouts[layout](fod, ziptype="gzip", filters=filters, compress_threads=threads)
+                layout_writers.convert(fid, [writer])
+            timings.append(time.perf_counter() - start)
+        result["write_time"] = float(np.median(timings))
+        result["file_size"] = os.path.getsize(out_path)
+        if writer.compressor is not None:
+            result["chunks"] = writer.compressor.chunks_written
+            result["wait_time"] = writer.compressor.wait_time
+
+        with h5py.File(out_path, 'r') as fod:
+            report = vr_verify.verify(fid, fod, layout=layout, memmap=False)
+        if not report["equivalent"]:
+            raise RuntimeError("the converted tiles do not match the input refinements")
+    except Exception as e:
+        logger.warning("- %s [%s, threads: %s]: failed: %s" % (layout, name, threads, e))
+        result["error"] = str(e)
+        return result
+    finally:
+        if not keep_outputs and os.path.exists(out_path):
+            os.remove(out_path)
+
+    result["write_nodes_per_s"] = vr_bench.nodes_per_s(nr_nodes, result["write_time"])
+    return result
+
+
+# the converters log each tile: only the benchmark results are of interest here
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+logging.getLogger("vr_verify").setLevel(logging.WARNING)
+
+results = list()
+for source_path in bag_paths:
+    for factor in upsampling_factors:
+        bag_path = vr_bench.upsampled_copy(source_path, factor, test_output_folder) if factor > 1 else source_path
+        logger.info("input BAG file: %s (tiles upsampled x%d)" % (bag_path, factor))
+
+        with h5py.File(bag_path, 'r') as fid:
+            tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+            nr_nodes = int((tiles["dimensions_x"].astype(np.int64) * tiles["dimensions_y"]).sum())
+
+            for layout in layouts:
+                for name, filters in settings.items():
+                    baseline = None
+                    for threads in thread_counts:
+                        result = benchmark_setting(fid, bag_path, layout, name, filters, threads, nr_nodes)
+                        result["source"] = source_path
+                        result["upsampling_factor"] = factor
+                        results.append(result)
+                        if "error" in result:
+                            continue
+                        if threads is None:
+                            baseline = result
+                        elif baseline is not None:
+                            result["speedup"] = baseline["write_time"] / result["write_time"] \
+                                if result["write_time"] > 0 else None
+                        logger.info("- %s [%s, threads: %s]: %d nodes, %d bytes, write %.0f nodes/s (x%.2f of HDF5)"
+                                    % (layout, name, threads, nr_nodes, result["file_size"],
+                                       result["write_nodes_per_s"] or 0, result.get("speedup") or 1.0))
+
+        if factor > 1 and not keep_outputs:
+            os.remove(bag_path)
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+        },
+        "parameters": {
+            "thread_counts": thread_counts,
+            "settings": settings,
+            "upsampling_factors": upsampling_factors,
+            "repeats": repeats,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import tracemalloc
+
+import h5py
+import numpy as np
+
+import layout_writers
+import vr_params
+import vr_resample
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+modes = vr_params.parameter("modes", vr_resample.resample_modes) # The resampling modes to benchmark.
+resolution_factors = vr_params.parameter("resolution_factors", [0.25, 0.5, 1.0, 2.0, 4.0]) # The grid resolutions to sweep, as multiples of the finest tile resolution.
+band_rows = vr_params.parameter("band_rows", [16, 64, 256]) # The nr. of grid rows populated at once to sweep.
+repeats = vr_params.parameter("repeats", 3) # The nr. of repetitions of the resampling timings.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_resample.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# resample the input to a grid (in a new output file), return the median statistics and the peak of the traced heap
+# (measured with an additional run, since tracing slows the allocations down)
+
+
+def run_resample(fid, supergrid, out_path, resolution, mode, rows):
+    with h5py.File(out_path, 'w') as fod:
+        tracemalloc.start()
+        vr_resample.resample(fid, fod, "grid", supergrid, resolution, mode=mode, band_rows=rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    timings = list()
+    for _ in range(repeats):
+        with h5py.File(out_path, 'w') as fod:
+            statistics = vr_resample.resample(fid, fod, "grid", supergrid, resolution, mode=mode, band_rows=rows)
+        timings.append(statistics["time"])
+    statistics["time"] = float(np.median(timings))
+    statistics["nodes_per_s"] = statistics["rows"] * statistics["cols"] / statistics["time"] \
+        if statistics["time"] > 0 else None
+    statistics["peak_heap_bytes"] = peak
+    return statistics
+
+
+results = list()
+logging.getLogger("vr_resample").setLevel(logging.WARNING)
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_bench_grid.h5")
+
+    with h5py.File(bag_path, 'r') as fid:
+        attributes, complete = layout_writers.read_bag_tiles_attributes(fid)
+        if not complete:
+            logger.warning("- skipped: incomplete supergrid description")
+            continue
+        supergrid = (attributes["supergrid_west"], attributes["supergrid_south"],
+                     attributes["supergrid_res_x"], attributes["supergrid_res_y"])
+        tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+        finest = float(min(tiles["resolution_x"].min(), tiles["resolution_y"].min()))
+
+        for mode in modes:
+            for factor in resolution_factors:
+                for rows in band_rows:
+                    statistics = run_resample(fid, supergrid, out_path, finest * factor, mode, rows)
+                    statistics.update({"input": bag_path, "mode": mode, "resolution": finest * factor,
+                                       "resolution_factor": factor, "band_rows": rows})
+                    results.append(statistics)
+                    logger.info("- %s at %.3f (x%s), %d-row bands: %d x %d nodes in %.3f s -> %.0f nodes/s "
+                                "(peak heap: %d bytes)"
+                                % (mode, finest * factor, factor, rows, statistics["rows"], statistics["cols"],
+                                   statistics["time"], statistics["nodes_per_s"] or 0,
+                                   statistics["peak_heap_bytes"]))
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+with open(json_path, "w") as fod:
+    json.dump(results, fod, indent=2)
+logger.info("results written to: %s" % json_path)
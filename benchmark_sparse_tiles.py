@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import hdf5_overhead
+import layout_writers
+import vr_bench
+import vr_params
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", list(layout_writers.layouts)) # Select the layouts to benchmark.
+ziptypes = vr_params.parameter("ziptypes", [None, "gzip"]) # The compressions of the tile datasets to benchmark.
+chunk_shapes = vr_params.parameter("chunk_shapes", [(8, 8), (16, 16), (32, 32)]) # The sparse chunk shapes to sweep (compared to the dense layout).
+empty_tile_fractions = vr_params.parameter("empty_tile_fractions", [0.0, 0.5]) # The fractions of tiles blanked to nodata in a copy of each input (to simulate sparse surveys).
+repeats = vr_params.parameter("repeats", 3) # The nr. of repetitions of the read timings.
+seed = vr_params.parameter("seed", 0) # The seed of the blanked tiles.
+keep_outputs = vr_params.parameter("keep_outputs", False) # To inspect the benchmarked files, set this to True.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_sparse_tiles.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+def benchmark_setting(fid, bag_path, layout, ziptype, chunks, reference, nr_nodes):
+    name = "sparse%dx%d" % tuple(chunks) if chunks is not None else "dense"
+    if ziptype is not None:
+        name += "_" + ziptype
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout + "_bench_" + name +
+                            os.path.splitext(bag_name)[1])
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    result = {"input": bag_path, "layout": layout, "setting": name, "ziptype": ziptype,
+              "sparse_chunks": list(chunks) if chunks is not None else None, "nodes": nr_nodes}
+
+    try:
+        start = time.perf_counter()
+        with h5py.File(out_path, 'w') as fod:
+            writer = layout_writers.layouts[layout](fod, ziptype=ziptype, sparse_chunks=chunks)
+            layout_writers.convert(fid, [writer])
+        result["write_time"] = time.perf_counter() - start
+        result["chunks_written"] = writer.chunks_written
+        result["chunks_elided"] = writer.chunks_elided
+
+        profile = hdf5_overhead.profile_file(out_path)
+        result["file_size"] = profile["file_size"]
+        result["tile_raw_bytes"] = profile["tiles"]["raw_bytes"]
+        result["tile_metadata_bytes"] = profile["tiles"]["metadata_bytes"]
+        result["allocated_chunks"] = profile["tiles"]["chunks"]
+
+        result["read_time"], nodes, max_error = vr_bench.timed_scan(out_path, layout, reference, repeats)
+        if nodes != nr_nodes or max_error != 0.0:
+            raise RuntimeError("the read tiles do not match the input refinements")
+    except Exception as e:
+        logger.warning("- %s [%s]: failed: %s" % (layout, name, e))
+        result["error"] = str(e)
+        return result
+    finally:
+        if not keep_outputs and os.path.exists(out_path):
+            os.remove(out_path)
+
+    result["read_nodes_per_s"] = vr_bench.nodes_per_s(nr_nodes, result["read_time"])
+    return result
+
+
+# the converters log each tile: only the benchmark results are of interest here
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+
+results = list()
+for source_path in bag_paths:
+    for fraction in empty_tile_fractions:
+        bag_path = vr_bench.blanked_copy(source_path, fraction, test_output_folder, seed) if fraction > 0 else source_path
+        logger.info("input BAG file: %s (%.0f%% blanked tiles)" % (bag_path, fraction * 100))
+
+        with h5py.File(bag_path, 'r') as fid:
+            tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+            refs = fid["BAG_root/varres_refinements"][0]
+            reference = dict()
+            for tile in tiles:
+                reference["%d_%d" % (tile["row"], tile["col"])] = vr_tiles.tile_arrays(refs, tile)
+            nr_nodes = int((tiles["dimensions_x"].astype(np.int64) * tiles["dimensions_y"]).sum())
+            nodata_nodes = int(np.count_nonzero(refs[refs.dtype.names[0]] == vr_tiles.nodata_value))
+
+            for layout in layouts:
+                for ziptype in ziptypes:
+                    dense = None
+                    for chunks in [None] + [tuple(shape) for shape in chunk_shapes]:
+                        result = benchmark_setting(fid, bag_path, layout, ziptype, chunks, reference, nr_nodes)
+                        result["source"] = source_path
+                        result["empty_tile_fraction"] = fraction
+                        result["nodata_nodes"] = nodata_nodes
+                        results.append(result)
+                        if "error" in result:
+                            continue
+                        if chunks is None:
+                            dense = result
+                            continue
+                        if dense is not None:
+                            result["size_ratio"] = result["file_size"] / dense["file_size"]
+                            result["read_speed_ratio"] = dense["read_time"] / result["read_time"] \
+                                if result["read_time"] > 0 else None
+                        logger.info("- %s [%s]: %d/%d chunks elided, %d bytes (x%.2f of dense), "
+                                    "read %.0f nodes/s (x%.2f of dense)"
+                                    % (layout, result["setting"], result["chunks_elided"],
+                                       result["chunks_elided"] + result["chunks_written"], result["file_size"],
+                                       result.get("size_ratio") or 0, result["read_nodes_per_s"] or 0,
+                                       result.get("read_speed_ratio") or 0))
+
+        if fraction > 0 and not keep_outputs:
+            os.remove(bag_path)
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+        },
+        "parameters": {
+            "ziptypes": ziptypes,
+            "chunk_shapes": chunk_shapes,
+            "empty_tile_fractions": empty_tile_fractions,
+            "repeats": repeats,
+            "seed": seed,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_index
+import vr_params
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", list(layout_writers.layouts)) # Select the layouts to benchmark.
+queries = vr_params.parameter("queries", 50) # The nr. of random bbox queries.
+bbox_fraction = vr_params.parameter("bbox_fraction", 0.1) # The side of the query bboxes, as fraction of the surface extent.
+synthetic_sizes = vr_params.parameter("synthetic_sizes", [1000, 10000, 100000, 1000000]) # The nr. of tiles of the synthetic (in-memory) catalogs.
+synthetic_bbox_cells = vr_params.parameter("synthetic_bbox_cells", 10) # The side of the synthetic query bboxes, as nr. of super cells.
+seed = vr_params.parameter("seed", 0) # The seed of the random bboxes.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_spatial_index.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# random bboxes of the passed size overlapping the passed extent
+
+
+def random_bboxes(rng, west, south, east, north, size_x, size_y):
+    bboxes = list()
+    for _ in range(queries):
+        x = rng.uniform(west - size_x, east)
+        y = rng.uniform(south - size_y, north)
+        bboxes.append((float(x), float(y), float(x + size_x), float(y + size_y)))
+    return bboxes
+
+
+# the median time of a query function over the bboxes, and the nr. of hits of each query
+
+
+def time_queries(query, bboxes):
+    timings = list()
+    hits = list()
+    for bbox in bboxes:
+        start = time.perf_counter()
+        names = query(*bbox)
+        timings.append(time.perf_counter() - start)
+        hits.append(sorted(names))
+    return float(np.median(timings)), hits
+
+
+# a synthetic catalog with a tile in each super cell of a square supergrid (with random tile sizes)
+
+
+def synthetic_tiles(rng, nr_tiles):
+    side = int(np.ceil(np.sqrt(nr_tiles)))
+    dtype = vr_tiles.tile_catalog_dtype(np.dtype([
+        ("index", "<u4"), ("dimensions_x", "<u4"), ("dimensions_y", "<u4"), ("resolution_x", "<f4"),
+        ("resolution_y", "<f4"), ("sw_corner_x", "<f4"), ("sw_corner_y", "<f4")]))
+    tiles = np.zeros(nr_tiles, dtype=dtype)
+    tiles["row"] = np.arange(nr_tiles) // side
+    tiles["col"] = np.arange(nr_tiles) % side
+    tiles["dimensions_x"] = rng.integers(2, 64, nr_tiles)
+    tiles["dimensions_y"] = rng.integers(2, 64, nr_tiles)
+    tiles["resolution_x"] = 64.0 / tiles["dimensions_x"]
+    tiles["resolution_y"] = 64.0 / tiles["dimensions_y"]
+    return tiles
+
+
+results = {"files": list(), "synthetic": list()}
+rng = np.random.default_rng(seed)
+
+# the converted layouts: full scan of the tile positions versus spatial index
+
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+    bag_name = os.path.basename(bag_path)
+    paths = dict()
+    writers = list()
+    for layout in layouts:
+        paths[layout] = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout +
+                                     os.path.splitext(bag_name)[1])
+        if os.path.exists(paths[layout]):
+            os.remove(paths[layout])
+        writers.append(layout_writers.layouts[layout](h5py.File(paths[layout], 'w')))
+    with h5py.File(bag_path, 'r') as fid:
+        layout_writers.convert(fid, writers)
+    for writer in writers:
+        writer.fod.close()
+
+    bboxes = None
+    for layout in layouts:
+        with h5py.File(paths[layout], 'r') as fod:
+            reader = layout_readers.layouts[layout](fod)
+            nr_tiles = len(reader.tile_names())
+            if bboxes is None:
+                entries = vr_index.read_spatial_index(reader.group["spatial_index"]).entries
+                west, south = entries["west"].min(), entries["south"].min()
+                east, north = entries["east"].max(), entries["north"].max()
+                bboxes = random_bboxes(rng, west, south, east, north,
+                                       (east - west) * bbox_fraction, (north - south) * bbox_fraction)
+
+            scan_time, scan_hits = time_queries(reader.scan_bbox, bboxes)
+            start = time.perf_counter()
+            reader.query_bbox(*bboxes[0])
+            index_load_time = time.perf_counter() - start
+            index_time, index_hits = time_queries(reader.query_bbox, bboxes)
+
+        # the tile positions of some layouts are stored as float32, so the hits may differ on the tile borders
+        mismatches = sum(1 for scan, index in zip(scan_hits, index_hits) if scan != index)
+        result = {
+            "input": bag_path,
+            "layout": layout,
+            "tiles": nr_tiles,
+            "queries": len(bboxes),
+            "mean_hits": float(np.mean([len(hits) for hits in index_hits])),
+            "scan_time": scan_time,
+            "index_load_time": index_load_time,
+            "index_time": index_time,
+            "speed_up": scan_time / index_time if index_time > 0 else None,
+            "mismatches": mismatches,
+        }
+        results["files"].append(result)
+        logger.info("- %s: scan %.3f ms, index %.3f ms (load: %.3f ms) -> %.0fx, %.1f hits/query, %d mismatches"
+                    % (layout, scan_time * 1e3, index_time * 1e3, index_load_time * 1e3, result["speed_up"] or 0,
+                       result["mean_hits"], mismatches))
+
+# the synthetic catalogs: linear scan of the tile extents versus spatial index (both in memory)
+
+for nr_tiles in synthetic_sizes:
+    tiles = synthetic_tiles(rng, nr_tiles)
+    extents = vr_index.tile_extents(tiles, west=0.0, south=0.0, res_x=64.0, res_y=64.0)
+
+    start = time.perf_counter()
+    entries, nodes, level_offsets = vr_index.build_packed_rtree(extents)
+    build_time = time.perf_counter() - start
+
+    index = vr_index.SpatialIndex(entries, nodes, level_offsets)
+
+    def scan(west, south, east, north):
+        hits = (extents["east"] >= west) & (extents["west"] <= east) & \
+               (extents["north"] >= south) & (extents["south"] <= north)
+        return ["%d_%d" % (entry["row"], entry["col"]) for entry in extents[hits]]
+
+    side = 64.0 * np.ceil(np.sqrt(nr_tiles))
+    bboxes = random_bboxes(rng, 0.0, 0.0, side, side, 64.0 * synthetic_bbox_cells, 64.0 * synthetic_bbox_cells)
+    scan_time, scan_hits = time_queries(scan, bboxes)
+    index_time, index_hits = time_queries(index.query_names, bboxes)
+    if scan_hits != index_hits:
+        raise RuntimeError("spatial index and scan disagree on %d synthetic tiles" % nr_tiles)
+
+    result = {
+        "tiles": nr_tiles,
+        "levels": len(index.levels),
+        "build_time": build_time,
+        "mean_hits": float(np.mean([len(hits) for hits in index_hits])),
+        "scan_time": scan_time,
+        "index_time": index_time,
+        "speed_up": scan_time / index_time if index_time > 0 else None,
+    }
+    results["synthetic"].append(result)
+    logger.info("- synthetic %d tiles: build %.3f s, scan %.3f ms, index %.3f ms -> %.0fx, %.1f hits/query"
+                % (nr_tiles, build_time, scan_time * 1e3, index_time * 1e3, result["speed_up"] or 0,
+                   result["mean_hits"]))
+
+with open(json_path, "w") as fod:
+    json.dump(results, fod, indent=2)
+logger.info("results written to: %s" % json_path)
@@ -0,0 +1,201 @@
+import logging
+import os
+import time
+
+import h5py
+import numpy as np
+
+import layout_writers
+import vr_tiles
+import vr_tracking
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# setup benchmark parameters
+
+legacy_max_nodes = 100000  # the per-node copy is slow: only the tiles within this budget are timed
+tracking_entries = 200000  # the nr. of synthetic entries of the VR tracking list (the test BAGs have none)
+
+
+# scan the supergrid one super cell at a time (the approach originally used by the converters)
+
+
+def scan_metadata_per_cell(meta):
+    valid_tiles = dict()
+    for r in range(meta.shape[0]):
+        for c in range(meta.shape[1]):
+            if meta[r][c][-1] != -1:
+                valid_tiles[(r, c)] = meta[r][c]
+    return valid_tiles
+
+
+# copy the tiles one node at a time (the approach originally used by the converters)
+
+
+def copy_tiles_per_node(fod, refs, valid_tiles):
+    nodes = 0
+    for tile in valid_tiles:
+        dims_x, dims_y = tile["dimensions_x"], tile["dimensions_y"]
+        if nodes + dims_x * dims_y > legacy_max_nodes:
+            break
+        to = tile["index"]
+        tile_elevation = "per_node/%d_%d/elevation" % (tile["row"], tile["col"])
+        tile_uncertainty = "per_node/%d_%d/uncertainty" % (tile["row"], tile["col"])
+        fod.create_dataset(tile_elevation, (dims_y, dims_x), dtype="float32")
+        fod.create_dataset(tile_uncertainty, (dims_y, dims_x), dtype="float32")
+        for tr in range(dims_y):
+            for tc in range(dims_x):
+                fod[tile_elevation][tr, tc] = refs[to + tr * dims_x + tc][0]
+                fod[tile_uncertainty][tr, tc] = refs[to + tr * dims_x + tc][1]
+        nodes += dims_x * dims_y
+    return nodes
+
+
+# copy the tiles with a single bulk write per tile dataset
+
+
+def copy_tiles_vectorized(fod, refs, valid_tiles):
+    nodes = 0
+    for tile in valid_tiles:
+        elevation, uncertainty = vr_tiles.tile_arrays(refs, tile)
+        fod.create_dataset("vectorized/%d_%d/elevation" % (tile["row"], tile["col"]), data=elevation, dtype="float32")
+        fod.create_dataset("vectorized/%d_%d/uncertainty" % (tile["row"], tile["col"]), data=uncertainty,
+                           dtype="float32")
+        nodes += elevation.size
+    return nodes
+
+
+# a synthetic VR tracking list with entries randomly spread over the nodes of the tiles
+
+
+def synthetic_tracking_list(valid_tiles, nr_entries, dtype):
+    rng = np.random.default_rng(0)
+    owners = valid_tiles[rng.integers(0, len(valid_tiles), nr_entries)]
+    entries = np.zeros(nr_entries, dtype=dtype)
+    entries["row"] = owners["row"]
+    entries["col"] = owners["col"]
+    entries["sub_row"] = rng.integers(0, owners["dimensions_y"])
+    entries["sub_col"] = rng.integers(0, owners["dimensions_x"])
+    entries["depth"] = rng.normal(size=nr_entries)
+    entries["uncertainty"] = 1.0
+    entries["list_series"] = np.arange(nr_entries) % 65536
+    return entries
+
+
+# partition the tracking list by scanning the whole list for each tile
+
+
+def partition_tracking_per_tile(entries, valid_tiles):
+    partitions = list()
+    for tile in valid_tiles:
+        partitions.append(entries[(entries["row"] == tile["row"]) & (entries["col"] == tile["col"])])
+    return partitions
+
+
+# partition the tracking list by sorting it once by super cell (and slicing it for each tile)
+
+
+def partition_tracking_sorted(entries, valid_tiles, supergrid_shape):
+    tracking = vr_tracking.TrackingList(entries, supergrid_shape)
+    return [tracking.tile_entries(tile) for tile in valid_tiles]
+
+
+# write the tracking list of each tile with a single bulk write
+
+
+def write_tracking_lists(fod, partitions, valid_tiles):
+    for tile, tile_tracking in zip(valid_tiles, partitions):
+        fod.create_dataset("tracking/%d_%d" % (tile["row"], tile["col"]),
+                           data=vr_tracking.tile_tracking_list(tile_tracking, layout_writers.tracking_list_dtype))
+    return sum(len(tile_tracking) for tile_tracking in partitions)
+
+
+for bag_path in bag_paths:
+    logger.info("input BAG file: %s" % bag_path)
+
+    with h5py.File(bag_path, 'r') as fid:
+        meta = fid["BAG_root/varres_metadata"]
+        supercells = meta.shape[0] * meta.shape[1]
+
+        start = time.perf_counter()
+        scan_metadata_per_cell(meta)
+        per_cell_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        valid_tiles = vr_tiles.load_tile_catalog(meta)
+        catalog_time = time.perf_counter() - start
+
+        refs = fid["BAG_root/varres_refinements"][0]
+        supergrid_shape = meta.shape
+        trk_dtype = fid["BAG_root/varres_tracking_list"].dtype
+
+    logger.info("- per-cell metadata scan: %d super cells in %.3f s" % (supercells, per_cell_time))
+    logger.info("- catalog metadata scan: %d super cells in %.3f s -> %d valid tiles"
+                % (supercells, catalog_time, len(valid_tiles)))
+
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_bench_tile_copy.h5")
+    with h5py.File(out_path, 'w') as fod:
+        start = time.perf_counter()
+        per_node_nodes = copy_tiles_per_node(fod, refs, valid_tiles)
+        per_node_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorized_nodes = copy_tiles_vectorized(fod, refs, valid_tiles)
+        vectorized_time = time.perf_counter() - start
+
+        entries = synthetic_tracking_list(valid_tiles, tracking_entries, trk_dtype)
+        start = time.perf_counter()
+        per_tile_partitions = partition_tracking_per_tile(entries, valid_tiles)
+        per_tile_tracking_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sorted_partitions = partition_tracking_sorted(entries, valid_tiles, supergrid_shape)
+        sorted_tracking_time = time.perf_counter() - start
+        for per_tile, by_sort in zip(per_tile_partitions, sorted_partitions):
+            if not np.array_equal(per_tile, by_sort):
+                raise RuntimeError("the partitions of the tracking list differ")
+
+        start = time.perf_counter()
+        written_entries = write_tracking_lists(fod, sorted_partitions, valid_tiles)
+        tracking_write_time = time.perf_counter() - start
+    os.remove(out_path)
+
+    per_node_rate = per_node_nodes / per_node_time if per_node_time > 0 else float("nan")
+    vectorized_rate = vectorized_nodes / vectorized_time if vectorized_time > 0 else float("nan")
+    logger.info("- per-node copy: %d nodes in %.3f s -> %.0f nodes/s" % (per_node_nodes, per_node_time, per_node_rate))
+    logger.info("- vectorized copy: %d nodes in %.3f s -> %.0f nodes/s"
+                % (vectorized_nodes, vectorized_time, vectorized_rate))
+    logger.info("- speed-up: %.1fx" % (vectorized_rate / per_node_rate))
+    logger.info("- per-tile tracking list partition: %d entries in %.3f s -> %.0f entries/s"
+                % (tracking_entries, per_tile_tracking_time, tracking_entries / per_tile_tracking_time))
+    logger.info("- sorted tracking list partition: %d entries in %.3f s -> %.0f entries/s"
+                % (tracking_entries, sorted_tracking_time, tracking_entries / sorted_tracking_time))
+    logger.info("- tracking list bulk writes: %d entries in %.3f s -> %.0f entries/s"
+                % (written_entries, tracking_write_time, written_entries / tracking_write_time))
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import layout_writers
+import vr_bench
+import vr_params
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+
+# setup benchmark parameters
+bag_paths = vr_params.parameter("bag_paths", sorted(bag_paths)) # Select the input BAG files to benchmark.
+layouts = vr_params.parameter("layouts", list(layout_writers.layouts)) # Select the layouts to benchmark.
+ziptype = vr_params.parameter("ziptype", None) # To benchmark compressed layouts, set this to "gzip", "lzf" or a vr_codecs codec.
+empty_tile_fractions = vr_params.parameter("empty_tile_fractions", [0.0, 0.5]) # The fractions of tiles blanked to nodata in a copy of each input (to simulate flat or sparsely surveyed areas).
+repeats = vr_params.parameter("repeats", 3) # The nr. of repetitions of the write timings.
+seed = vr_params.parameter("seed", 0) # The seed of the blanked tiles.
+keep_outputs = vr_params.parameter("keep_outputs", False) # To inspect the benchmarked files, set this to True.
+json_path = vr_params.parameter("json_path") or os.path.join(test_output_folder, "benchmark_tile_dedup.json")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+
+# convert the input to a layout (with or without dedup), return the median write time and the last writer
+
+
+def write_layout(fid, out_path, layout, dedup):
+    timings = list()
+    for _ in range(repeats):
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        start = time.perf_counter()
+        with h5py.File(out_path, 'w') as fod:
+            writer = layout_writers.layouts[layout](fod, ziptype=ziptype, dedup=dedup)
+            layout_writers.convert(fid, [writer])
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), writer
+
+
+# whether all the tiles of a layout match the reference tiles
+
+
+def matching_tiles(out_path, layout, reference):
+    with h5py.File(out_path, 'r') as fod:
+        reader = layout_readers.layouts[layout](fod)
+        if sorted(reader.tile_names()) != sorted(reference):
+            return False
+        for name in reference:
+            for values, expected in zip(reader.read_tile(name), reference[name]):
+                if not np.array_equal(values, expected):
+                    return False
+    return True
+
+
+# the converters log each tile: only the benchmark results are of interest here
+logging.getLogger("layout_writers").setLevel(logging.WARNING)
+logging.getLogger("vr_stream").setLevel(logging.WARNING)
+
+results = list()
+for source_path in bag_paths:
+    for fraction in empty_tile_fractions:
+        bag_path = vr_bench.blanked_copy(source_path, fraction, test_output_folder, seed) if fraction > 0 else source_path
+        logger.info("input BAG file: %s (%.0f%% blanked tiles)" % (bag_path, fraction * 100))
+        bag_name = os.path.basename(bag_path)
+
+        with h5py.File(bag_path, 'r') as fid:
+            tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+            refs = fid["BAG_root/varres_refinements"][0]
+            reference = dict()
+            for tile in tiles:
+                reference["%d_%d" % (tile["row"], tile["col"])] = vr_tiles.tile_arrays(refs, tile)
+
+            for layout in layouts:
+                result = {"input": bag_path, "source": source_path, "empty_tile_fraction": fraction,
+                          "layout": layout, "ziptype": ziptype, "tiles": len(tiles)}
+                for mode, dedup in [("plain", False), ("dedup", True)]:
+                    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + layout +
+                                            "_bench_" + mode + os.path.splitext(bag_name)[1])
+                    result[mode + "_write_time"], writer = write_layout(fid, out_path, layout, dedup)
+                    result[mode + "_file_size"] = os.path.getsize(out_path)
+                    result[mode + "_matching"] = matching_tiles(out_path, layout, reference)
+                    if not keep_outputs:
+                        os.remove(out_path)
+
+                datasets = writer.dedup_datasets + len(writer.payloads)
+                result["tile_datasets"] = datasets
+                result["dedup_datasets"] = writer.dedup_datasets
+                result["dedup_ratio"] = datasets / len(writer.payloads) if len(writer.payloads) > 0 else None
+                result["dedup_bytes"] = writer.dedup_bytes
+                result["hash_time"] = writer.hash_time
+                result["hash_time_share"] = writer.hash_time / result["dedup_write_time"] \
+                    if result["dedup_write_time"] > 0 else None
+                result["size_ratio"] = result["dedup_file_size"] / result["plain_file_size"]
+                result["write_time_ratio"] = result["dedup_write_time"] / result["plain_write_time"] \
+                    if result["plain_write_time"] > 0 else None
+                results.append(result)
+                if not (result["plain_matching"] and result["dedup_matching"]):
+                    logger.warning("- %s: the read tiles do not match the input refinements" % layout)
+                logger.info("- %s: %d/%d tile datasets deduplicated (ratio %.2f, %d bytes), size x%.2f, "
+                            "write time x%.2f (hashing: %.2f ms, %.1f%%)"
+                            % (layout, result["dedup_datasets"], datasets, result["dedup_ratio"] or 0,
+                               result["dedup_bytes"], result["size_ratio"], result["write_time_ratio"] or 0,
+                               result["hash_time"] * 1e3, (result["hash_time_share"] or 0) * 100))
+
+        if fraction > 0 and not keep_outputs:
+            os.remove(bag_path)
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+        },
+        "parameters": {
+            "ziptype": ziptype,
+            "empty_tile_fractions": empty_tile_fractions,
+            "repeats": repeats,
+            "seed": seed,
+        },
+        "results": results,
+    }, fod, indent=2)
+logger.info("results written to: %s" % json_path)
@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+
+import vr_params
+import vr_tiles
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# the converter script for each output layout (the layout name is also used as output suffix)
+
+converters = {
+    "UNG": "ungrouped_arrays.py",
+    "GSC": "groups_by_super_cells.py",
+    "GSC_enhanced": "groups_by_super_cells_with_enhancements.py",
+    "BTR": "groups_by_super_cells_with_bag_tiles_in_root.py",
+    "CMP": "compound_tiles.py",
+    "SHP": "tiles_with_compound_shape.py",
+    "ATT": "groups_by_attribute_type.py",
+    "DUP": "groups_by_attribute_type_with_duplication.py",
+}
+
+# the converter parameters read by some of the layouts only (the other ones are read by all the converters)
+
+layout_parameters = {
+    "copyBaseBag": {"CMP", "SHP", "ATT", "DUP"},
+    "grid_block_rows": {"UNG", "ATT"},
+}
+
+
+# collect the BAG files from the passed list of files and folders
+
+
+def collect_bag_paths(inputs):
+    bag_paths = list()
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for f in sorted(files):
+                    if f.endswith(".bag"):
+                        bag_paths.append(os.path.join(root, f))
+        elif os.path.isfile(path):
+            bag_paths.append(path)
+        else:
+            raise RuntimeError("Unable to locate the input: %s" % path)
+    return bag_paths
+
+
+# count the tiles and the refinement nodes of an input BAG
+
+
+def count_nodes(bag_path):
+    with h5py.File(bag_path, 'r') as fid:
+        tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+    return len(tiles), int((tiles["dimensions_x"].astype("int64") * tiles["dimensions_y"]).sum())
+
+
+# the passed `name=value` parameters that the converter of a layout reads (the converters reject the other ones)
+
+
+def layout_arguments(parameters, layout):
+    return [arg for arg in parameters if layout in layout_parameters.get(arg.split("=", 1)[0], {layout})]
+
+
+# the path of a converted BAG, with the suffix of the converters: the layout, then the ziptype (when set)
+# - ziptype: the ziptype parameter of the converters (a dict of them by layout, with fan-out)
+
+
+def output_path(bag_path, layout, output_folder, ziptype=None):
+    if isinstance(ziptype, dict):
+        ziptype = ziptype.get(layout)
+    suffix = layout if ziptype is None else layout + "_" + ziptype
+    bag_name = os.path.basename(bag_path)
+    return os.path.join(output_folder, os.path.splitext(bag_name)[0] + "_" + suffix + os.path.splitext(bag_name)[1])
+
+
+# run a converter script on an input BAG (as a separate process, logging to a file beside the output)
+# - with fan_out, all the passed layouts are written by a single process that reads the input once
+# - a conversion that cannot be run or an input that cannot be read is reported as failed (with the error)
+
+
+def convert(bag_path, layouts, output_folder, parameters, fan_out=False):
+    bag_name = os.path.basename(bag_path)
+    ziptype = vr_params.parse(parameters).get("ziptype")
+    if fan_out:
+        out_paths = [output_path(bag_path, layout, output_folder, ziptype) for layout in layouts]
+        log_path = os.path.join(output_folder, os.path.splitext(bag_name)[0] + "_fan_out.log")
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "multiple_layouts.py")
+        args = [sys.executable, script] + vr_params.arguments(bag_path=bag_path, output_folder=output_folder,
+                                                              layouts=list(layouts)) + parameters
+    else:
+        out_paths = [output_path(bag_path, layouts[0], output_folder, ziptype)]
+        log_path = os.path.splitext(out_paths[0])[0] + ".log"
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), converters[layouts[0]])
+        args = [sys.executable, script] + vr_params.arguments(bag_path=bag_path, out_path=out_paths[0]) \
+            + layout_arguments(parameters, layouts[0])
+
+    start = time.perf_counter()
+    ret = None
+    nr_tiles, nr_nodes = None, None
+    error = None
+    try:
+        with open(log_path, "w") as log_file:
+            ret = subprocess.run(args, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        nr_tiles, nr_nodes = count_nodes(bag_path)
+    except Exception as e:
+        logger.warning("unable to convert %s [%s]: %s" % (bag_path, ",".join(layouts), e))
+        error = "%s: %s" % (type(e).__name__, e)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "input": bag_path,
+        "layout": ",".join(layouts),
+        "output": out_paths[0] if len(out_paths) == 1 else out_paths,
+        "log": log_path,
+        "success": ret == 0 and error is None,
+        "error": error,
+        "wall_time": wall_time,
+        "tiles": nr_tiles,
+        "nodes": nr_nodes,
+        "output_size": sum(os.path.getsize(out_path) for out_path in out_paths if os.path.exists(out_path)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert BAG files to the experimental tile layouts")
+    parser.add_argument("inputs", nargs="+", help="input BAG files and/or folders (searched recursively)")
+    parser.add_argument("-l", "--layouts", nargs="+", choices=sorted(converters), default=["GSC"],
+                        help="output layouts (default: GSC)")
+    parser.add_argument("-o", "--output-folder", default=os.path.join(os.path.dirname(__file__), "test", "output"),
+                        help="output folder (default: test/output)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="nr. of conversions running concurrently (default: nr. of cores)")
+    parser.add_argument("-p", "--parameter", action="append", default=list(), metavar="NAME=VALUE",
+                        help="converter parameter (e.g., ziptype=gzip), can be repeated")
+    parser.add_argument("-f", "--fan-out", action="store_true",
+                        help="write all the layouts of an input in a single pass (reading the input once)")
+    parser.add_argument("-s", "--summary", help="path of a JSON file to write the summary to")
+    args = parser.parse_args()
+
+    for name in sorted(set(vr_params.parse(args.parameter)) & set(layout_parameters)):
+        if len(layout_parameters[name] & set(args.layouts)) == 0:
+            logger.warning("parameter %s is not read by the selected layouts (only by: %s)"
+                           % (name, ", ".join(sorted(layout_parameters[name]))))
+
+    bag_paths = collect_bag_paths(args.inputs)
+    logger.info("nr. of input BAG files: %d" % len(bag_paths))
+    if not os.path.exists(args.output_folder):
+        os.makedirs(args.output_folder)
+
+    # each job runs in its own process: the threads only wait for them
+    if args.fan_out:
+        jobs = [(bag_path, args.layouts) for bag_path in bag_paths]
+    else:
+        jobs = [(bag_path, [layout]) for bag_path in bag_paths for layout in args.layouts]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+        futures = [executor.submit(convert, bag_path, layouts, args.output_folder, args.parameter, args.fan_out)
+                   for bag_path, layouts in jobs]
+        results = list()
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            logger.info("%s %s [%s]: %.3f s, %s tiles, %s nodes, %d bytes"
+                        % ("converted" if result["success"] else "FAILED", result["input"], result["layout"],
+                           result["wall_time"], result["tiles"], result["nodes"], result["output_size"]))
+    total_time = time.perf_counter() - start
+
+    nr_failed = len([result for result in results if not result["success"]])
+    logger.info("summary: %d conversions (%d failed) in %.3f s, %d nodes, %d output bytes"
+                % (len(results), nr_failed, total_time, sum(result["nodes"] or 0 for result in results),
+                   sum(result["output_size"] for result in results)))
+    for result in results:
+        if not result["success"]:
+            logger.warning("- failed: %s [%s] -> %s" % (result["input"], result["layout"],
+                                                          result["error"] or "see %s" % result["log"]))
+
+    if args.summary:
+        with open(args.summary, "w") as fod:
+            json.dump({"total_time": total_time, "conversions": results}, fod, indent=2)
+        logger.info("summary written to: %s" % args.summary)
+
+    return 1 if nr_failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
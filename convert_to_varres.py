@@ -0,0 +1,72 @@
+import logging
+import os
+
+import h5py
+
+import layout_readers
+import vr_codecs
+import vr_params
+import vr_rebuild
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/output folder (for inputs and outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    raise RuntimeError("Unable to locate the test output folder: %s" % test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of converted BAG files in the test/output folder (any layout)
+
+bag_paths = list()
+for root, _, files in os.walk(test_output_folder):
+    for f in files:
+        name = os.path.splitext(f)[0]
+        if f.endswith(".bag") and any(name.endswith("_" + layout) for layout in layout_readers.layouts):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available converted BAG files: %d" % len(bag_paths))
+
+# select an input from the list of converted BAG files
+
+bag_path = vr_params.parameter("bag_path") or (sorted(bag_paths) or [None])[0]
+if bag_path is None:
+    raise RuntimeError("No converted BAG file to rebuild: run one of the layout converters first")
+if not h5py.is_hdf5(bag_path):
+    raise RuntimeError("The passed BAG file is not recognized as a valid HDF5 format")
+logger.info("input BAG file: %s" % bag_path)
+
+# setup rebuild parameters
+layout = vr_params.parameter("layout", None) # The layout of the input BAG (None: detected from the file structure).
+block_nodes = vr_params.parameter("block_nodes", vr_rebuild.default_block_nodes) # The nr. of refinements written at once.
+ziptype = vr_params.parameter("ziptype", None) # To test with compression, set this to "gzip", "lzf" or a vr_codecs codec.
+
+vr_codecs.require(ziptype)  # the missing filter plugins are reported before any conversion
+
+# open the input BAG in reading mode
+
+fid = h5py.File(bag_path, 'r')
+logger.info("input BAG: open")
+
+# open the output BAG in writing mode
+
+bag_name = os.path.basename(bag_path)
+out_path = vr_params.parameter("out_path") or os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_varres" + os.path.splitext(bag_name)[1])
+vr_params.check()  # the unknown command-line parameters are reported before any output
+logger.info("output BAG file: %s" % out_path)
+if os.path.exists(out_path):
+    os.remove(out_path)
+fod = h5py.File(out_path, 'w')
+logger.info("output BAG: open")
+
+# rebuild the VR content of the input BAG in the output BAG
+
+statistics = vr_rebuild.rebuild(fid, fod, layout=layout, block_nodes=block_nodes,
+                                **vr_codecs.creation_options(ziptype))
+logger.info("rebuilt %d tiles from the %s layout: %d refinements in %d writes, %d tracking entries, in %.3f s "
+            "(%.0f nodes/s)" % (statistics["tiles"], statistics["layout"], statistics["nodes"], statistics["writes"],
+                                statistics["tracking_entries"], statistics["time"], statistics["nodes_per_s"] or 0))
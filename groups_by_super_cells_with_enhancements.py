@@ -3,6 +3,9 @@ import os
 
 import h5py
 
+import layout_writers
+import vr_params
+
 # setup logging
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
@@ -33,11 +36,21 @@ logger.info("nr. of available BAG files: %d" % len(bag_paths))
 
 # select an input from the list of BAG files
 
-bag_path = bag_paths[0]  # change this index to select another bag file
+bag_path = vr_params.parameter("bag_path") or bag_paths[0]
 if not h5py.is_hdf5(bag_path):
     raise RuntimeError("The passed BAG file is not recognized as a valid HDF5 format")
 logger.info("input BAG file: %s" % bag_path)
 
+# setup conversion parameters
+writer_options = vr_params.writer_options() # The options of the tile datasets (e.g., dedup=True): see layout_writers.LayoutWriter.
+ziptype = writer_options["ziptype"] # To test with compression, pass ziptype as "gzip", "lzf" or a vr_codecs codec.
+test_suffix = "GSC_enhanced"
+if ziptype != None:
+    test_suffix += "_" + ziptype
+refs_window_nodes = vr_params.parameter("refs_window_nodes", None) # To stream the refinements, set this to the nr. of nodes to read per window.
+refs_max_memory = vr_params.parameter("refs_max_memory", None) # To bound the memory used by the refinements window, set this to a nr. of bytes.
+conversion_workers = vr_params.parameter("conversion_workers", None) # To read the tiles in parallel, set this to the nr. of processes (0: one per core).
+
 # open the input BAG in reading mode (and check the presence of the BAG_root group)
 
 fid = h5py.File(bag_path, 'r')
@@ -50,125 +63,16 @@ logger.info("input BAG: open")
 # open the output BAG in writing mode
 
 bag_name = os.path.basename(bag_path)
-out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_GSC_enhanced" + os.path.splitext(bag_name)[1])
+out_path = vr_params.parameter("out_path") or os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + test_suffix + os.path.splitext(bag_name)[1])
+vr_params.check()  # the unknown command-line parameters are reported before any output
 logger.info("output BAG file: %s" % out_path)
 if os.path.exists(out_path):
     os.remove(out_path)
 fod = h5py.File(out_path, 'w')
 logger.info("output BAG: open")
 
+# convert the VR content of the input BAG to tiles in the output BAG
 
-# copy the elements in the input BAG that are not VR related
-
-
-def clone_content_without_varres_items(key):
-
-    # skip keys with 'varres' in the path
-    if "varres" in key:
-        logger.info("- %s: skip" % (key,))
-        return
-
-    # copy groups with attributes
-    if isinstance(fid[key], h5py.Group):
-        fod.create_group(key)
-        for ka, kv in fid[key].attrs.items():
-            fod[key].attrs[ka] = kv
-            logger.info("- %s: group attribute copy: %s -> %s" % (key, ka, kv))
-        logger.info("- %s: group copy" % (key,))
-        return
-
-    # copy datasets with attributes
-    if isinstance(fid[key], h5py.Dataset):
-        fod.create_dataset(key, data=fid[key])
-        for ka, kv in fid[key].attrs.items():
-            fod[key].attrs[ka] = kv
-            logger.info("- %s: dataset attribute copy: %s -> %s" % (key, ka, kv))
-        logger.info("- %s: dataset copy (%s)" % (key, fid[key].dtype))
-
-
-logger.info("cloning content (skipping varres* elements)")
-fid.visit(clone_content_without_varres_items)
-
-#  create the BAG_tiles sub-group to store the tiles for the corresponding super cells
-
-bag_tiles_group = "BAG_root/BAG_tiles"
-fod.create_group(bag_tiles_group)
-logger.info("output BAG: created %s" % bag_tiles_group)
-
-# convert the list of refinements in the input BAG to tiles in the output BAG
-
-valid_tiles = dict()
-
-
-def modify_varres_content(key):
-
-    # skip keys not containing 'varres'
-    if "varres" not in key:
-        logger.info("- %s: skip" % (key,))
-        return
-
-    # retrieve and store the metadata relative to the VR refinements
-    # + create a tile for each super cell with VR refinements
-    if "varres_metadata" in key:
-        meta = fid[key]
-        logger.info("- %s -> %s" % (key, meta.shape))
-        group_counter = 0
-        for r in range(meta.shape[0]):
-            for c in range(meta.shape[1]):
-                if meta[r][c][-1] != -1:
-                    logger.info("- valid tile (%s, %s): %s" % (r, c, meta[r][c]))
-                    valid_tiles[(r, c)] = meta[r][c]
-                    tile_group = bag_tiles_group + "/%d_%d" % (r, c)
-                    fod.create_group(tile_group)
-                    # fod[tile_group].attrs["dimensions_x"] = meta[r][c][1]  # redundant
-                    # fod[tile_group].attrs["dimensions_y"] = meta[r][c][2]  # redundant
-                    fod[tile_group].attrs["resolution_x"] = meta[r][c][3]
-                    fod[tile_group].attrs["resolution_y"] = meta[r][c][4]
-                    fod[tile_group].attrs["sw_corner_x"] = meta[r][c][5]
-                    fod[tile_group].attrs["sw_corner_y"] = meta[r][c][6]
-                    fod[tile_group].attrs["group_id"] = group_counter  # added group_id for clustering tiles
-                    group_counter += 1
-        return
-
-    # convert the refinements in the input BAG to tiles for each super cell
-    if "varres_refinements" in key:
-        refs = fid[key][0]
-        logger.info("- %s -> %s" % (key, refs.shape))
-
-        # retrieve tracking list to evaluate its number of elements
-        trk = fid["BAG_root/varres_tracking_list"]
-        logger.info("- %s -> %s" % (key, trk.shape))
-
-        for idx, meta in valid_tiles.items():
-            tile_group = bag_tiles_group + "/%d_%d" % idx
-            logger.info("- populating tile: %s -> [%s]" % (tile_group, meta))
-            to = meta[0]
-
-            tile_elevation = tile_group + "/elevation"
-            fod.create_dataset(tile_elevation, (meta[2], meta[1]), dtype="float32")
-            for tr in range(meta[2]):
-                for tc in range(meta[1]):
-                    fod[tile_elevation][tr, tc] = refs[to + tr * meta[2] + tc][0]
-
-            if trk.shape[0] != 0:
-                tile_tracking_list = tile_group + "/tracking_list"
-                fod.create_dataset(tile_tracking_list, (0, 0),
-                                   dtype={'names': ['row', 'col', 'depth', 'uncertainty', 'track_code', 'list_series'],
-                                          'formats': ['<u4', '<u4', '<f4', '<f4', 'u1', '<i2'],
-                                          'offsets': [0, 4, 8, 12, 16, 18], 'itemsize': 20})
-
-            tile_uncertainty = tile_group + "/uncertainty"
-            fod.create_dataset(tile_uncertainty, (meta[2], meta[1]), dtype="float32")
-            for tr in range(meta[2]):
-                for tc in range(meta[1]):
-                    fod[tile_uncertainty][tr, tc] = refs[to + tr * meta[2] + tc][1]
-
-    # take care of the values in the VR tracking list (currently, not implemented)
-    if "varres_tracking_list" in key:
-        trk = fid[key]
-        if trk.shape[0] != 0:
-            logger.warning("reading of varres_tracking_list NOT implemented")
-
-
-logger.info("modifying varres content")
-fid.visit(modify_varres_content)
+writer = layout_writers.GroupsBySuperCellsWithEnhancements(fod, **writer_options)
+layout_writers.convert(fid, [writer], workers=conversion_workers,
+                       window_nodes=refs_window_nodes, max_memory=refs_max_memory)
@@ -0,0 +1,121 @@
+import logging
+import os
+
+import h5py
+
+import layout_readers
+
+logger = logging.getLogger(__name__)
+
+# suffixes appended to the tile names by the layouts storing the tile datasets side by side (e.g., UNG)
+
+tile_name_suffixes = ["_elevation", "_uncertainty", "_tracking_list"]
+
+
+# the tile that an object belongs to (i.e., a path component is a tile name, with or without suffix), if any
+
+
+def tile_of_object(path):
+    for component in path.split("/"):
+        for suffix in tile_name_suffixes:
+            if component.endswith(suffix):
+                component = component[:-len(suffix)]
+                break
+        if layout_readers.is_tile_name(component):
+            return component
+    return None
+
+
+# the bytes of the attributes of an object: names and values (without the encodings of their types and shapes)
+
+
+def attribute_bytes(obj):
+    nr_bytes = 0
+    for name in obj.attrs:
+        attr = h5py.h5a.open(obj.id, name.encode())
+        nr_bytes += attr.get_storage_size() + len(name.encode()) + 1
+    return nr_bytes
+
+
+# the metadata and raw data bytes of a single object
+# - header: the object header (including the compact attributes and the link messages of compact groups)
+# - dense_attribute: the storage of the attributes moved out of the header (for objects with many attributes)
+# - index: the group B-tree (and local heap of the link names), or the chunk index of a chunked dataset
+
+
+def object_profile(path, obj):
+    info = h5py.h5o.get_info(obj.id)
+    profile = {
+        "path": path,
+        "type": "group" if isinstance(obj, h5py.Group) else "dataset",
+        "header_bytes": info.hdr.space.total,
+        "attributes": info.num_attrs,
+        "attribute_bytes": attribute_bytes(obj),
+        "dense_attribute_bytes": info.meta_size.attr.index_size + info.meta_size.attr.heap_size,
+        "index_bytes": info.meta_size.obj.index_size,
+        "heap_bytes": info.meta_size.obj.heap_size,
+        "raw_bytes": 0,
+        "chunks": 0,
+    }
+    if isinstance(obj, h5py.Dataset):
+        profile["raw_bytes"] = obj.id.get_storage_size()
+        if obj.chunks is not None:
+            profile["chunks"] = obj.id.get_num_chunks()
+    return profile
+
+
+# walk a file and sum the object profiles for the whole file and for the per-tile objects
+# return the totals and (with details) the list of the object profiles
+
+
+def profile_file(path, details=False):
+    profiles = list()
+    with h5py.File(path, 'r') as fod:
+        profiles.append(object_profile("/", fod))
+        fod.visititems(lambda name, obj: profiles.append(object_profile(name, obj)))
+        file_size = fod.id.get_filesize()
+        free_space = fod.id.get_freespace()
+
+    fields = ["header_bytes", "attribute_bytes", "dense_attribute_bytes", "index_bytes", "heap_bytes", "raw_bytes",
+              "chunks", "attributes"]
+    totals = {"groups": 0, "datasets": 0}
+    totals.update({field: 0 for field in fields})
+    tiles = {"groups": 0, "datasets": 0}
+    tiles.update({field: 0 for field in fields})
+    tile_names = set()
+    for profile in profiles:
+        summaries = [totals]
+        tile_name = tile_of_object(profile["path"])
+        if tile_name is not None:
+            summaries.append(tiles)
+            tile_names.add(tile_name)
+        for summary in summaries:
+            summary["groups" if profile["type"] == "group" else "datasets"] += 1
+            for field in fields:
+                summary[field] += profile[field]
+
+    # the attribute bytes are part of the header bytes (or of the dense attribute storage)
+    for summary in [totals, tiles]:
+        summary["objects"] = summary["groups"] + summary["datasets"]
+        summary["metadata_bytes"] = summary["header_bytes"] + summary["dense_attribute_bytes"] + \
+            summary["index_bytes"] + summary["heap_bytes"]
+        summary["overhead_ratio"] = summary["metadata_bytes"] / summary["raw_bytes"] if summary["raw_bytes"] > 0 \
+            else None
+
+    result = {
+        "path": path,
+        "file_size": file_size,
+        "free_space": free_space,
+        # the superblock, the free-space tracking and the unused space (e.g., from the allocation alignment)
+        "unaccounted_bytes": file_size - totals["metadata_bytes"] - totals["raw_bytes"],
+        "totals": totals,
+        "tiles": tiles,
+        "nr_tiles": len(tile_names),
+        "metadata_bytes_per_tile": tiles["metadata_bytes"] / len(tile_names) if len(tile_names) > 0 else None,
+        "objects_per_tile": tiles["objects"] / len(tile_names) if len(tile_names) > 0 else None,
+    }
+    if details:
+        result["objects"] = profiles
+    logger.info("%s: %d objects, %d metadata bytes, %d raw bytes (file: %d bytes)"
+                % (os.path.basename(path), totals["objects"], totals["metadata_bytes"], totals["raw_bytes"], file_size))
+    return result
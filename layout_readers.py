@@ -0,0 +1,609 @@
+import logging
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+
+import layout_writers
+import vr_index
+import vr_overview
+import vr_tiles
+
+logger = logging.getLogger(__name__)
+
+# structured type of the tile extents (the positions of the SW and NE nodes of each tile)
+
+tile_bounds_dtype = [("name", "U32"), ("west", "f8"), ("south", "f8"), ("east", "f8"), ("north", "f8")]
+
+
+# whether a name is a tile name (i.e., "<row>_<col>")
+
+
+def is_tile_name(name):
+    parts = name.split("_")
+    return len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit()
+
+
+# build the tile extents from the tile positions, resolutions and dimensions
+
+
+def tile_bounds_array(names, west, south, res_x, res_y, dims_x, dims_y):
+    bounds = np.empty(len(names), dtype=tile_bounds_dtype)
+    bounds["name"] = names
+    bounds["west"] = west
+    bounds["south"] = south
+    bounds["east"] = np.asarray(west, dtype=np.float64) + (np.asarray(dims_x) - 1) * np.asarray(res_x)
+    bounds["north"] = np.asarray(south, dtype=np.float64) + (np.asarray(dims_y) - 1) * np.asarray(res_y)
+    return bounds
+
+
+# build the tile catalog (see vr_tiles.load_tile_catalog, in row-major order and without the refinement indices)
+# from the tile names, dimensions, resolutions and SW corners (relative to the super cells)
+
+
+def tile_catalog_array(names, dims_x, dims_y, res_x, res_y, sw_corner_x, sw_corner_y):
+    catalog = np.zeros(len(names), dtype=vr_tiles.tile_catalog_dtype(vr_tiles.varres_metadata_dtype))
+    catalog["row"] = [int(name.split("_")[0]) for name in names]
+    catalog["col"] = [int(name.split("_")[1]) for name in names]
+    catalog["dimensions_x"] = dims_x
+    catalog["dimensions_y"] = dims_y
+    catalog["resolution_x"] = res_x
+    catalog["resolution_y"] = res_y
+    catalog["sw_corner_x"] = sw_corner_x
+    catalog["sw_corner_y"] = sw_corner_y
+    return catalog[np.lexsort((catalog["col"], catalog["row"]))]
+
+
+# base class of the layout readers: each reader wraps an output BAG written by the matching layout writer
+# - tile_names: enumerate the tiles
+# - has_tile: whether a tile is present
+# - read_tile: read the elevation and uncertainty grids of a tile
+# - tile_bounds: retrieve the extent of all the tiles (from the positions stored by the layout)
+# - query_bbox: retrieve the names of the tiles intersecting a bounding box (with the spatial index, when present)
+# - read_overview: read the level of the overview pyramid (see vr_overview) fitting a viewport
+# - tile_catalog: retrieve the tile catalog (from the tile positions stored by the layout)
+# - read_tracking_list: read the tracking list of a tile (None when the tile has none)
+# with memmap, the uncompressed contiguous tile datasets are served as read-only views on a memory map of the file
+# (without going through the HDF5 read pipeline), while the other datasets are read with h5py
+# the deduplicated tile datasets (see layout_writers.LayoutWriter) are read from the first copy of their payload
+
+
+class LayoutReader:
+    suffix = None
+    bag_tiles_group = "BAG_tiles"
+    exact_tile_positions = True  # whether the tile catalog recovers the SW corners of the input BAG
+
+    def __init__(self, fod, memmap=False):
+        self.fod = fod
+        self.group = fod[self.bag_tiles_group]
+        self.spatial_index = None
+        self.file_map = None
+        self.locations = dict()
+        self.memmap_reads = 0
+        self.h5py_reads = 0
+        if memmap:
+            if fod.driver != "sec2" or fod.mode != "r":
+                logger.warning("memory-mapped reads not available (driver: %s, mode: %s)" % (fod.driver, fod.mode))
+            else:
+                self.file_map = np.memmap(fod.filename, dtype=np.uint8, mode="r")
+
+    # the location (file offset, type and shape) of a dataset if its data can be mapped (i.e., contiguous in the file,
+    # allocated and without filters)
+
+    def dataset_location(self, dataset):
+        plist = dataset.id.get_create_plist()
+        if dataset.chunks is None and dataset.compression is None and dataset.size > 0 and \
+                plist.get_layout() == h5py.h5d.CONTIGUOUS and plist.get_external_count() == 0 and \
+                dataset.id.get_type().get_size() == dataset.dtype.itemsize and \
+                dataset.id.get_storage_size() == dataset.size * dataset.dtype.itemsize:
+            return dataset.id.get_offset(), dataset.dtype, dataset.shape
+        return None
+
+    # the dataset holding the payload of a tile dataset: the referenced first copy for an unallocated duplicate
+
+    def resolve_dataset(self, dataset):
+        if dataset.id.get_storage_size() == 0 and "duplicate_of" in dataset.attrs:
+            return self.fod[dataset.attrs["duplicate_of"]]
+        return dataset
+
+    # read a dataset (by path, relative to the tiles group), where the location of the dataset is resolved once
+
+    def read_dataset(self, path):
+        if self.file_map is not None:
+            if path not in self.locations:
+                self.locations[path] = self.dataset_location(self.resolve_dataset(self.group[path]))
+            location = self.locations[path]
+            if location is not None:
+                self.memmap_reads += 1
+                offset, dtype, shape = location
+                nr_bytes = int(np.prod(shape)) * dtype.itemsize
+                return self.file_map[offset:offset + nr_bytes].view(dtype).reshape(shape)
+        self.h5py_reads += 1
+        return self.resolve_dataset(self.group[path])[()]
+
+    def tile_names(self):
+        return [name for name in self.group if is_tile_name(name)]
+
+    def has_tile(self, name):
+        return name in self.group
+
+    def read_tile(self, name):
+        raise NotImplementedError
+
+    # the paths of the datasets holding the values of a tile (relative to the tiles group)
+
+    def tile_dataset_paths(self, name):
+        raise NotImplementedError
+
+    def tile_bounds(self):
+        raise NotImplementedError
+
+    def tile_catalog(self):
+        raise NotImplementedError
+
+    def tracking_list_path(self, name):
+        return name + "_tracking_list"
+
+    def read_tracking_list(self, name):
+        path = self.tracking_list_path(name)
+        if path not in self.group:
+            return None
+        return self.group[path][()].reshape(-1)
+
+    # the supergrid description (see layout_writers.read_bag_tiles_attributes) from the BAG_tiles root-group
+    # (or from the BAG XML metadata, for the layouts without it)
+
+    def supergrid(self):
+        if "BAG_tiles" in self.fod and "supergrid_west" in self.fod["BAG_tiles"].attrs:
+            return dict(self.fod["BAG_tiles"].attrs)
+        if "BAG_root/metadata" not in self.fod:
+            raise RuntimeError("unable to locate the supergrid: missing BAG_root/metadata")
+        attributes, complete = layout_writers.read_bag_tiles_attributes(self.fod)
+        if not complete:
+            raise RuntimeError("unable to locate the supergrid: incomplete BAG XML metadata")
+        return attributes
+
+    # the SW corners of the tiles relative to their super cells, from the absolute tile positions
+
+    def sw_corners(self, names, west, south):
+        supergrid = self.supergrid()
+        rows = np.array([int(name.split("_")[0]) for name in names], dtype=np.float64)
+        cols = np.array([int(name.split("_")[1]) for name in names], dtype=np.float64)
+        west = np.asarray(west, dtype=np.float64)
+        south = np.asarray(south, dtype=np.float64)
+        return (west - (supergrid["supergrid_west"] + cols * supergrid["supergrid_res_x"]),
+                south - (supergrid["supergrid_south"] + rows * supergrid["supergrid_res_y"]))
+
+    # the spatial index is read at the first query
+
+    def query_bbox(self, west, south, east, north):
+        if self.spatial_index is None and "spatial_index" in self.group:
+            self.spatial_index = vr_index.read_spatial_index(self.group["spatial_index"])
+        if self.spatial_index is None:
+            return self.scan_bbox(west, south, east, north)
+        return self.spatial_index.query_names(west, south, east, north)
+
+    # the finest overview level with at most max_rows x max_cols cells, and its position (west, south, res_x, res_y)
+
+    def read_overview(self, max_rows, max_cols):
+        if "overviews" not in self.group:
+            raise RuntimeError("unable to read the overviews: missing %s/overviews" % self.group.name)
+        dataset = vr_overview.select_level(self.group["overviews"], max_rows, max_cols)
+        return dataset[()], {name: dataset.attrs[name] for name in ["west", "south", "res_x", "res_y"]}
+
+    # the tile extents are retrieved at each scan: the timing includes the access to the layout positions
+
+    def scan_bbox(self, west, south, east, north):
+        bounds = self.tile_bounds()
+        hits = (bounds["east"] >= west) & (bounds["west"] <= east) & \
+               (bounds["north"] >= south) & (bounds["south"] <= north)
+        return list(bounds["name"][hits])
+
+    # tile extents from the west, south, res_x and res_y attributes of a per-tile object
+
+    def tile_bounds_from_attributes(self, objects):
+        names = list()
+        values = list()
+        for name, obj, shape in objects:
+            attrs = obj.attrs
+            names.append(name)
+            values.append((attrs["west"], attrs["south"], attrs["res_x"], attrs["res_y"], shape[1], shape[0]))
+        values = np.array(values, dtype=np.float64).reshape(-1, 6)
+        return tile_bounds_array(names, *values.T)
+
+    # tile catalog from the west, south, res_x and res_y attributes of a per-tile object
+
+    def tile_catalog_from_attributes(self, objects):
+        names = list()
+        values = list()
+        for name, obj, shape in objects:
+            attrs = obj.attrs
+            names.append(name)
+            values.append((attrs["west"], attrs["south"], attrs["res_x"], attrs["res_y"], shape[1], shape[0]))
+        west, south, res_x, res_y, dims_x, dims_y = np.array(values, dtype=np.float64).reshape(-1, 6).T
+        return tile_catalog_array(names, dims_x, dims_y, res_x, res_y, *self.sw_corners(names, west, south))
+
+    # tile extents from the res_x, res_y, west and south supergrid grids
+
+    def tile_bounds_from_grids(self, shapes):
+        names = self.tile_names()
+        res_x = self.group["res_x"][()]
+        res_y = self.group["res_y"][()]
+        west = self.group["west"][()]
+        south = self.group["south"][()]
+        rows = np.array([int(name.split("_")[0]) for name in names], dtype=np.intp)
+        cols = np.array([int(name.split("_")[1]) for name in names], dtype=np.intp)
+        dims = np.array([shapes(name) for name in names], dtype=np.int64).reshape(-1, 2)
+        return tile_bounds_array(names, west[rows, cols], south[rows, cols], res_x[rows, cols], res_y[rows, cols],
+                                 dims[:, 1], dims[:, 0])
+
+    # tile catalog from the res_x, res_y, west and south supergrid grids
+    # (the grids store the tile positions as float32, so the SW corners are approximated)
+
+    def tile_catalog_from_grids(self, shapes):
+        names = self.tile_names()
+        rows = np.array([int(name.split("_")[0]) for name in names], dtype=np.intp)
+        cols = np.array([int(name.split("_")[1]) for name in names], dtype=np.intp)
+        dims = np.array([shapes(name) for name in names], dtype=np.int64).reshape(-1, 2)
+        west = self.group["west"][()][rows, cols]
+        south = self.group["south"][()][rows, cols]
+        return tile_catalog_array(names, dims[:, 1], dims[:, 0], self.group["res_x"][()][rows, cols],
+                                  self.group["res_y"][()][rows, cols], *self.sw_corners(names, west, south))
+
+
+# GSC: a group for each super cell with the tile position relative to its super cell
+# (the supergrid position is retrieved from the copy of the BAG XML metadata)
+
+
+class GroupsBySuperCells(LayoutReader):
+    suffix = "GSC"
+    bag_tiles_group = "BAG_root/BAG_tiles"
+
+    def read_tile(self, name):
+        return self.read_dataset(name + "/elevation"), self.read_dataset(name + "/uncertainty")
+
+    def tile_dataset_paths(self, name):
+        return [name + "/elevation", name + "/uncertainty"]
+
+    def tile_dimensions(self, tile_group):
+        return tile_group.attrs["dimensions_x"], tile_group.attrs["dimensions_y"]
+
+    def tile_bounds(self):
+        attributes = self.supergrid()
+        names = self.tile_names()
+        values = list()
+        for name in names:
+            tile_group = self.group[name]
+            attrs = tile_group.attrs
+            row, col = [int(token) for token in name.split("_")]
+            dims_x, dims_y = self.tile_dimensions(tile_group)
+            values.append((attributes["supergrid_west"] + col * attributes["supergrid_res_x"] + attrs["sw_corner_x"],
+                           attributes["supergrid_south"] + row * attributes["supergrid_res_y"] + attrs["sw_corner_y"],
+                           attrs["resolution_x"], attrs["resolution_y"], dims_x, dims_y))
+        values = np.array(values, dtype=np.float64).reshape(-1, 6)
+        return tile_bounds_array(names, *values.T)
+
+    def tile_catalog(self):
+        names = self.tile_names()
+        values = list()
+        for name in names:
+            tile_group = self.group[name]
+            attrs = tile_group.attrs
+            dims_x, dims_y = self.tile_dimensions(tile_group)
+            values.append((dims_x, dims_y, attrs["resolution_x"], attrs["resolution_y"],
+                           attrs["sw_corner_x"], attrs["sw_corner_y"]))
+        return tile_catalog_array(names, *np.array(values, dtype=np.float64).reshape(-1, 6).T)
+
+    def tracking_list_path(self, name):
+        return name + "/tracking_list"
+
+
+# GSC_enhanced: as GSC, with the tile dimensions retrieved from the elevation dataset
+
+
+class GroupsBySuperCellsWithEnhancements(GroupsBySuperCells):
+    suffix = "GSC_enhanced"
+
+    def tile_dimensions(self, tile_group):
+        shape = tile_group["elevation"].shape
+        return shape[1], shape[0]
+
+
+# BTR: a group for each super cell (under the BAG_tiles root-group) with the tile position as attributes
+
+
+class GroupsBySuperCellsWithBagTilesInRoot(LayoutReader):
+    suffix = "BTR"
+
+    def read_tile(self, name):
+        return self.read_dataset(name + "/elevation"), self.read_dataset(name + "/uncertainty")
+
+    def tile_dataset_paths(self, name):
+        return [name + "/elevation", name + "/uncertainty"]
+
+    def tile_objects(self):
+        objects = list()
+        for name in self.tile_names():
+            tile_group = self.group[name]
+            objects.append((name, tile_group, tile_group["elevation"].shape))
+        return objects
+
+    def tile_bounds(self):
+        return self.tile_bounds_from_attributes(self.tile_objects())
+
+    def tile_catalog(self):
+        return self.tile_catalog_from_attributes(self.tile_objects())
+
+    def tracking_list_path(self, name):
+        return name + "/tracking_list"
+
+
+# UNG: the tile datasets directly in the BAG_tiles root-group, with the tile positions as supergrid grids
+
+
+class UngroupedArrays(LayoutReader):
+    suffix = "UNG"
+    exact_tile_positions = False
+
+    def tile_names(self):
+        return [name[:-len("_elevation")] for name in self.group if name.endswith("_elevation")]
+
+    def has_tile(self, name):
+        return name + "_elevation" in self.group
+
+    def read_tile(self, name):
+        return self.read_dataset(name + "_elevation"), self.read_dataset(name + "_uncertainty")
+
+    def tile_dataset_paths(self, name):
+        return [name + "_elevation", name + "_uncertainty"]
+
+    def tile_shape(self, name):
+        return self.group[name + "_elevation"].shape
+
+    def tile_bounds(self):
+        return self.tile_bounds_from_grids(self.tile_shape)
+
+    def tile_catalog(self):
+        return self.tile_catalog_from_grids(self.tile_shape)
+
+
+# CMP: a single compound dataset for each tile, with the tile position as attributes
+
+
+class CompoundTiles(LayoutReader):
+    suffix = "CMP"
+
+    def read_tile(self, name):
+        tile = self.read_dataset(name)
+        return tile["elevation"], tile["uncertainty"]
+
+    def tile_dataset_paths(self, name):
+        return [name]
+
+    def tile_objects(self):
+        objects = list()
+        for name in self.tile_names():
+            tile = self.group[name]
+            objects.append((name, tile, tile.shape))
+        return objects
+
+    def tile_bounds(self):
+        return self.tile_bounds_from_attributes(self.tile_objects())
+
+    def tile_catalog(self):
+        return self.tile_catalog_from_attributes(self.tile_objects())
+
+
+# SHP: a single dataset for each tile, with elevation and uncertainty stacked along a third dimension
+
+
+class TilesWithCompoundShape(CompoundTiles):
+    suffix = "SHP"
+
+    def read_tile(self, name):
+        tile = self.read_dataset(name)
+        return tile[..., 0], tile[..., 1]
+
+
+# ATT: a group for each attribute holding a dataset for each tile, with the tile positions as supergrid grids
+
+
+class GroupsByAttributeType(LayoutReader):
+    suffix = "ATT"
+    exact_tile_positions = False
+
+    def tile_names(self):
+        return list(self.group["elevation"])
+
+    def has_tile(self, name):
+        return name in self.group["elevation"]
+
+    def read_tile(self, name):
+        return self.read_dataset("elevation/" + name), self.read_dataset("uncertainty/" + name)
+
+    def tile_dataset_paths(self, name):
+        return ["elevation/" + name, "uncertainty/" + name]
+
+    def tile_shape(self, name):
+        return self.group["elevation"][name].shape
+
+    def tile_bounds(self):
+        return self.tile_bounds_from_grids(self.tile_shape)
+
+    def tile_catalog(self):
+        return self.tile_catalog_from_grids(self.tile_shape)
+
+    def tracking_list_path(self, name):
+        return "tracking_list/" + name
+
+
+# DUP: as ATT, with the tile positions as attributes of the elevation (and uncertainty) datasets
+
+
+class GroupsByAttributeTypeWithDuplication(GroupsByAttributeType):
+    suffix = "DUP"
+    exact_tile_positions = True
+
+    def tile_objects(self):
+        elevation = self.group["elevation"]
+        objects = list()
+        for name in self.tile_names():
+            tile = elevation[name]
+            objects.append((name, tile, tile.shape))
+        return objects
+
+    def tile_bounds(self):
+        return self.tile_bounds_from_attributes(self.tile_objects())
+
+    def tile_catalog(self):
+        return self.tile_catalog_from_attributes(self.tile_objects())
+
+
+# the layout readers by layout name
+
+layouts = {
+    "UNG": UngroupedArrays,
+    "GSC": GroupsBySuperCells,
+    "GSC_enhanced": GroupsBySuperCellsWithEnhancements,
+    "BTR": GroupsBySuperCellsWithBagTilesInRoot,
+    "CMP": CompoundTiles,
+    "SHP": TilesWithCompoundShape,
+    "ATT": GroupsByAttributeType,
+    "DUP": GroupsByAttributeTypeWithDuplication,
+}
+
+
+# detect the layout of an output BAG from its structure
+
+
+def detect_layout(fod):
+    if "BAG_root/BAG_tiles" in fod:
+        group = fod["BAG_root/BAG_tiles"]
+        for name in group:
+            if is_tile_name(name):
+                return "GSC" if "dimensions_x" in group[name].attrs else "GSC_enhanced"
+        return "GSC"
+
+    if "BAG_tiles" not in fod:
+        raise RuntimeError("unable to detect the layout: missing BAG_tiles group")
+    group = fod["BAG_tiles"]
+    if "elevation" in group:
+        return "ATT" if "res_x" in group else "DUP"
+    for name in group:
+        if name.endswith("_elevation"):
+            return "UNG"
+        if is_tile_name(name):
+            tile = group[name]
+            if isinstance(tile, h5py.Group):
+                return "BTR"
+            return "SHP" if tile.ndim == 3 else "CMP"
+    raise RuntimeError("unable to detect the layout: no tiles in BAG_tiles")
+
+
+# the nominal nr. of bytes charged to the tile cache for an array viewing the memory map of the file (its pages belong
+# to the OS page cache, not to the reader)
+memmap_view_bytes = 256
+
+
+# the nr. of bytes held by an array (nominal for a view on a memory map)
+
+
+def resident_bytes(array):
+    base = array
+    while base is not None:
+        if isinstance(base, np.memmap):
+            return memmap_view_bytes
+        base = getattr(base, "base", None)
+    return array.nbytes
+
+
+# read the tiles of an output BAG (of any layout) by (row, col), keeping the most recently used tiles in memory
+# - source: an open output BAG, or the path of one (then opened and owned by the reader)
+# - layout: the layout name (None: detected from the file structure)
+# - cache_bytes: the budget of the cache of (decompressed) tiles, where the least recently used tiles are evicted first
+#   (the views on the memory map are charged memmap_view_bytes)
+# - memmap: whether to serve the uncompressed contiguous tiles as views on a memory map of the file (see LayoutReader)
+# the cached arrays are returned as read-only (as they are shared by all the callers)
+
+
+class TileReader:
+
+    def __init__(self, source, layout=None, cache_bytes=64 * 1024 * 1024, memmap=False):
+        self.owns_file = not isinstance(source, h5py.File)
+        self.fod = h5py.File(source, 'r') if self.owns_file else source
+        self.layout = layout or detect_layout(self.fod)
+        self.reader = layouts[self.layout](self.fod, memmap=memmap)
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        logger.info("tile reader: %s [%s], cache: %d bytes" % (self.fod.filename, self.layout, cache_bytes))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.clear()
+        if self.owns_file:
+            self.fod.close()
+
+    def has_tile(self, row, col):
+        return (row, col) in self.cache or self.reader.has_tile("%d_%d" % (row, col))
+
+    # return the (elevation, uncertainty) arrays of the tile of the super cell at (row, col)
+
+    def tile(self, row, col):
+        key = (row, col)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        self.misses += 1
+        name = "%d_%d" % key
+        if not self.reader.has_tile(name):
+            raise RuntimeError("no tile at (%d, %d) in %s" % (row, col, self.fod.filename))
+        arrays = self.reader.read_tile(name)
+        for array in arrays:
+            array.setflags(write=False)
+        self.store(key, arrays)
+        return arrays
+
+    def store(self, key, arrays):
+        nr_bytes = sum(resident_bytes(array) for array in arrays)
+        if nr_bytes > self.cache_bytes:
+            return
+        self.cache[key] = arrays
+        self.cached_bytes += nr_bytes
+        while self.cached_bytes > self.cache_bytes:
+            _, evicted = self.cache.popitem(last=False)
+            self.cached_bytes -= sum(resident_bytes(array) for array in evicted)
+            self.evictions += 1
+
+    # yield the (row, col), elevation and uncertainty of the tiles intersecting a bbox
+
+    def query(self, west, south, east, north):
+        for name in self.reader.query_bbox(west, south, east, north):
+            row, col = [int(token) for token in name.split("_")]
+            elevation, uncertainty = self.tile(row, col)
+            yield (row, col), elevation, uncertainty
+
+    def clear(self):
+        self.cache.clear()
+        self.cached_bytes = 0
+
+    def counters(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "cached_tiles": len(self.cache),
+            "cached_bytes": self.cached_bytes,
+            "memmap_reads": self.reader.memmap_reads,
+            "h5py_reads": self.reader.h5py_reads,
+        }
@@ -0,0 +1,850 @@
+import hashlib
+import logging
+import time
+
+import h5py
+import numpy as np
+from lxml import etree
+
+import vr_chunks
+import vr_codecs
+import vr_compress
+import vr_index
+import vr_overview
+import vr_parallel
+import vr_precision
+import vr_stream
+import vr_tiles
+import vr_tracking
+
+logger = logging.getLogger(__name__)
+
+# compound type of the per-tile tracking lists (for a VR tracking list of the standard type, see create_tracking_list)
+
+tracking_list_dtype = vr_tracking.tile_tracking_list_dtype()
+
+
+# the modes of cloning the non-VR datasets of the input BAG:
+# - dataset: read the whole dataset and write it again (uncompressed and contiguous)
+# - passthrough: HDF5 object copy (the stored chunks are copied as they are, without decoding them) when the target
+#   filters match the source ones, otherwise the dataset is re-encoded chunk by chunk (bounding the memory footprint)
+
+clone_modes = ["dataset", "passthrough"]
+
+# the nr. of bytes read at once when re-encoding a contiguous dataset
+clone_block_bytes = 64 * 1024 * 1024
+
+
+# the filters of a dataset (as creation options), with the h5py defaults made explicit
+
+
+def dataset_filters(filters):
+    filters = dict(filters)
+    return {
+        "compression": filters.get("compression"),
+        "compression_opts": filters.get("compression_opts"),
+        "shuffle": bool(filters.get("shuffle", False)),
+        "fletcher32": bool(filters.get("fletcher32", False)),
+        "scaleoffset": filters.get("scaleoffset"),
+    }
+
+
+# whether the filters of a source dataset match the target ones (without compression_opts, any level matches)
+
+
+def filters_match(dataset, filters):
+    source = dataset_filters(dict(compression=dataset.compression, compression_opts=dataset.compression_opts,
+                                  shuffle=dataset.shuffle, fletcher32=dataset.fletcher32,
+                                  scaleoffset=dataset.scaleoffset))
+    target = dataset_filters(filters)
+    if "compression_opts" not in filters:
+        source.pop("compression_opts")
+        target.pop("compression_opts")
+    return source == target
+
+
+# clone a dataset of the input BAG (with its attributes) under the same key
+# - mode: one of clone_modes
+# - filters: the target filters with passthrough (None: the source filters), e.g. `dict(compression="gzip")`
+# return a description of how the dataset was cloned
+
+
+def clone_dataset(fid, fod, key, mode="dataset", filters=None, target_key=None):
+    source = fid[key]
+    target_key = target_key or key
+    if mode == "dataset":
+        fod.create_dataset(target_key, data=source)
+        for ka, kv in source.attrs.items():
+            fod[target_key].attrs[ka] = kv
+            logger.info("- %s: dataset attribute copy: %s -> %s" % (target_key, ka, kv))
+        return "dataset copy"
+    if mode != "passthrough":
+        raise RuntimeError("unknown clone mode: %s (expected one of: %s)" % (mode, ", ".join(clone_modes)))
+
+    # the stored chunks are copied as they are (attributes included)
+    if filters is None or filters_match(source, filters):
+        fid.copy(source, fod, name=target_key)
+        return "object copy"
+
+    options = {name: value for name, value in dataset_filters(filters).items()
+               if value is not None and value is not False}
+    chunks = source.chunks
+    if chunks is None and (len(options) > 0 or source.maxshape != source.shape):
+        chunks = True
+    target = fod.create_dataset(target_key, source.shape, dtype=source.dtype, chunks=chunks,
+                                maxshape=source.maxshape if chunks is not None else None, **options)
+    for ka, kv in source.attrs.items():
+        target.attrs[ka] = kv
+
+    # each target chunk is written once (the source is read by the same blocks)
+    nr_blocks = 0
+    if source.size > 0:
+        if target.chunks is not None:
+            blocks = target.iter_chunks()
+        else:
+            row_bytes = max(source.dtype.itemsize * source.size // source.shape[0], 1)
+            block_rows = max(clone_block_bytes // row_bytes, 1)
+            blocks = (np.s_[start:start + block_rows] for start in range(0, source.shape[0], block_rows))
+        for block in blocks:
+            target[block] = source[block]
+            nr_blocks += 1
+    return "re-encoded by %d blocks (%s -> %s)" % (nr_blocks, source.compression, target.compression)
+
+
+# copy the elements in the input BAG that are not VR related
+# - mode, filters: see clone_dataset
+
+
+def clone_content_without_varres_items(fid, fod, mode="dataset", filters=None):
+
+    def clone(key):
+
+        # skip keys with 'varres' in the path
+        if "varres" in key:
+            logger.info("- %s: skip" % (key,))
+            return
+
+        # copy groups with attributes
+        if isinstance(fid[key], h5py.Group):
+            fod.create_group(key)
+            for ka, kv in fid[key].attrs.items():
+                fod[key].attrs[ka] = kv
+                logger.info("- %s: group attribute copy: %s -> %s" % (key, ka, kv))
+            logger.info("- %s: group copy" % (key,))
+            return
+
+        # copy datasets with attributes
+        if isinstance(fid[key], h5py.Dataset):
+            how = clone_dataset(fid, fod, key, mode=mode, filters=filters)
+            logger.info("- %s: %s (%s)" % (key, how, fid[key].dtype))
+
+    logger.info("cloning content (skipping varres* elements)")
+    fid.visit(clone)
+
+
+# retrieve the supergrid description (CRSs, shape, resolution and SW corner) from the BAG XML metadata
+# return the BAG_tiles attributes (in writing order) and whether all of them were retrieved
+
+
+def read_bag_tiles_attributes(fid):
+    attributes = dict()
+
+    # retrieve metadata
+    ns = {
+        'bag': 'http://www.opennavsurf.org/schema/bag',
+        'gco': 'http://www.isotc211.org/2005/gco',
+        'gmd': 'http://www.isotc211.org/2005/gmd',
+        'gmi': 'http://www.isotc211.org/2005/gmi',
+        'gml': 'http://www.opengis.net/gml/3.2',
+        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+    }
+    ns2 = {
+        'gml': 'http://www.opengis.net/gml',
+        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+        'smXML': 'http://metadata.dgiwg.org/smXML',
+    }
+
+    # retrieve CRSs
+    xml_tree = etree.fromstring(fid["BAG_root/metadata"][:].tobytes().rstrip(b"\x00"))
+    crs = xml_tree.xpath('//*/gmd:referenceSystemInfo/gmd:MD_ReferenceSystem/'
+                         'gmd:referenceSystemIdentifier/gmd:RS_Identifier/gmd:code/gco:CharacterString',
+                         namespaces=ns)
+    if len(crs) == 0:
+        try:
+            crs = xml_tree.xpath('//*/referenceSystemInfo/smXML:MD_CRS',
+                                 namespaces=ns2)
+        except etree.Error as e:
+            logger.warning("unable to read the WKT projection string: %s" % e)
+            return attributes, False
+    attributes["crs_horizontal"] = crs[0].text
+    attributes["crs_vertical"] = crs[1].text
+
+    # attempts to read rows and cols info
+    try:
+        shape = xml_tree.xpath('//*/gmd:spatialRepresentationInfo/gmd:MD_Georectified/'
+                               'gmd:axisDimensionProperties/gmd:MD_Dimension/gmd:dimensionSize/gco:Integer',
+                               namespaces=ns)
+    except etree.Error as e:
+        logger.warning("unable to read rows and cols: %s" % e)
+        return attributes, False
+    if len(shape) == 0:
+        try:
+            shape = xml_tree.xpath('//*/spatialRepresentationInfo/smXML:MD_Georectified/'
+                                   'axisDimensionProperties/smXML:MD_Dimension/dimensionSize',
+                                   namespaces=ns2)
+        except etree.Error as e:
+            logger.warning("unable to read rows and cols: %s" % e)
+            return attributes, False
+    attributes["supergrid_rows"] = shape[0].text
+    attributes["supergrid_columns"] = shape[1].text
+
+    # attempts to read resolution along x- and y- axes
+    try:
+        res = xml_tree.xpath('//*/gmd:spatialRepresentationInfo/gmd:MD_Georectified/'
+                             'gmd:axisDimensionProperties/gmd:MD_Dimension/gmd:resolution/gco:Measure',
+                             namespaces=ns)
+    except etree.Error as e:
+        logger.warning("unable to read res x and y: %s" % e)
+        return attributes, False
+    if len(res) == 0:
+        try:
+            res = xml_tree.xpath('//*/spatialRepresentationInfo/smXML:MD_Georectified/'
+                                 'axisDimensionProperties/smXML:MD_Dimension/resolution/'
+                                 'smXML:Measure/smXML:value',
+                                 namespaces=ns2)
+        except etree.Error as e:
+            logger.warning("unable to read res x and y: %s" % e)
+            return attributes, False
+    try:
+        res_x = float(res[0].text)
+        res_y = float(res[1].text)
+    except (ValueError, IndexError) as e:
+        logger.warning("unable to read res x and y: %s" % e)
+        return attributes, False
+    attributes["supergrid_res_x"] = res_x
+    attributes["supergrid_res_y"] = res_y
+
+    # attempts to read corners SW and NE
+    try:
+        coords = xml_tree.xpath('//*/gmd:spatialRepresentationInfo/gmd:MD_Georectified/'
+                                'gmd:cornerPoints/gml:Point/gml:coordinates',
+                                namespaces=ns)[0].text.split()
+    except (etree.Error, IndexError):
+        try:
+            coords = xml_tree.xpath('//*/spatialRepresentationInfo/smXML:MD_Georectified/'
+                                    'cornerPoints/gml:Point/gml:coordinates',
+                                    namespaces=ns2)[0].text.split()
+        except (etree.Error, IndexError) as e:
+            logger.warning("unable to read corners SW and NE: %s" % e)
+            return attributes, False
+
+    try:
+        south = [float(c) for c in coords[0].split(',')][1]
+        west = [float(c) for c in coords[0].split(',')][0]
+    except (ValueError, IndexError) as e:
+        logger.warning("unable to read corners SW and NE: %s" % e)
+        return attributes, False
+    attributes["supergrid_south"] = south
+    attributes["supergrid_west"] = west
+
+    return attributes, True
+
+
+# create the BAG_tiles root-group with the supergrid description and a copy of the BAG XML metadata
+# (the metadata is only copied when the supergrid description is complete)
+# - clone_mode, clone_filters: see clone_dataset
+
+
+def create_bag_tiles_group(fid, fod, bag_tiles_attributes, clone_mode="dataset", clone_filters=None):
+    attributes, complete = bag_tiles_attributes
+
+    fod.create_group("BAG_tiles")
+    logger.info("output BAG_tiles: created BAG_tiles")
+
+    # copy BAG version
+    fod["BAG_tiles"].attrs.create("Bag Version", fid["BAG_root"].attrs["Bag Version"], shape=(), dtype="S5")
+
+    for name, value in attributes.items():
+        fod["BAG_tiles"].attrs[name] = value
+    if not complete:
+        return
+
+    # copy the metadata with attributes
+    key = "BAG_tiles/metadata"
+    how = clone_dataset(fid, fod, "BAG_root/metadata", mode=clone_mode, filters=clone_filters, target_key=key)
+    logger.info("- %s: %s (%s)" % (key, how, fid["BAG_root/metadata"].dtype))
+
+
+# base class of the layout writers: each writer owns an output file, and it is fed by `convert`
+# - ziptype: the compression of the tile datasets (None, "gzip", "lzf" or a filter plugin codec, e.g. "blosc_zstd":
+#   see vr_codecs), checked against the available plugins on creation
+# - copy_base_bag: whether to clone the non-VR content of the input BAG (None: the layout default)
+# - filters: additional dataset creation options (e.g., `dict(shuffle=True, compression_opts=9)`), where
+#   `compression` overrides ziptype (e.g., with the id of a filter plugin)
+# - spatial_index: whether to write the spatial index of the tiles (see vr_index) under the BAG_tiles group
+# - sparse_chunks: when passed (e.g., `(16, 16)`), the tile datasets are chunked with this (rows, cols) shape and
+#   filled with the BAG nodata value, and the chunks only holding nodata are never written (nor allocated on disk)
+# - dedup: whether to store the tile datasets with an already written payload (by content hash) as hard links to the
+#   first copy or, for the datasets created with the catalog (carrying the tile position), as unallocated datasets
+#   with a `duplicate_of` object reference to the first copy (filled with the BAG nodata value, so that the readers
+#   unaware of the reference never see zero depths)
+# - overviews: whether to write the overview pyramid of the surface (see vr_overview) under the BAG_tiles group
+# - clone_mode, clone_filters: how the non-VR content of the input BAG is cloned (see clone_dataset)
+# - compress_threads: when passed, the chunks of the gzip-compressed tile datasets are encoded by this nr. of threads
+#   and stored with direct chunk writes (see vr_compress), the pending chunks being written by `flush`
+# - precision: when passed (e.g., `dict(decimals=3)` or `dict(bits=16)`), the tile values are encoded with this
+#   precision (see vr_precision), each tile dataset recording its error bound as attributes
+# - chunk_access, chunk_bytes: when passed (e.g., "bbox"), the chunk shape of each tile dataset is planned from the
+#   tile dimensions for this access pattern (see vr_chunks), unless set by the filters or the sparse chunks
+
+
+class LayoutWriter:
+    suffix = None
+    bag_tiles_group = "BAG_tiles"
+    bag_tiles_in_root = True  # whether BAG_tiles is a root-group describing the supergrid
+    copy_base_bag = True
+
+    def __init__(self, fod, ziptype=None, copy_base_bag=None, filters=None, spatial_index=True, sparse_chunks=None,
+                 dedup=False, overviews=False, clone_mode="dataset", clone_filters=None, compress_threads=None,
+                 precision=None, chunk_access=None, chunk_bytes=vr_chunks.default_chunk_bytes):
+        vr_codecs.require(ziptype)
+        self.fod = fod
+        self.ziptype = ziptype
+        if copy_base_bag is not None:
+            self.copy_base_bag = copy_base_bag
+        self.filters = dict(filters or {})
+        self.spatial_index = spatial_index
+        self.sparse_chunks = tuple(sparse_chunks) if sparse_chunks is not None else None
+        self.bag_tiles_attributes = None
+        self.has_tracking_list = False
+        self.chunks_written = 0
+        self.chunks_elided = 0
+        self.dedup = dedup
+        self.overviews = overviews
+        self.payloads = dict()
+        self.dedup_datasets = 0
+        self.dedup_bytes = 0
+        self.hash_time = 0.0
+        self.clone_mode = clone_mode
+        self.clone_filters = clone_filters
+        self.compressor = vr_compress.ChunkCompressor(compress_threads) if compress_threads else None
+        self.precision = vr_precision.parse(precision)
+        if chunk_access is not None and chunk_access not in vr_chunks.access_patterns:
+            raise RuntimeError("unknown chunk access pattern: %s (expected one of: %s)"
+                               % (chunk_access, ", ".join(vr_chunks.access_patterns)))
+        self.chunk_access = chunk_access
+        self.chunk_bytes = chunk_bytes
+        if self.precision is not None and "scaleoffset" in self.filters:
+            raise RuntimeError("the precision replaces the scale-offset filter: pass only one of them")
+
+    # the creation options of a dataset with the passed type
+    # (the lossy scale-offset filter is only applied to the floating-point datasets)
+
+    def dataset_options(self, dtype="float32"):
+        options = vr_codecs.creation_options(self.ziptype)
+        if "compression" in self.filters:
+            options.pop("compression_opts", None)  # the settings of the overridden codec
+        options.update(self.filters)
+        if np.dtype(dtype).kind != "f":
+            options.pop("scaleoffset", None)
+        return options
+
+    # the creation options of a tile dataset with the passed type (and shape, to plan its chunks)
+    # (with the decimals precision, the floating-point tiles are stored with the scale-offset filter, and the BAG nodata
+    # value as fill value, which the filter keeps exact)
+
+    def tile_dataset_options(self, dtype="float32", shape=None):
+        options = self.dataset_options(dtype)
+        if self.precision is not None and self.precision[0] == "decimals" and np.dtype(dtype).kind == "f":
+            options["scaleoffset"] = self.precision[1]
+            options["fillvalue"] = vr_tiles.nodata_fill_value(dtype)
+        if self.chunk_access is not None and shape is not None and self.sparse_chunks is None:
+            chunks = vr_chunks.plan_chunks(shape, dtype, self.chunk_access, filtered=vr_chunks.requires_chunks(options),
+                                           chunk_bytes=self.chunk_bytes)
+            if chunks is not None:
+                options.setdefault("chunks", chunks)
+        return options
+
+    # create a tile dataset (chunked when sparse, and filled with the BAG nodata value when sparse or deduplicated)
+    # (the chunk shape in the filters takes precedence over the sparse one)
+
+    def create_tile_dataset(self, path, shape, dtype="float32"):
+        options = self.tile_dataset_options(dtype, shape)
+        if self.sparse_chunks is not None:
+            chunks = tuple(min(chunk, size) for chunk, size in zip(self.sparse_chunks, shape))
+            options.setdefault("chunks", chunks + tuple(shape[len(chunks):]))
+        if self.sparse_chunks is not None or self.dedup:
+            options["fillvalue"] = vr_tiles.nodata_fill_value(dtype)
+        self.fod.create_dataset(path, shape, dtype=dtype, **options)
+
+    # the path of an already written tile dataset with the same payload (type, shape and values) as the passed one
+    # (None for a new payload, which is registered with the passed path)
+
+    def duplicate_of(self, path, data, dtype):
+        start = time.perf_counter()
+        values = np.ascontiguousarray(data)
+        key = (str(np.dtype(dtype).descr), str(values.dtype.descr), values.shape,
+               hashlib.blake2b(values.data, digest_size=32).digest())
+        original = self.payloads.setdefault(key, path)
+        self.hash_time += time.perf_counter() - start
+        if original == path:
+            return None
+        self.dedup_datasets += 1
+        self.dedup_bytes += values.size * np.dtype(dtype).itemsize
+        return original
+
+    # the values of a tile dataset as encoded with the precision (when passed), with the attributes of their error bound
+
+    def encode_tile_values(self, data, dtype):
+        if self.precision is None:
+            return data, dict()
+        filtered = "scaleoffset" in self.tile_dataset_options(dtype)
+        values = vr_precision.quantize(data, self.precision, filtered=filtered)
+        return values, vr_precision.tile_attributes(self.precision, vr_precision.error_bound(data, self.precision))
+
+    # write the values of a tile dataset (as a duplicate, when deduplicated)
+
+    def write_tile_dataset(self, path, data):
+        dataset = self.fod[path]
+        data, attributes = self.encode_tile_values(data, dataset.dtype)
+        for name, value in attributes.items():
+            dataset.attrs[name] = value
+        if self.dedup:
+            original = self.duplicate_of(path, data, dataset.dtype)
+            if original is not None:
+                dataset.attrs["duplicate_of"] = self.fod[original].ref
+                return
+        self.write_tile_values(dataset, data)
+
+    # write the values of a tile dataset (skipping the chunks only holding nodata, when sparse)
+
+    def write_tile_values(self, dataset, data):
+        if self.compressor is not None and vr_compress.supports(dataset):
+            queued, skipped = self.compressor.write(dataset, data, skip_nodata=self.sparse_chunks is not None)
+            if self.sparse_chunks is not None:
+                self.chunks_written += queued
+                self.chunks_elided += skipped
+            return
+        if self.sparse_chunks is None:
+            dataset[...] = data
+            return
+
+        slices = vr_tiles.chunk_slices(data.shape, dataset.chunks)
+        filled = [chunk for chunk in slices if not vr_tiles.is_nodata(data[chunk])]
+        self.chunks_written += len(filled)
+        self.chunks_elided += len(slices) - len(filled)
+        if len(filled) == len(slices):
+            dataset[...] = data
+            return
+        for chunk in filled:
+            dataset[chunk] = data[chunk]
+
+    # create a tile dataset and write its values
+
+    def store_tile_dataset(self, path, data, dtype="float32"):
+        data, attributes = self.encode_tile_values(data, dtype)
+        if self.dedup:
+            original = self.duplicate_of(path, data, dtype)
+            if original is not None:
+                self.fod[path] = self.fod[original]
+                return
+        if self.sparse_chunks is None and self.compressor is None:
+            dataset = self.fod.create_dataset(path, data=data, dtype=dtype, **self.tile_dataset_options(dtype, data.shape))
+        else:
+            self.create_tile_dataset(path, data.shape, dtype)
+            dataset = self.fod[path]
+            self.write_tile_values(dataset, data)
+        for name, value in attributes.items():
+            dataset.attrs[name] = value
+
+    # write the pending tile chunks (when compressed by the thread pool)
+
+    def flush(self):
+        if self.compressor is None:
+            return
+        self.compressor.close()
+        if self.compressor.chunks_written == 0:
+            logger.warning("%s: compress_threads is set, but no tile chunk was compressed by the thread pool (it only "
+                           "encodes the gzip tile datasets, see vr_compress.supports)" % self.suffix)
+        logger.info("%s: %d chunks compressed by %d threads (%d -> %d bytes), %.3f s waiting for the encoding"
+                    % (self.suffix, self.compressor.chunks_written, self.compressor.threads,
+                       self.compressor.raw_bytes, self.compressor.stored_bytes, self.compressor.wait_time))
+
+    # clone the input content (if requested) and create the BAG_tiles group
+
+    def write_header(self, fid, bag_tiles_attributes):
+        self.bag_tiles_attributes = bag_tiles_attributes
+        if self.copy_base_bag:
+            clone_content_without_varres_items(fid, self.fod, mode=self.clone_mode, filters=self.clone_filters)
+        else:
+            logger.info("skipping all source elements")
+
+        if self.bag_tiles_in_root:
+            create_bag_tiles_group(fid, self.fod, bag_tiles_attributes, clone_mode=self.clone_mode,
+                                   clone_filters=self.clone_filters)
+        else:
+            self.fod.create_group(self.bag_tiles_group)
+            logger.info("output BAG: created %s" % self.bag_tiles_group)
+
+    # store the metadata relative to the VR refinements (before any tile is written)
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        self.has_tracking_list = has_tracking_list
+
+    # store the extents of the tiles as a packed R-tree (the supergrid is located with the BAG XML metadata)
+
+    def write_spatial_index(self, tiles):
+        attributes, complete = self.bag_tiles_attributes
+        if not complete:
+            logger.warning("unable to write the spatial index: incomplete supergrid description")
+            return
+        vr_index.write_spatial_index(self.fod, self.bag_tiles_group, tiles,
+                                     west=attributes["supergrid_west"], south=attributes["supergrid_south"],
+                                     res_x=attributes["supergrid_res_x"], res_y=attributes["supergrid_res_y"])
+        logger.info("output BAG: created %s/spatial_index" % self.bag_tiles_group)
+
+    # populate the tile of a super cell from its (dimensions_y, dimensions_x) refinements
+    # (and its entries of the VR tracking list, when the input has one)
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        raise NotImplementedError
+
+    # retrieve the SW corner and the resolution of the supergrid from the BAG_tiles root-group
+
+    def read_supergrid(self):
+        attrs = self.fod["BAG_tiles"].attrs
+        self.supergrid_west = attrs["supergrid_west"]
+        self.supergrid_south = attrs["supergrid_south"]
+        self.supergrid_res_x = attrs["supergrid_res_x"]
+        self.supergrid_res_y = attrs["supergrid_res_y"]
+
+    # per-tile attributes with the tile position
+
+    def tile_attributes(self, tile, group_id):
+        return {
+            "res_x": tile["resolution_x"],
+            "res_y": tile["resolution_y"],
+            "west": self.supergrid_west + tile["col"] * self.supergrid_res_x + tile["sw_corner_x"],
+            "south": self.supergrid_south + tile["row"] * self.supergrid_res_y + tile["sw_corner_y"],
+            "group_id": group_id,  # added group_id for clustering tiles
+        }
+
+    def tile_name(self, tile):
+        return "%d_%d" % (tile["row"], tile["col"])
+
+    # create the tracking list of a tile with a single write (empty when the input has no VR tracking list)
+    # the field types are copied from the VR tracking list of the input BAG; the lists are 1-D, empty ones included
+
+    def create_tracking_list(self, path, tile_tracking=None):
+        if tile_tracking is None:
+            self.fod.create_dataset(path, (0,), dtype=tracking_list_dtype,
+                                    **self.dataset_options(tracking_list_dtype))
+            return
+        dtype = vr_tracking.tile_tracking_list_dtype(tile_tracking.dtype)
+        self.fod.create_dataset(path, data=vr_tracking.tile_tracking_list(tile_tracking, dtype),
+                                **self.dataset_options(dtype))
+
+
+# GSC: a group for each super cell (under BAG_root/BAG_tiles) with elevation, uncertainty and tracking list datasets
+
+
+class GroupsBySuperCells(LayoutWriter):
+    suffix = "GSC"
+    bag_tiles_group = "BAG_root/BAG_tiles"
+    bag_tiles_in_root = False
+    write_empty_tracking_lists = True
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        super().write_catalog(tiles, supergrid_shape, has_tracking_list)
+        for group_id, tile in enumerate(tiles):
+            tile_group = self.bag_tiles_group + "/" + self.tile_name(tile)
+            self.fod.create_group(tile_group)
+            for name, value in self.tile_attributes(tile, group_id).items():
+                self.fod[tile_group].attrs[name] = value
+
+    def tile_attributes(self, tile, group_id):
+        return {
+            "dimensions_x": tile["dimensions_x"],
+            "dimensions_y": tile["dimensions_y"],
+            "resolution_x": tile["resolution_x"],
+            "resolution_y": tile["resolution_y"],
+            "sw_corner_x": tile["sw_corner_x"],
+            "sw_corner_y": tile["sw_corner_y"],
+        }
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        tile_group = self.bag_tiles_group + "/" + self.tile_name(tile)
+        elevation, uncertainty = vr_tiles.split_tile(tile_refs)
+        self.store_tile_dataset(tile_group + "/elevation", elevation)
+        if self.write_empty_tracking_lists or self.has_tracking_list:
+            self.create_tracking_list(tile_group + "/tracking_list", tile_tracking)
+        self.store_tile_dataset(tile_group + "/uncertainty", uncertainty)
+
+
+# GSC_enhanced: as GSC, without the redundant tile dimensions and with a group_id attribute
+
+
+class GroupsBySuperCellsWithEnhancements(GroupsBySuperCells):
+    suffix = "GSC_enhanced"
+    write_empty_tracking_lists = False
+
+    def tile_attributes(self, tile, group_id):
+        return {
+            "resolution_x": tile["resolution_x"],
+            "resolution_y": tile["resolution_y"],
+            "sw_corner_x": tile["sw_corner_x"],
+            "sw_corner_y": tile["sw_corner_y"],
+            "group_id": group_id,  # added group_id for clustering tiles
+        }
+
+
+# BTR: as GSC, with the tile groups (carrying the tile position) under a BAG_tiles root-group
+
+
+class GroupsBySuperCellsWithBagTilesInRoot(GroupsBySuperCells):
+    suffix = "BTR"
+    bag_tiles_group = "BAG_tiles"
+    bag_tiles_in_root = True
+    write_empty_tracking_lists = False
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        self.read_supergrid()
+        super().write_catalog(tiles, supergrid_shape, has_tracking_list)
+
+    def tile_attributes(self, tile, group_id):
+        return LayoutWriter.tile_attributes(self, tile, group_id)
+
+
+# UNG: the tile datasets directly in the BAG_tiles root-group, with the tile positions stored as supergrid grids
+# - grid_block_rows: when passed, the supergrid grids are written by blocks of rows
+
+
+class UngroupedArrays(LayoutWriter):
+    suffix = "UNG"
+
+    def __init__(self, fod, grid_block_rows=None, **kwargs):
+        super().__init__(fod, **kwargs)
+        self.grid_block_rows = grid_block_rows
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        super().write_catalog(tiles, supergrid_shape, has_tracking_list)
+        self.read_supergrid()
+        # the tile positions are always stored without loss (no scale-offset)
+        vr_tiles.write_supergrid_grids(self.fod, self.bag_tiles_group, tiles, supergrid_shape,
+                                       west=self.supergrid_west, south=self.supergrid_south,
+                                       res_x=self.supergrid_res_x, res_y=self.supergrid_res_y,
+                                       block_rows=self.grid_block_rows, **self.dataset_options("int"))
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        tile_id = self.bag_tiles_group + "/" + self.tile_name(tile)
+        elevation, uncertainty = vr_tiles.split_tile(tile_refs)
+        self.store_tile_dataset(tile_id + "_elevation", elevation)
+        if self.has_tracking_list:
+            self.create_tracking_list(tile_id + "_tracking_list", tile_tracking)
+        self.store_tile_dataset(tile_id + "_uncertainty", uncertainty)
+
+
+# CMP: a single dataset for each tile, with a compound (elevation, uncertainty) type
+
+
+class CompoundTiles(LayoutWriter):
+    suffix = "CMP"
+    copy_base_bag = False
+    tile_dtype = [('elevation', "float32"), ('uncertainty', "float32")]
+
+    def create_tile(self, tile_id, tile):
+        self.create_tile_dataset(tile_id, (tile["dimensions_y"], tile["dimensions_x"]), dtype=self.tile_dtype)
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        super().write_catalog(tiles, supergrid_shape, has_tracking_list)
+        self.read_supergrid()
+        for group_id, tile in enumerate(tiles):
+            tile_id = self.bag_tiles_group + "/" + self.tile_name(tile)
+            self.create_tile(tile_id, tile)
+            for name, value in self.tile_attributes(tile, group_id).items():
+                self.fod[tile_id].attrs[name] = value
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        tile_id = self.bag_tiles_group + "/" + self.tile_name(tile)
+        # Elevation and uncertainty are in the same order as in the original refinements list.
+        self.write_tile_dataset(tile_id, vr_tiles.tile_compound(tile_refs, self.fod[tile_id].dtype))
+        if self.has_tracking_list:
+            self.create_tracking_list(tile_id + "_tracking_list", tile_tracking)  # Todo: Group this?
+
+
+# SHP: a single dataset for each tile, with elevation and uncertainty stacked along a third dimension
+
+
+class TilesWithCompoundShape(CompoundTiles):
+    suffix = "SHP"
+    numatts = 2  # Elevation, Uncertainty
+
+    def create_tile(self, tile_id, tile):
+        self.create_tile_dataset(tile_id, (tile["dimensions_y"], tile["dimensions_x"], self.numatts))
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        tile_id = self.bag_tiles_group + "/" + self.tile_name(tile)
+        # Elevation and uncertainty are in the same order as in the original refinements list.
+        self.write_tile_dataset(tile_id, vr_tiles.tile_stacked(tile_refs))
+        if self.has_tracking_list:
+            self.create_tracking_list(tile_id + "_tracking_list", tile_tracking)  # Todo: Group this?
+
+
+# ATT: a group for each attribute (elevation, uncertainty, tracking list) holding a dataset for each tile,
+# with the tile positions stored as supergrid grids
+
+
+class GroupsByAttributeType(UngroupedArrays):
+    suffix = "ATT"
+    copy_base_bag = False
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        super().write_catalog(tiles, supergrid_shape, has_tracking_list)
+        self.fod.create_group(self.bag_tiles_group + "/elevation")
+        self.fod.create_group(self.bag_tiles_group + "/uncertainty")
+        if self.has_tracking_list:
+            self.fod.create_group(self.bag_tiles_group + "/tracking_list")
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        tile_id = "/" + self.tile_name(tile)
+        elevation, uncertainty = vr_tiles.split_tile(tile_refs)
+        self.store_tile_dataset(self.bag_tiles_group + "/elevation" + tile_id, elevation)
+        if self.has_tracking_list:
+            self.create_tracking_list(self.bag_tiles_group + "/tracking_list" + tile_id, tile_tracking)
+        self.store_tile_dataset(self.bag_tiles_group + "/uncertainty" + tile_id, uncertainty)
+
+
+# DUP: as ATT, with the tile positions duplicated as attributes of both the elevation and uncertainty datasets
+
+
+class GroupsByAttributeTypeWithDuplication(LayoutWriter):
+    suffix = "DUP"
+    copy_base_bag = False
+
+    def write_catalog(self, tiles, supergrid_shape, has_tracking_list):
+        super().write_catalog(tiles, supergrid_shape, has_tracking_list)
+        self.read_supergrid()
+        elevation_group = self.bag_tiles_group + "/elevation"
+        self.fod.create_group(elevation_group)
+        uncert_group = self.bag_tiles_group + "/uncertainty"
+        self.fod.create_group(uncert_group)
+        for group_id, tile in enumerate(tiles):
+            tile_id = "/" + self.tile_name(tile)
+            tile_elev = elevation_group + tile_id
+            tile_uncert = uncert_group + tile_id
+            shape = (tile["dimensions_y"], tile["dimensions_x"])
+            self.create_tile_dataset(tile_uncert, shape)
+            self.create_tile_dataset(tile_elev, shape)
+            for name, value in self.tile_attributes(tile, group_id).items():
+                self.fod[tile_elev].attrs[name] = value
+                self.fod[tile_uncert].attrs[name] = value  # duplicate
+        if self.has_tracking_list:
+            self.fod.create_group(self.bag_tiles_group + "/tracking_list")
+
+    def write_tile(self, tile, tile_refs, tile_tracking=None):
+        tile_id = "/" + self.tile_name(tile)
+        elevation, uncertainty = vr_tiles.split_tile(tile_refs)
+        self.write_tile_dataset(self.bag_tiles_group + "/elevation" + tile_id, elevation)
+        if self.has_tracking_list:
+            self.create_tracking_list(self.bag_tiles_group + "/tracking_list" + tile_id, tile_tracking)
+        self.write_tile_dataset(self.bag_tiles_group + "/uncertainty" + tile_id, uncertainty)
+
+
+# the layout writers by layout name
+
+layouts = {
+    "UNG": UngroupedArrays,
+    "GSC": GroupsBySuperCells,
+    "GSC_enhanced": GroupsBySuperCellsWithEnhancements,
+    "BTR": GroupsBySuperCellsWithBagTilesInRoot,
+    "CMP": CompoundTiles,
+    "SHP": TilesWithCompoundShape,
+    "ATT": GroupsByAttributeType,
+    "DUP": GroupsByAttributeTypeWithDuplication,
+}
+
+
+# convert the VR content of an input BAG with a single read, fanning the tiles out to all the passed writers
+# - workers, window_nodes, max_memory: see vr_parallel.iter_tile_refinements
+# return the tile catalog
+
+
+def convert(fid, writers, workers=None, window_nodes=None, max_memory=None):
+
+    # retrieve the metadata relative to the VR refinements
+    meta = fid["BAG_root/varres_metadata"]
+    logger.info("- %s -> %s" % (meta.name, meta.shape))
+    tiles = vr_tiles.load_tile_catalog(meta)
+    logger.info("nr. of valid tiles: %d" % len(tiles))
+    for tile in tiles:
+        logger.info("- valid tile (%s, %s): %s" % (tile["row"], tile["col"], tile))
+
+    # the refinements window must hold the largest tile (checked before writing any output)
+    refs = fid["BAG_root/varres_refinements"]
+    vr_stream.check_window(refs, tiles, window_nodes=window_nodes, max_memory=max_memory)
+
+    # the XML metadata is parsed once for all the writers
+    bag_tiles_attributes = None
+    if any(writer.bag_tiles_in_root or writer.spatial_index or writer.overviews for writer in writers):
+        bag_tiles_attributes = read_bag_tiles_attributes(fid)
+    for writer in writers:
+        writer.write_header(fid, bag_tiles_attributes)
+
+    # retrieve the tracking list and partition it by super cell (sorting it once)
+    trk = fid["BAG_root/varres_tracking_list"]
+    logger.info("- %s -> %s" % (trk.name, trk.shape))
+    tracking = None
+    if trk.shape[0] != 0:
+        tracking = vr_tracking.load_tracking_list(trk, meta.shape)
+        orphans = tracking.orphans(tiles)
+        logger.info("- partitioned %d tracking entries by super cell" % len(tracking))
+        if orphans > 0:
+            logger.warning("- %d tracking entries of super cells without refinements: skipped" % orphans)
+    for writer in writers:
+        writer.write_catalog(tiles, meta.shape, trk.shape[0] != 0)
+        if writer.spatial_index:
+            writer.write_spatial_index(tiles)
+
+    # the overview pyramid is computed once, while streaming the tiles, and written to all the requesting writers
+    overviews = None
+    targets = [(writer.fod, writer.bag_tiles_group, writer.dataset_options(vr_overview.overview_dtype))
+               for writer in writers if writer.overviews]
+    if len(targets) > 0:
+        attributes, complete = bag_tiles_attributes
+        if complete:
+            overviews = vr_overview.OverviewBuilder(targets, tiles, meta.shape,
+                                                    west=attributes["supergrid_west"],
+                                                    south=attributes["supergrid_south"],
+                                                    res_x=attributes["supergrid_res_x"],
+                                                    res_y=attributes["supergrid_res_y"])
+        else:
+            logger.warning("unable to write the overviews: incomplete supergrid description")
+
+    # convert the refinements in the input BAG to tiles for each super cell
+    logger.info("- %s -> %s" % (refs.name, refs.shape))
+    for tile, tile_refs in vr_parallel.iter_tile_refinements(refs, tiles, workers=workers,
+                                                           window_nodes=window_nodes, max_memory=max_memory):
+        logger.info("- populating tile: %d_%d -> [%s]" % (tile["row"], tile["col"], tile))
+        tile_tracking = tracking.tile_entries(tile) if tracking is not None else None
+        for writer in writers:
+            writer.write_tile(tile, tile_refs, tile_tracking)
+        if overviews is not None:
+            overviews.add_tile(tile, tile_refs)
+
+    for writer in writers:
+        writer.flush()
+
+    if overviews is not None:
+        shapes = overviews.finish()
+        logger.info("overviews: %d levels, from %s (%d cells per super cell) to %s"
+                    % (len(shapes), shapes[0], overviews.factor, shapes[-1]))
+    for writer in writers:
+        if writer.sparse_chunks is not None:
+            logger.info("%s: %d tile chunks written, %d nodata chunks elided"
+                        % (writer.suffix, writer.chunks_written, writer.chunks_elided))
+        if writer.dedup:
+            logger.info("%s: %d of %d tile datasets deduplicated (%d bytes), %.3f s hashing"
+                        % (writer.suffix, writer.dedup_datasets, writer.dedup_datasets + len(writer.payloads),
+                           writer.dedup_bytes, writer.hash_time))
+
+    return tiles
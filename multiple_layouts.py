@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+
+import h5py
+
+import layout_writers
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# select an input from the list of BAG files
+
+bag_path = vr_params.parameter("bag_path") or bag_paths[0]
+if not h5py.is_hdf5(bag_path):
+    raise RuntimeError("The passed BAG file is not recognized as a valid HDF5 format")
+logger.info("input BAG file: %s" % bag_path)
+
+# setup comparison parameters
+layouts = vr_params.parameter("layouts", sorted(layout_writers.layouts)) # Select the layouts to generate in a single pass.
+copyBaseBag = vr_params.parameter("copyBaseBag", None) # None uses the default of each layout.
+writer_options = vr_params.writer_options() # The options of the tile datasets (e.g., dedup=True): see layout_writers.LayoutWriter.
+ziptype = writer_options["ziptype"] # To test with compression, pass ziptype as "gzip", "lzf" or a vr_codecs codec (or a dict of them by layout).
+grid_block_rows = vr_params.parameter("grid_block_rows", None) # To write the supergrid grids by blocks of rows, set this to the nr. of rows per block.
+refs_window_nodes = vr_params.parameter("refs_window_nodes", None) # To stream the refinements, set this to the nr. of nodes to read per window.
+refs_max_memory = vr_params.parameter("refs_max_memory", None) # To bound the memory used by the refinements window, set this to a nr. of bytes.
+conversion_workers = vr_params.parameter("conversion_workers", None) # To read the tiles in parallel, set this to the nr. of processes (0: one per core).
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+# open the input BAG in reading mode (and check the presence of the BAG_root group)
+
+fid = h5py.File(bag_path, 'r')
+try:
+    fid["BAG_root"]
+except KeyError:
+    raise RuntimeError("The passed BAG file is not a valid HDF5 format: missing BAG_root group")
+logger.info("input BAG: open")
+
+# open an output BAG in writing mode for each layout
+
+bag_name = os.path.basename(bag_path)
+writers = list()
+for layout in layouts:
+    layout_ziptype = ziptype.get(layout) if isinstance(ziptype, dict) else ziptype
+    test_suffix = layout
+    if layout_ziptype != None:
+        test_suffix += "_" + layout_ziptype
+    out_path = os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + test_suffix + os.path.splitext(bag_name)[1])
+    logger.info("output BAG file: %s" % out_path)
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    writer_class = layout_writers.layouts[layout]
+    kwargs = dict(writer_options, ziptype=layout_ziptype, copy_base_bag=copyBaseBag)
+    if issubclass(writer_class, layout_writers.UngroupedArrays):
+        kwargs["grid_block_rows"] = grid_block_rows
+    writers.append(writer_class(h5py.File(out_path, 'w'), **kwargs))
+logger.info("output BAGs: open (%s)" % ", ".join(layouts))
+
+# convert the VR content of the input BAG to tiles in all the output BAGs (reading the input once)
+
+start = time.perf_counter()
+layout_writers.convert(fid, writers, workers=conversion_workers,
+                       window_nodes=refs_window_nodes, max_memory=refs_max_memory)
+for writer in writers:
+    writer.fod.close()
+logger.info("converted to %d layouts in %.3f s" % (len(writers), time.perf_counter() - start))
@@ -0,0 +1,90 @@
+import logging
+import os
+
+import h5py
+
+import layout_writers
+import vr_codecs
+import vr_resample
+import vr_params
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# create/retrieve the local test/output folder (for outputs)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    os.mkdir(test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# select an input from the list of BAG files
+
+bag_path = vr_params.parameter("bag_path") or bag_paths[0]
+if not h5py.is_hdf5(bag_path):
+    raise RuntimeError("The passed BAG file is not recognized as a valid HDF5 format")
+logger.info("input BAG file: %s" % bag_path)
+
+# setup resampling parameters
+resolution = vr_params.parameter("resolution", 1.0) # The resolution of the uniform grid (in the units of the BAG CRS).
+extent = vr_params.parameter("extent", None) # The (west, south, east, north) of the grid nodes (None: the whole surface).
+mode = vr_params.parameter("mode", "nearest") # The resampling mode: "nearest" or "bilinear".
+band_rows = vr_params.parameter("band_rows", vr_resample.default_band_rows) # The nr. of grid rows populated at once.
+ziptype = vr_params.parameter("ziptype", None) # To test with compression, set this to "gzip", "lzf" or a vr_codecs codec.
+
+vr_codecs.require(ziptype)  # the missing filter plugins are reported before any conversion
+
+# open the input BAG in reading mode (and check the presence of the BAG_root group)
+
+fid = h5py.File(bag_path, 'r')
+try:
+    fid["BAG_root"]
+except KeyError:
+    raise RuntimeError("The passed BAG file is not a valid HDF5 format: missing BAG_root group")
+logger.info("input BAG: open")
+
+# retrieve the supergrid position from the BAG XML metadata
+
+attributes, complete = layout_writers.read_bag_tiles_attributes(fid)
+if not complete:
+    raise RuntimeError("The passed BAG file has an incomplete supergrid description in the XML metadata")
+supergrid = (attributes["supergrid_west"], attributes["supergrid_south"],
+             attributes["supergrid_res_x"], attributes["supergrid_res_y"])
+
+# open the output file in writing mode
+
+bag_name = os.path.basename(bag_path)
+out_path = vr_params.parameter("out_path") or os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_grid_" + mode + ".h5")
+vr_params.check()  # the unknown command-line parameters are reported before any output
+logger.info("output file: %s" % out_path)
+if os.path.exists(out_path):
+    os.remove(out_path)
+fod = h5py.File(out_path, 'w')
+logger.info("output file: open")
+
+# resample the VR content of the input BAG to a uniform grid in the output file
+
+statistics = vr_resample.resample(fid, fod, "grid", supergrid, resolution, extent=extent, mode=mode,
+                                  band_rows=band_rows, **vr_codecs.creation_options(ziptype))
+logger.info("resampled %d x %d nodes (%d with data) by %d bands, reading %d tiles, in %.3f s (%.0f nodes/s)"
+            % (statistics["rows"], statistics["cols"], statistics["filled_nodes"], statistics["bands"],
+               statistics["tiles_read"], statistics["time"], statistics["nodes_per_s"] or 0))
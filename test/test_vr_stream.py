@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import vr_stream  # noqa: E402
+import vr_tiles  # noqa: E402
+
+
+# a BAG-like file with a 1 x N supergrid of (dimensions_x, dimensions_y) tiles, the refinements list being chunked by
+# the passed nr. of nodes
+
+
+def create_refinements(path, tile_dimensions, chunk_nodes):
+    dimensions = np.array(tile_dimensions, dtype=np.int64)
+    nodes = dimensions[:, 0] * dimensions[:, 1]
+    meta = np.zeros((1, len(tile_dimensions)), dtype=vr_tiles.varres_metadata_dtype)
+    meta["index"][0] = np.cumsum(nodes) - nodes
+    meta["dimensions_x"][0] = dimensions[:, 0]
+    meta["dimensions_y"][0] = dimensions[:, 1]
+    refs = np.zeros((1, int(nodes.sum())), dtype=vr_tiles.varres_refinements_dtype)
+    refs["depth"][0] = np.arange(nodes.sum())
+    with h5py.File(path, "w") as fod:
+        fod.create_dataset("BAG_root/varres_metadata", data=meta)
+        fod.create_dataset("BAG_root/varres_refinements", data=refs, chunks=(1, chunk_nodes))
+
+
+class TestRefinementsWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "refinements.bag")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def check_iteration(self, tile_dimensions, window_nodes, max_memory=None):
+        create_refinements(self.path, tile_dimensions, chunk_nodes=100)
+        with h5py.File(self.path, "r") as fid:
+            refs = fid["BAG_root/varres_refinements"]
+            tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+            window = vr_stream.check_window(refs, tiles, window_nodes=window_nodes, max_memory=max_memory)
+            self.assertGreaterEqual(window, min(window_nodes, refs.shape[-1]))
+            self.assertGreaterEqual(window, vr_stream.largest_tile_nodes(tiles))
+
+            values = refs[0]
+            nr_tiles = 0
+            for tile, tile_refs in vr_stream.iter_tile_refinements(refs, tiles, window_nodes=window_nodes,
+                                                                   max_memory=max_memory):
+                np.testing.assert_array_equal(tile_refs, vr_tiles.tile_refinements(values, tile))
+                nr_tiles += 1
+            self.assertEqual(nr_tiles, len(tiles))
+
+    def test_window_not_dividing_the_chunks(self):
+        # 250 and 450 nodes are not multiples of the 100-node chunks (rounding them down fails on these tiles)
+        self.check_iteration([(10, 10), (16, 13), (7, 9)], window_nodes=250)  # tiles of 100, 208 and 63 nodes
+        self.check_iteration([(5, 11), (18, 23), (12, 12)], window_nodes=450)  # tiles of 55, 414 and 144 nodes
+
+    def test_window_rounded_up_to_the_chunks(self):
+        create_refinements(self.path, [(16, 16)] * 4, chunk_nodes=100)
+        with h5py.File(self.path, "r") as fid:
+            refs = fid["BAG_root/varres_refinements"]
+            self.assertEqual(vr_stream.window_size(refs, window_nodes=250), 300)
+            self.assertEqual(vr_stream.window_size(refs, window_nodes=450), 500)
+            self.assertEqual(vr_stream.window_size(refs, window_nodes=50), 100)
+
+    def test_window_smaller_than_the_largest_tile(self):
+        self.check_iteration([(10, 10), (20, 20), (10, 10)], window_nodes=150)  # the 400-node tile sets the window
+
+    def test_max_memory_too_low(self):
+        create_refinements(self.path, [(10, 10), (20, 20), (10, 10)], chunk_nodes=100)
+        with h5py.File(self.path, "r") as fid:
+            refs = fid["BAG_root/varres_refinements"]
+            tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+            max_memory = 300 * refs.dtype.itemsize
+            with self.assertRaises(RuntimeError):
+                vr_stream.check_window(refs, tiles, window_nodes=250, max_memory=max_memory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import signal
+import sys
+import tempfile
+import unittest
+
+import h5py
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import vr_parallel  # noqa: E402
+import vr_tiles  # noqa: E402
+import vr_verify  # noqa: E402
+from test_vr_stream import create_refinements  # noqa: E402
+
+
+# a tile verifier killed (as by the OOM killer) before reporting anything
+
+
+def killed_verifier(fid, fod, layout, tiles, tracking=None, memmap=True, window_nodes=None, max_memory=None):
+    os.kill(os.getpid(), signal.SIGKILL)
+    yield
+
+
+class TestParallelVerification(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "refinements.bag")
+        create_refinements(self.path, [(10, 10), (16, 13), (7, 9), (12, 12)], chunk_nodes=100)
+        self.check_interval = vr_parallel.worker_check_interval
+        vr_parallel.worker_check_interval = 0.1
+
+    def tearDown(self):
+        vr_parallel.worker_check_interval = self.check_interval
+        self.folder.cleanup()
+
+    def test_killed_worker(self):
+        original = vr_verify.iter_tile_results
+        vr_verify.iter_tile_results = killed_verifier
+        try:
+            with h5py.File(self.path, "r") as fid:
+                tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+                with self.assertRaisesRegex(RuntimeError, "without reporting"):
+                    list(vr_verify.iter_results(fid, fid, "GSC", tiles, workers=2))
+        finally:
+            vr_verify.iter_tile_results = original
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import time
+
+import h5py
+
+import layout_readers
+import vr_params
+import vr_verify
+
+# setup logging
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)-9s %(name)s.%(funcName)s:%(lineno)d > %(message)s")
+logger = logging.getLogger(__name__)
+
+# retrieve the local test/data folder (for inputs)
+
+test_data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "data"))
+if not os.path.exists(test_data_folder):
+    raise RuntimeError("Unable to locate the test data folder: %s" % test_data_folder)
+logger.info("test data folder: %s" % test_data_folder)
+
+# retrieve the local test/output folder (for the converted BAG files)
+
+test_output_folder = vr_params.parameter("output_folder") or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "test", "output"))
+if not os.path.exists(test_output_folder):
+    raise RuntimeError("Unable to locate the test output folder: %s" % test_output_folder)
+logger.info("test output folder: %s" % test_output_folder)
+
+# retrieve the list of BAG files in the test/data folder
+
+bag_paths = list()
+for root, _, files in os.walk(test_data_folder):
+    for f in files:
+        if f.endswith(".bag"):
+            bag_paths.append(os.path.join(root, f))
+logger.info("nr. of available BAG files: %d" % len(bag_paths))
+
+# select the source BAG and its converted BAG
+
+bag_path = vr_params.parameter("bag_path") or bag_paths[0]
+if not h5py.is_hdf5(bag_path):
+    raise RuntimeError("The passed BAG file is not recognized as a valid HDF5 format")
+logger.info("source BAG file: %s" % bag_path)
+
+# setup verification parameters
+layout = vr_params.parameter("layout", "GSC") # The layout of the converted BAG (None: detected from the file).
+workers = vr_params.parameter("workers", None) # The nr. of verifying processes (None: this process, 0: one per core).
+memmap = vr_params.parameter("memmap", True) # Whether to memory-map the uncompressed tiles.
+window_nodes = vr_params.parameter("window_nodes", vr_verify.default_window_nodes) # The nr. of source refinements read at once.
+all_results = vr_params.parameter("all_results", False) # To report every tile (not only the failing ones), set this to True.
+
+bag_name = os.path.basename(bag_path)
+out_path = vr_params.parameter("out_path") or \
+    os.path.join(test_output_folder, os.path.splitext(bag_name)[0] + "_" + (layout or "") + os.path.splitext(bag_name)[1])
+if not os.path.exists(out_path):
+    raise RuntimeError("Unable to locate the converted BAG file: %s (run the layout converter first)" % out_path)
+logger.info("converted BAG file: %s" % out_path)
+json_path = vr_params.parameter("json_path") or os.path.splitext(out_path)[0] + "_verification.json"
+vr_params.check()  # the unknown command-line parameters are reported before any output
+
+# verify the converted BAG against the source BAG
+
+with h5py.File(bag_path, 'r') as fid, h5py.File(out_path, 'r') as fod:
+    if layout is not None and layout not in layout_readers.layouts:
+        raise RuntimeError("Unknown layout: %s (expected one of: %s)" % (layout, ", ".join(layout_readers.layouts)))
+    report = vr_verify.verify(fid, fod, layout=layout, workers=workers, memmap=memmap, window_nodes=window_nodes,
+                              all_results=all_results)
+
+logger.info("verified %d tiles (%d nodes) in %.3f s (%.0f nodes/s): %d matching, %d mismatching (%d nodes, "
+            "max error: %s), %d missing, %d extra, %d with mismatching positions (max SW corner error: %s)"
+            % (report["tiles"], report["nodes"], report["time"], report["nodes_per_s"] or 0, report["matching_tiles"],
+               len(report["mismatching_tiles"]), report["mismatching_nodes"], report["max_error"],
+               len(report["missing_tiles"]), len(report["extra_tiles"]), len(report["position_mismatches"]),
+               report["max_position_error"]))
+
+with open(json_path, "w") as fod:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "source": bag_path,
+        "output": out_path,
+        "report": report,
+    }, fod, indent=2)
+logger.info("report written to: %s" % json_path)
+
+if not report["equivalent"]:
+    raise RuntimeError("The converted BAG is not equivalent to the source BAG (see: %s)" % json_path)
+logger.info("the converted BAG is equivalent to the source BAG")
@@ -0,0 +1,107 @@
+import os
+import shutil
+import time
+
+import h5py
+import numpy as np
+
+import layout_readers
+import vr_tiles
+
+# helpers shared by the benchmark scripts: the derived input BAGs (blanked or upsampled copies) and the timed reads of
+# the converted tiles
+
+
+# a copy of the input BAG (in the passed output folder) with the passed fraction of tiles blanked to nodata, the tiles
+# being randomly selected with the passed seed
+
+
+def blanked_copy(bag_path, fraction, output_folder, seed=0):
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(output_folder, os.path.splitext(bag_name)[0] + "_blanked_%02d" % (fraction * 100) +
+                            os.path.splitext(bag_name)[1])
+    shutil.copyfile(bag_path, out_path)
+    with h5py.File(out_path, 'r+') as fid:
+        tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+        refs = fid["BAG_root/varres_refinements"]
+        values = refs[0]
+        rng = np.random.default_rng(seed)
+        for tile in rng.permutation(tiles)[:int(round(len(tiles) * fraction))]:
+            stop = tile["index"] + int(tile["dimensions_x"]) * int(tile["dimensions_y"])
+            for name in values.dtype.names:
+                values[name][tile["index"]:stop] = vr_tiles.nodata_value
+        refs[0] = values
+    return out_path
+
+
+# a copy of the input BAG (in the passed output folder) with each tile upsampled by the passed factor (nearest
+# neighbour, along both axes), to benchmark larger surfaces
+
+
+def upsampled_copy(bag_path, factor, output_folder):
+    bag_name = os.path.basename(bag_path)
+    out_path = os.path.join(output_folder, os.path.splitext(bag_name)[0] + "_upsampled_x%d" % factor +
+                            os.path.splitext(bag_name)[1])
+    shutil.copyfile(bag_path, out_path)
+    with h5py.File(out_path, 'r+') as fid:
+        meta = fid["BAG_root/varres_metadata"]
+        tiles = vr_tiles.load_tile_catalog(meta)
+        refs = fid["BAG_root/varres_refinements"][0]
+        values = list()
+        for tile in tiles:
+            tile_refs = vr_tiles.tile_refinements(refs, tile)
+            values.append(np.repeat(np.repeat(tile_refs, factor, axis=0), factor, axis=1).reshape(-1))
+        values = np.concatenate(values) if len(values) > 0 else refs[:0]
+
+        records = meta[()]
+        rows = tiles["row"].astype(np.intp)
+        cols = tiles["col"].astype(np.intp)
+        nodes = tiles["dimensions_x"].astype(np.int64) * tiles["dimensions_y"] * factor ** 2
+        records["index"][rows, cols] = np.cumsum(nodes) - nodes
+        for name in ["dimensions_x", "dimensions_y"]:
+            records[name][rows, cols] = tiles[name] * factor
+        for name in ["resolution_x", "resolution_y"]:
+            records[name][rows, cols] = tiles[name] / factor
+        meta[...] = records
+
+        attrs = dict(fid["BAG_root/varres_refinements"].attrs)
+        del fid["BAG_root/varres_refinements"]
+        dataset = fid.create_dataset("BAG_root/varres_refinements", data=values[np.newaxis, :])
+        for name, value in attrs.items():
+            dataset.attrs[name] = value
+    return out_path
+
+
+# read all the tiles of a layout, return the nr. of nodes and the max. absolute error against the reference tiles
+
+
+def scan_tiles(reader, reference):
+    nodes = 0
+    max_error = 0.0
+    for name in reader.tile_names():
+        for values, expected in zip(reader.read_tile(name), reference[name]):
+            nodes += values.size
+            if values.size > 0:
+                max_error = max(max_error, float(np.abs(values.astype(np.float64) - expected).max()))
+    return nodes // 2, max_error
+
+
+# the median time of scanning all the tiles of a converted BAG (over the passed nr. of repetitions), with the nr. of
+# read nodes and the max. absolute error of the last scan
+
+
+def timed_scan(path, layout, reference, repeats):
+    timings = list()
+    for _ in range(repeats):
+        with h5py.File(path, 'r') as fod:
+            start = time.perf_counter()
+            nodes, max_error = scan_tiles(layout_readers.layouts[layout](fod), reference)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), nodes, max_error
+
+
+# the throughput of processing the passed nr. of nodes in the passed time (None when the time is too short to measure)
+
+
+def nodes_per_s(nodes, seconds):
+    return nodes / seconds if seconds > 0 else None
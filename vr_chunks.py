@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+
+# plan the chunk shape of a tile dataset from the tile dimensions and the dominant access pattern:
+# - tile: whole-tile reads, the whole tile in a single chunk (or contiguous, when no filter requires chunking), split
+#   in bands of full rows beyond max_chunk_bytes
+# - rows: row scans, bands of full rows holding about chunk_bytes (each row being decoded from a single chunk)
+# - bbox: window reads, square chunks holding about chunk_bytes
+# the chunk shape never exceeds the tile shape (a small tile is a single chunk), each dimension being split in chunks
+# of (about) the same size to limit the padding of the edge chunks, and the trailing dimensions of a tile dataset (e.g.,
+# the stacked attributes of SHP) are never split
+
+access_patterns = ["tile", "rows", "bbox"]
+
+# the default nr. of bytes of a chunk for the row scans and window reads
+default_chunk_bytes = 64 * 1024
+
+# the max nr. of bytes of a chunk (the default size of the HDF5 chunk cache: the larger chunks bypass it)
+max_chunk_bytes = 1024 * 1024
+
+
+# the size of the chunks splitting a dimension in the fewest chunks not larger than max_size (with the least padding)
+
+
+def balanced(size, max_size):
+    count = -(-size // max(max_size, 1))
+    return -(-size // count)
+
+
+# whether the passed dataset creation options require a chunked dataset
+
+
+def requires_chunks(options):
+    return any(options.get(name) not in [None, False] for name in ["compression", "shuffle", "fletcher32"]) or \
+        options.get("scaleoffset") is not None
+
+
+# the chunk shape of a tile dataset (None: contiguous, or left to h5py for an empty tile)
+# - shape, dtype: the shape and type of the tile dataset, as (rows, cols, ...)
+# - access: one of access_patterns
+# - filtered: whether the dataset has filters (and so it must be chunked)
+
+
+def plan_chunks(shape, dtype, access, filtered=False, chunk_bytes=default_chunk_bytes):
+    if access not in access_patterns:
+        raise RuntimeError("unknown access pattern: %s (expected one of: %s)" % (access, ", ".join(access_patterns)))
+    rows, cols = int(shape[0]), int(shape[1])
+    trailing = tuple(int(size) for size in shape[2:])
+    if rows == 0 or cols == 0:
+        return None
+    node_bytes = np.dtype(dtype).itemsize * int(np.prod(trailing, dtype=np.int64))
+
+    if access == "tile":
+        if not filtered:
+            return None
+        chunk_bytes = max_chunk_bytes
+    chunk_bytes = min(chunk_bytes, max_chunk_bytes)
+
+    if access == "bbox":
+        side = max(int(math.sqrt(chunk_bytes / node_bytes)), 1)
+        return (balanced(rows, side), balanced(cols, side)) + trailing
+
+    chunk_cols = balanced(cols, chunk_bytes // node_bytes)
+    return (balanced(rows, chunk_bytes // (chunk_cols * node_bytes)), chunk_cols) + trailing
@@ -0,0 +1,91 @@
+import logging
+
+import h5py
+
+try:
+    import hdf5plugin  # registers the filter plugins it ships with the HDF5 library (on import)
+except ImportError:  # the plugins can still be found through HDF5_PLUGIN_PATH
+    hdf5plugin = None
+
+logger = logging.getLogger(__name__)
+
+# the codecs of the tile datasets beyond gzip and lzf, as registered HDF5 filter plugins (see hdf5plugin)
+# each codec is passed as a `ziptype` and expands to the filter id and its cd_values (the settings of hdf5plugin)
+# - blosc: (reserved x4, level, shuffle (0: none, 1: byte, 2: bit), compressor (1: lz4, 5: zstd))
+# - bitshuffle: (block size (0: automatic), compressor (2: lz4, 3: zstd), [zstd level])
+# - lz4: (block size (0: default)), zstd: (level), bzip2: (block size)
+# the plugin shuffles are applied inside the filter (the HDF5 shuffle filter is not needed)
+
+filter_plugins = {
+    307: "bzip2",
+    32001: "blosc",
+    32004: "lz4",
+    32008: "bitshuffle",
+    32015: "zstd",
+}
+
+codecs = {
+    "blosc_lz4": (32001, (0, 0, 0, 0, 5, 1, 1)),
+    "blosc_lz4_bitshuffle": (32001, (0, 0, 0, 0, 5, 2, 1)),
+    "blosc_zstd": (32001, (0, 0, 0, 0, 5, 1, 5)),
+    "blosc_zstd_bitshuffle": (32001, (0, 0, 0, 0, 5, 2, 5)),
+    "bitshuffle_lz4": (32008, (0, 2)),
+    "bitshuffle_zstd": (32008, (0, 3, 3)),
+    "lz4": (32004, (0,)),
+    "zstd": (32015, (3,)),
+    "bzip2": (307, (9,)),
+}
+
+_reported = False
+
+
+# whether the filter plugin of a codec is available to the local HDF5 library
+
+
+def available(name):
+    filter_id, _ = codecs[name]
+    return bool(h5py.h5z.filter_avail(filter_id))
+
+
+# log the available and missing filter plugins (once), return the names of the available codecs
+
+
+def report():
+    global _reported
+    if not _reported:
+        _reported = True
+        if hdf5plugin is None:
+            logger.info("hdf5plugin not installed: only the filter plugins in HDF5_PLUGIN_PATH are available")
+        for filter_id, plugin in sorted(filter_plugins.items()):
+            if h5py.h5z.filter_avail(filter_id):
+                logger.info("filter plugin available: %s (%d)" % (plugin, filter_id))
+            else:
+                logger.info("filter plugin not available: %s (%d)" % (plugin, filter_id))
+    return [name for name in codecs if available(name)]
+
+
+# check that a ziptype can be used to write the tile datasets (raise when its filter plugin is missing)
+
+
+def require(ziptype):
+    if ziptype is None or ziptype in ["gzip", "lzf", "szip"]:
+        return
+    if ziptype not in codecs:
+        raise RuntimeError("Unknown compression: %s (expected gzip, lzf or one of: %s)"
+                           % (ziptype, ", ".join(codecs)))
+    report()
+    if not available(ziptype):
+        filter_id, _ = codecs[ziptype]
+        raise RuntimeError("The %s compression requires the %s filter plugin (id: %d), which is not available to the "
+                           "HDF5 library: install hdf5plugin or set HDF5_PLUGIN_PATH"
+                           % (ziptype, filter_plugins[filter_id], filter_id))
+
+
+# the dataset creation options of a ziptype (gzip, lzf and szip are passed to h5py as they are)
+
+
+def creation_options(ziptype):
+    if ziptype not in codecs:
+        return dict(compression=ziptype)
+    filter_id, cd_values = codecs[ziptype]
+    return dict(compression=filter_id, compression_opts=cd_values)
@@ -0,0 +1,104 @@
+import collections
+import logging
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import vr_tiles
+
+logger = logging.getLogger(__name__)
+
+# compress the chunks of the tile datasets in a thread pool and store the compressed bytes with direct chunk writes
+# (bypassing the single-threaded HDF5 filter pipeline)
+# - the datasets are created as usual (so the chunk shape and the filter pipeline are the ones HDF5 would use), and
+#   each chunk is encoded as the pipeline would: byte shuffle (when enabled) followed by deflate (zlib releases the GIL)
+# - the edge chunks are padded to the whole chunk shape with the fill value of the dataset (as HDF5 stores them)
+# - the writes happen in the calling thread, in submission order, while up to `max_pending` chunks are being encoded
+# the datasets with other filters (lzf, plugins, scale-offset, fletcher32) are written through HDF5
+
+
+# whether the chunks of a dataset can be encoded by the thread pool (chunked, deflate with optional shuffle)
+
+
+def supports(dataset):
+    return dataset.chunks is not None and dataset.compression == "gzip" and not dataset.fletcher32 and \
+        dataset.scaleoffset is None
+
+
+# encode a (whole) chunk as the HDF5 shuffle and deflate filters
+
+
+def encode_chunk(block, level, shuffle):
+    raw = np.ascontiguousarray(block)
+    if shuffle and raw.dtype.itemsize > 1:
+        raw = np.ascontiguousarray(raw.reshape(-1).view(np.uint8).reshape(-1, raw.dtype.itemsize).T)
+    return zlib.compress(raw, level)
+
+
+# the pool of encoding threads, with the queue of the chunks waiting to be written
+# - threads: the nr. of encoding threads
+# - max_pending: the max nr. of chunks encoded (or being encoded) but not yet written (None: 4 per thread)
+
+
+class ChunkCompressor:
+
+    def __init__(self, threads, max_pending=None):
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.max_pending = max_pending or 4 * threads
+        self.pending = collections.deque()
+        self.chunks_written = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.wait_time = 0.0
+
+    # queue the chunks of the values of a dataset (skipping the chunks only holding nodata, with skip_nodata)
+    # return the nr. of queued and skipped chunks
+
+    def write(self, dataset, data, skip_nodata=False):
+        level = dataset.compression_opts
+        shuffle = dataset.shuffle
+        chunks = dataset.chunks
+        queued = 0
+        skipped = 0
+        for chunk in vr_tiles.chunk_slices(data.shape, chunks):
+            values = data[chunk]
+            if skip_nodata and vr_tiles.is_nodata(values):
+                skipped += 1
+                continue
+            if values.shape != chunks:
+                block = np.empty(chunks, dtype=dataset.dtype)
+                block[...] = dataset.fillvalue
+                block[tuple(slice(0, size) for size in values.shape)] = values
+            else:
+                # a copy: the tile values may be a view on the (reused) refinements window
+                block = np.array(values, dtype=dataset.dtype)
+            offsets = tuple(axis.start for axis in chunk)
+            future = self.executor.submit(encode_chunk, block, level, shuffle)
+            self.pending.append((dataset, offsets, block.nbytes, future))
+            queued += 1
+            while len(self.pending) > self.max_pending:
+                self.write_next()
+        return queued, skipped
+
+    def write_next(self):
+        dataset, offsets, nr_bytes, future = self.pending.popleft()
+        start = time.perf_counter()
+        encoded = future.result()
+        self.wait_time += time.perf_counter() - start
+        dataset.id.write_direct_chunk(offsets, encoded)
+        self.chunks_written += 1
+        self.raw_bytes += nr_bytes
+        self.stored_bytes += len(encoded)
+
+    # write all the queued chunks
+
+    def flush(self):
+        while len(self.pending) > 0:
+            self.write_next()
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
@@ -0,0 +1,151 @@
+import numpy as np
+
+# the spatial index of the tiles is a packed R-tree stored in a `spatial_index` group:
+# - entries: the extent of each tile (with its supergrid row and column), sorted along a Hilbert curve
+# - nodes: the bounding boxes of each level of the tree (from the leaves up to the root), where the node i of a level
+#   covers the items [i * node_size, (i + 1) * node_size) of the level below (or of the entries, for the leaves)
+# the `node_size` and `level_offsets` (the start of each level in nodes, followed by the nr. of nodes) attributes
+# describe the tree
+
+index_entry_dtype = np.dtype([("row", "<u4"), ("col", "<u4"),
+                              ("west", "<f8"), ("south", "<f8"), ("east", "<f8"), ("north", "<f8")])
+index_node_dtype = np.dtype([("west", "<f8"), ("south", "<f8"), ("east", "<f8"), ("north", "<f8")])
+
+default_node_size = 16
+
+
+# the extent of each tile in the catalog (the positions of its SW and NE nodes)
+# - west, south, res_x, res_y: the SW corner and the resolution of the supergrid
+
+
+def tile_extents(tiles, west, south, res_x, res_y):
+    entries = np.empty(len(tiles), dtype=index_entry_dtype)
+    entries["row"] = tiles["row"]
+    entries["col"] = tiles["col"]
+    entries["west"] = west + tiles["col"] * np.float64(res_x) + tiles["sw_corner_x"]
+    entries["south"] = south + tiles["row"] * np.float64(res_y) + tiles["sw_corner_y"]
+    entries["east"] = entries["west"] + (tiles["dimensions_x"].astype(np.float64) - 1) * tiles["resolution_x"]
+    entries["north"] = entries["south"] + (tiles["dimensions_y"].astype(np.float64) - 1) * tiles["resolution_y"]
+    return entries
+
+
+# the distance along a Hilbert curve of order 16 of the passed integer coordinates (in [0, 65535])
+
+
+def hilbert_values(x, y):
+    n = 1 << 16
+    x = np.asarray(x, dtype=np.int64).copy()
+    y = np.asarray(y, dtype=np.int64).copy()
+    d = np.zeros(x.shape, dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # rotate the quadrant
+        flip = ~ry & rx
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s //= 2
+    return d
+
+
+# the bounding boxes of consecutive groups of node_size boxes
+
+
+def group_boxes(boxes, node_size):
+    starts = np.arange(0, len(boxes), node_size)
+    nodes = np.empty(len(starts), dtype=index_node_dtype)
+    nodes["west"] = np.minimum.reduceat(boxes["west"], starts)
+    nodes["south"] = np.minimum.reduceat(boxes["south"], starts)
+    nodes["east"] = np.maximum.reduceat(boxes["east"], starts)
+    nodes["north"] = np.maximum.reduceat(boxes["north"], starts)
+    return nodes
+
+
+# build the packed R-tree of the passed tile extents
+# return the entries (in Hilbert order), the nodes of all the levels and the level offsets
+
+
+def build_packed_rtree(entries, node_size=default_node_size):
+    if len(entries) == 0:
+        return entries, np.empty(0, dtype=index_node_dtype), np.zeros(1, dtype=np.int64)
+
+    # sort the entries by the Hilbert value of their centers (scaled to the whole extent)
+    center_x = (entries["west"] + entries["east"]) / 2
+    center_y = (entries["south"] + entries["north"]) / 2
+    span_x = max(center_x.max() - center_x.min(), 1e-12)
+    span_y = max(center_y.max() - center_y.min(), 1e-12)
+    hx = ((center_x - center_x.min()) / span_x * 65535).astype(np.int64)
+    hy = ((center_y - center_y.min()) / span_y * 65535).astype(np.int64)
+    entries = entries[np.argsort(hilbert_values(hx, hy), kind="stable")]
+
+    levels = [group_boxes(entries, node_size)]
+    while len(levels[-1]) > 1:
+        levels.append(group_boxes(levels[-1], node_size))
+    level_offsets = np.cumsum([0] + [len(level) for level in levels])
+    return entries, np.concatenate(levels), level_offsets
+
+
+# create and populate the spatial index group under the passed group
+# - kwargs: passed to the creation of the datasets (e.g., compression)
+
+
+def write_spatial_index(fod, group, tiles, west, south, res_x, res_y, node_size=default_node_size, **kwargs):
+    entries, nodes, level_offsets = build_packed_rtree(tile_extents(tiles, west, south, res_x, res_y), node_size)
+    index_group = fod.create_group(group + "/spatial_index")
+    index_group.attrs["node_size"] = node_size
+    index_group.attrs["level_offsets"] = level_offsets
+    index_group.create_dataset("entries", data=entries, **kwargs)
+    index_group.create_dataset("nodes", data=nodes, **kwargs)
+    return index_group
+
+
+# read the spatial index stored in the passed group (at once)
+
+
+def read_spatial_index(index_group):
+    return SpatialIndex(index_group["entries"][()], index_group["nodes"][()], index_group.attrs["level_offsets"],
+                        node_size=index_group.attrs["node_size"])
+
+
+def _intersects(boxes, west, south, east, north):
+    return (boxes["east"] >= west) & (boxes["west"] <= east) & (boxes["north"] >= south) & (boxes["south"] <= north)
+
+
+# query the tiles intersecting a bbox by descending the packed R-tree: O(log n + k) visited nodes
+
+
+class SpatialIndex:
+
+    def __init__(self, entries, nodes, level_offsets, node_size=default_node_size):
+        self.node_size = int(node_size)
+        self.entries = entries
+        self.levels = [nodes[level_offsets[i]:level_offsets[i + 1]] for i in range(len(level_offsets) - 1)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # return the entries of the tiles intersecting the bbox
+
+    def query(self, west, south, east, north):
+        if len(self.entries) == 0:
+            return self.entries
+
+        candidates = np.arange(len(self.levels[-1]))
+        children = np.arange(self.node_size)
+        for level in range(len(self.levels) - 1, -1, -1):
+            candidates = candidates[_intersects(self.levels[level][candidates], west, south, east, north)]
+            nr_items = len(self.levels[level - 1]) if level > 0 else len(self.entries)
+            candidates = (candidates[:, np.newaxis] * self.node_size + children).ravel()
+            candidates = candidates[candidates < nr_items]
+
+        hits = self.entries[candidates]
+        return hits[_intersects(hits, west, south, east, north)]
+
+    # return the names ("<row>_<col>") of the tiles intersecting the bbox
+
+    def query_names(self, west, south, east, north):
+        return ["%d_%d" % (entry["row"], entry["col"]) for entry in self.query(west, south, east, north)]
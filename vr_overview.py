@@ -0,0 +1,222 @@
+import numpy as np
+
+import vr_tiles
+
+# the overview pyramid of a VR surface is stored in an `overviews` group with a dataset for each level:
+# - level_0: the combined surface on a uniform grid with `factor` x `factor` cells per super cell, where the factor is
+#   the largest power of 2 keeping the cells not finer than the finest tile resolution
+# - level_<n>: the 2x downsampling of level_<n-1>, up to a level with a single cell
+# each cell holds the min/mean/max depth and the max uncertainty of the refinement nodes falling in the cell (nodata
+# for the empty cells), and the nr. of those nodes
+# the cell (row, col) of a level spans [west + col * res_x, west + (col + 1) * res_x) (and similarly along y), where
+# west, south, res_x and res_y are attributes of the level dataset (as for the tile positions, the SW corner of the
+# supergrid is the one in the BAG XML metadata)
+
+overview_dtype = np.dtype([("min_depth", "<f4"), ("mean_depth", "<f4"), ("max_depth", "<f4"),
+                           ("max_uncertainty", "<f4"), ("nodes", "<u4")])
+
+default_chunk_size = 256
+
+
+# the nr. of level-0 cells (along each axis) per super cell: the largest power of 2 keeping the cells not finer than the
+# finest resolution of the tiles
+
+
+def base_level_factor(tiles, res_x, res_y):
+    if len(tiles) == 0:
+        return 1
+    finest = min(float(tiles["resolution_x"].min()) / res_x, float(tiles["resolution_y"].min()) / res_y)
+    if finest <= 0.0:
+        return 1
+    return 2 ** max(int(np.floor(-np.log2(finest) + 1e-9)), 0)
+
+
+# the shapes of the pyramid levels (from level 0 up to a single cell)
+
+
+def level_shapes(supergrid_shape, factor):
+    shapes = [(int(supergrid_shape[0]) * factor, int(supergrid_shape[1]) * factor)]
+    while max(shapes[-1]) > 1:
+        rows, cols = shapes[-1]
+        shapes.append(((rows + 1) // 2, (cols + 1) // 2))
+    return shapes
+
+
+# the accumulators of a block of cells (min, max, sum and nr. of depths, max uncertainty)
+
+
+class CellBlock:
+
+    def __init__(self, shape):
+        self.min_depth = np.full(shape, np.inf)
+        self.max_depth = np.full(shape, -np.inf)
+        self.sum_depth = np.zeros(shape)
+        self.nodes = np.zeros(shape, dtype=np.int64)
+        self.max_uncertainty = np.full(shape, -np.inf)
+
+    # the block from stored cells (the empty cells hold nodata)
+
+    @classmethod
+    def from_cells(cls, cells):
+        block = cls(cells.shape)
+        filled = cells["nodes"] > 0
+        block.min_depth[filled] = cells["min_depth"][filled]
+        block.max_depth[filled] = cells["max_depth"][filled]
+        block.sum_depth[filled] = cells["mean_depth"][filled].astype(np.float64) * cells["nodes"][filled]
+        block.nodes[:] = cells["nodes"]
+        block.max_uncertainty[filled] = cells["max_uncertainty"][filled]
+        return block
+
+    def cells(self):
+        cells = np.empty(self.nodes.shape, dtype=overview_dtype)
+        filled = self.nodes > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cells["mean_depth"] = np.where(filled, self.sum_depth / self.nodes, vr_tiles.nodata_value)
+        cells["min_depth"] = np.where(filled, self.min_depth, vr_tiles.nodata_value)
+        cells["max_depth"] = np.where(filled, self.max_depth, vr_tiles.nodata_value)
+        cells["max_uncertainty"] = np.where(filled, self.max_uncertainty, vr_tiles.nodata_value)
+        cells["nodes"] = self.nodes
+        return cells
+
+    # merge the aggregates of a (rows, cols) grid of cells into the passed rows and columns of the block
+
+    def merge(self, rows, cols, min_depth, max_depth, sum_depth, nodes, max_uncertainty):
+        cells = np.ix_(rows, cols)
+        self.min_depth[cells] = np.minimum(self.min_depth[cells], min_depth)
+        self.max_depth[cells] = np.maximum(self.max_depth[cells], max_depth)
+        self.sum_depth[cells] += sum_depth
+        self.nodes[cells] += nodes
+        self.max_uncertainty[cells] = np.maximum(self.max_uncertainty[cells], max_uncertainty)
+
+    # the 2x downsampling of the block (the odd last row and column are aggregated alone)
+
+    def downsampled(self):
+        rows, cols = self.nodes.shape
+        row_starts = np.arange(0, rows, 2)
+        col_starts = np.arange(0, cols, 2)
+        block = CellBlock((len(row_starts), len(col_starts)))
+        block.min_depth = _reduce(np.minimum, self.min_depth, row_starts, col_starts)
+        block.max_depth = _reduce(np.maximum, self.max_depth, row_starts, col_starts)
+        block.sum_depth = _reduce(np.add, self.sum_depth, row_starts, col_starts)
+        block.nodes = _reduce(np.add, self.nodes, row_starts, col_starts)
+        block.max_uncertainty = _reduce(np.maximum, self.max_uncertainty, row_starts, col_starts)
+        return block
+
+
+def _reduce(ufunc, values, row_starts, col_starts):
+    return ufunc.reduceat(ufunc.reduceat(values, row_starts, axis=0), col_starts, axis=1)
+
+
+# the aggregates of a tile on the level-0 cells of its super cell: the tile nodes are binned by their position in the
+# super cell (the bins of the nodes are sorted along both axes, so the nodes are reduced by bin with reduceat)
+# return the rows and columns of the cells (relative to the super cell) followed by the aggregates
+
+
+def tile_aggregates(tile, tile_refs, factor, res_x, res_y):
+    depth, uncertainty = vr_tiles.split_tile(tile_refs)
+    dims_y, dims_x = depth.shape
+    y = tile["sw_corner_y"] + np.arange(dims_y) * np.float64(tile["resolution_y"])
+    x = tile["sw_corner_x"] + np.arange(dims_x) * np.float64(tile["resolution_x"])
+    cell_rows = np.clip(np.floor(y / (res_y / factor)).astype(np.int64), 0, factor - 1)
+    cell_cols = np.clip(np.floor(x / (res_x / factor)).astype(np.int64), 0, factor - 1)
+    rows, row_starts = np.unique(cell_rows, return_index=True)
+    cols, col_starts = np.unique(cell_cols, return_index=True)
+
+    valid = (depth != vr_tiles.nodata_value) & (uncertainty != vr_tiles.nodata_value)
+    depth = depth.astype(np.float64)
+    return (rows, cols,
+            _reduce(np.minimum, np.where(valid, depth, np.inf), row_starts, col_starts),
+            _reduce(np.maximum, np.where(valid, depth, -np.inf), row_starts, col_starts),
+            _reduce(np.add, np.where(valid, depth, 0.0), row_starts, col_starts),
+            _reduce(np.add, valid.astype(np.int64), row_starts, col_starts),
+            _reduce(np.maximum, np.where(valid, uncertainty.astype(np.float64), -np.inf), row_starts, col_starts))
+
+
+# build the overview pyramid while the tiles are streamed (in any order), writing it in each of the passed targets
+# - targets: the (file, group, creation options) triplets where the `overviews` group is created
+# - tiles: the tile catalog
+# - supergrid_shape, west, south, res_x, res_y: the shape, the SW corner and the resolution of the supergrid
+# - factor: the nr. of level-0 cells per super cell (along each axis), by default from the finest tile resolution
+# level 0 is accumulated by rows of super cells (each row is written once all its tiles are added), then each level is
+# reduced from the previous one by blocks of rows
+
+
+class OverviewBuilder:
+
+    def __init__(self, targets, tiles, supergrid_shape, west, south, res_x, res_y, factor=None,
+                 chunk_size=default_chunk_size):
+        self.res_x = float(res_x)
+        self.res_y = float(res_y)
+        self.factor = factor or base_level_factor(tiles, self.res_x, self.res_y)
+        self.shapes = level_shapes(supergrid_shape, self.factor)
+        self.chunk_size = chunk_size
+        self.pending = np.bincount(tiles["row"].astype(np.int64), minlength=int(supergrid_shape[0]))
+        self.bands = dict()
+
+        fill_value = np.zeros((), dtype=overview_dtype)
+        for name in overview_dtype.names[:-1]:
+            fill_value[name] = vr_tiles.nodata_value
+        self.levels = list()
+        for target, group, options in targets:
+            overviews = target.create_group(group + "/overviews")
+            overviews.attrs["factor"] = self.factor
+            datasets = list()
+            for level, shape in enumerate(self.shapes):
+                chunks = (min(chunk_size, shape[0]), min(chunk_size, shape[1]))
+                dataset = overviews.create_dataset("level_%d" % level, shape, dtype=overview_dtype, chunks=chunks,
+                                                   fillvalue=fill_value, **options)
+                dataset.attrs["west"] = west
+                dataset.attrs["south"] = south
+                dataset.attrs["res_x"] = self.res_x / self.factor * 2 ** level
+                dataset.attrs["res_y"] = self.res_y / self.factor * 2 ** level
+                datasets.append(dataset)
+            self.levels.append(datasets)
+
+    # add the refinements of a tile to level 0
+
+    def add_tile(self, tile, tile_refs):
+        row = int(tile["row"])
+        if row not in self.bands:
+            self.bands[row] = CellBlock((self.factor, self.shapes[0][1]))
+        rows, cols, *aggregates = tile_aggregates(tile, tile_refs, self.factor, self.res_x, self.res_y)
+        self.bands[row].merge(rows, cols + int(tile["col"]) * self.factor, *aggregates)
+
+        self.pending[row] -= 1
+        if self.pending[row] == 0:
+            self.write_cells(0, row * self.factor, self.bands.pop(row).cells())
+
+    def write_cells(self, level, row, cells):
+        for datasets in self.levels:
+            datasets[level][row:row + cells.shape[0]] = cells
+
+    # write the coarser levels (each one reduced from the previous one, by blocks of rows)
+
+    def finish(self):
+        for row in list(self.bands):
+            self.write_cells(0, row * self.factor, self.bands.pop(row).cells())
+
+        block_rows = 2 * self.chunk_size
+        for level in range(1, len(self.shapes)):
+            source = self.levels[0][level - 1]
+            for start in range(0, source.shape[0], block_rows):
+                block = CellBlock.from_cells(source[start:start + block_rows])
+                self.write_cells(level, start // 2, block.downsampled().cells())
+        return self.shapes
+
+
+# the overview levels stored in an `overviews` group (from the finest)
+
+
+def overview_levels(overviews):
+    return [overviews["level_%d" % level] for level in range(len(overviews))]
+
+
+# the finest level with at most the passed nr. of rows and columns (e.g., the size of the viewport in pixels)
+
+
+def select_level(overviews, max_rows, max_cols):
+    levels = overview_levels(overviews)
+    for dataset in levels:
+        if dataset.shape[0] <= max_rows and dataset.shape[1] <= max_cols:
+            return dataset
+    return levels[-1]
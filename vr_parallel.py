@@ -0,0 +1,137 @@
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import time
+import traceback
+
+import h5py
+import numpy as np
+
+import vr_stream
+
+logger = logging.getLogger(__name__)
+
+# the interval (in seconds) between the checks for the worker processes that exited without reporting
+worker_check_interval = 1.0
+
+
+# split the tile catalog (in index order) in disjoint ranges holding about the same nr. of nodes
+
+
+def split_tiles(tiles, parts):
+    ordered = tiles[np.argsort(tiles["index"], kind="stable")]
+    nodes = np.cumsum(ordered["dimensions_x"].astype(np.int64) * ordered["dimensions_y"])
+    if len(ordered) == 0:
+        return [ordered]
+    bounds = np.searchsorted(nodes, np.linspace(0, nodes[-1], parts + 1)[1:-1], side="right")
+    return [part for part in np.split(ordered, bounds) if len(part) > 0]
+
+
+# the description of a range of tiles (for the logs and the errors)
+
+
+def tile_range_text(tiles):
+    if len(tiles) == 0:
+        return "no tiles"
+    return "%d tiles from %d_%d to %d_%d" % (len(tiles), tiles[0]["row"], tiles[0]["col"], tiles[-1]["row"],
+                                            tiles[-1]["col"])
+
+
+# get the next message posted by the worker processes, raising when a worker exited without reporting its end (e.g.,
+# killed by the OOM killer or by a signal), which would otherwise block the reading process forever
+# - processes, parts: the worker processes and their tile ranges (by worker id)
+# - pending: the ids of the workers that have not reported their end yet
+
+
+def next_message(queue, processes, parts, pending):
+    exited = None
+    while True:
+        try:
+            return queue.get(timeout=worker_check_interval)
+        except queue_module.Empty:
+            # a worker flushes its messages before exiting: an empty queue after its exit means that it never reported
+            if exited is not None:
+                raise RuntimeError("worker #%d (%s) exited with code %s without reporting its end"
+                                   % (exited, tile_range_text(parts[exited]), processes[exited].exitcode))
+            for worker_id in sorted(pending):
+                if not processes[worker_id].is_alive():
+                    exited = worker_id
+                    break
+
+
+# worker process: read and reshape a range of tiles with its own read-only handle on the input BAG, then pass the
+# tiles to the writer (the parent process) through the bounded queue
+
+
+def _read_tiles(worker_id, bag_path, refs_key, tiles, queue, window_nodes, max_memory):
+    try:
+        start = time.perf_counter()
+        nr_nodes = 0
+        with h5py.File(bag_path, 'r') as fid:
+            refs = fid[refs_key]
+            for tile, tile_refs in vr_stream.iter_tile_refinements(refs, tiles, window_nodes=window_nodes,
+                                                                   max_memory=max_memory):
+                queue.put(("tile", tile, tile_refs.copy()))
+                nr_nodes += tile_refs.size
+        queue.put(("done", worker_id, (len(tiles), nr_nodes, time.perf_counter() - start)))
+    except Exception:
+        queue.put(("error", worker_id, traceback.format_exc()))
+
+
+# iterate over the tiles with their (dimensions_y, dimensions_x) refinements, as vr_stream.iter_tile_refinements
+# - workers: the nr. of reading processes (None: read in the current process, 0: one process per core)
+# - queue_size: the max nr. of tiles waiting to be written (None: 4 per worker)
+# the tiles are yielded in completion order, and only the current (writer) process touches the output file
+# the worker processes are forked, so that the converter scripts are not re-executed at their start
+
+
+def iter_tile_refinements(refs, tiles, workers=None, queue_size=None, window_nodes=None, max_memory=None):
+    if workers is None:
+        yield from vr_stream.iter_tile_refinements(refs, tiles, window_nodes=window_nodes, max_memory=max_memory)
+        return
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("parallel conversion requires the 'fork' start method")
+    ctx = multiprocessing.get_context("fork")
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if queue_size is None:
+        queue_size = 4 * workers
+    parts = split_tiles(tiles, workers)
+    logger.info("- reading %d tiles with %d worker processes (queue size: %d)" % (len(tiles), len(parts), queue_size))
+
+    queue = ctx.Queue(maxsize=queue_size)
+    processes = list()
+    for worker_id, part in enumerate(parts):
+        process = ctx.Process(target=_read_tiles, args=(worker_id, refs.file.filename, refs.name, part, queue,
+                                                        window_nodes, max_memory), daemon=True)
+        process.start()
+        processes.append(process)
+
+    start = time.perf_counter()
+    pending = set(range(len(processes)))
+    total_nodes = 0
+    try:
+        while len(pending) > 0:
+            kind, payload, data = next_message(queue, processes, parts, pending)
+            if kind == "tile":
+                total_nodes += data.size
+                yield payload, data
+            elif kind == "done":
+                pending.discard(payload)
+                nr_tiles, nr_nodes, elapsed = data
+                logger.info("- worker #%d: %d tiles, %d nodes in %.3f s -> %.0f nodes/s"
+                            % (payload, nr_tiles, nr_nodes, elapsed, nr_nodes / elapsed if elapsed > 0 else 0))
+            else:
+                raise RuntimeError("worker #%d failed:\n%s" % (payload, data))
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    elapsed = time.perf_counter() - start
+    logger.info("- writer: %d nodes in %.3f s -> %.0f nodes/s"
+                % (total_nodes, elapsed, total_nodes / elapsed if elapsed > 0 else 0))
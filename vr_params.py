@@ -0,0 +1,91 @@
+import ast
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# parameters passed on the command line of a converter as `name=value` (e.g., `ziptype=gzip copyBaseBag=True`)
+# - the values are parsed as Python literals (falling back to plain strings)
+# - the names that a converter does not read (e.g., misspelled ones) are rejected by check()
+# - the conversion options are documented once, with layout_writers.LayoutWriter (tile datasets, cloning and extras)
+#   and layout_writers.convert (reading of the refinements)
+
+_overrides = None
+
+# the names of the parameters read by the converter
+_read = set()
+
+
+def _parse_overrides(argv):
+    overrides = dict()
+    for arg in argv:
+        if "=" not in arg:
+            raise RuntimeError("invalid command-line parameter (expected name=value): %s" % arg)
+        name, value = arg.split("=", 1)
+        try:
+            overrides[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[name] = value
+    return overrides
+
+
+# the values of the passed `name=value` command-line arguments (by name)
+
+
+def parse(argv):
+    return _parse_overrides(argv)
+
+
+# retrieve a converter parameter: the value passed on the command line (if any), otherwise the passed default
+
+
+def parameter(name, default=None):
+    global _overrides
+    if _overrides is None:
+        _overrides = _parse_overrides(sys.argv[1:])
+
+    _read.add(name)
+    if name not in _overrides:
+        return default
+    logger.info("command-line parameter: %s = %r" % (name, _overrides[name]))
+    return _overrides[name]
+
+
+# raise on the command-line parameters that the converter did not read (to be called once all of them are read)
+
+
+def check():
+    global _overrides
+    if _overrides is None:
+        _overrides = _parse_overrides(sys.argv[1:])
+
+    unknown = sorted(set(_overrides) - _read)
+    if len(unknown) > 0:
+        raise RuntimeError("unknown command-line parameters: %s (expected some of: %s)"
+                           % (", ".join(unknown), ", ".join(sorted(_read))))
+
+
+# retrieve the options of the layout writers that all the converters share, as keyword arguments of the writers
+# (see layout_writers.LayoutWriter): e.g., `ziptype=gzip dedup=True compress_threads=4`
+
+
+def writer_options():
+    return {
+        "ziptype": parameter("ziptype", None),
+        "filters": parameter("filters", None),
+        "sparse_chunks": parameter("sparse_chunks", None),
+        "dedup": parameter("dedup", False),
+        "overviews": parameter("overviews", False),
+        "clone_mode": parameter("clone_mode", "dataset"),
+        "clone_filters": parameter("clone_filters", None),
+        "compress_threads": parameter("compress_threads", None),
+        "precision": parameter("precision", None),
+        "chunk_access": parameter("chunk_access", None),
+    }
+
+
+# format parameters as command-line arguments for a converter
+
+
+def arguments(**parameters):
+    return ["%s=%r" % (name, value) for name, value in parameters.items()]
@@ -0,0 +1,140 @@
+import numpy as np
+
+import vr_tiles
+
+# precision-bounded (lossy) encoding of the tile values, selected as `dict(decimals=N)` or `dict(bits=N)`:
+# - decimals: only N decimal places are kept, by the HDF5 scale-offset filter (D-scaling) for the floating-point tile
+#   datasets, or by rounding the values for the compound ones (which the filter does not support)
+# - bits: only N significant bits of the float32 mantissa are kept (bit rounding, round half to even), the trailing
+#   zero bits being left to the compression of the tile datasets
+# the BAG nodata value (and NaN) is kept exact: with the scale-offset filter, as the fill value of the dataset
+# the error bound of the values of each tile dataset is stored in its attributes (see tile_attributes)
+
+precision_modes = ["decimals", "bits"]
+
+
+# the (mode, digits) of a precision setting (None: lossless), raise on an invalid setting
+
+
+def parse(precision):
+    if precision is None:
+        return None
+    if not isinstance(precision, dict) or len(precision) != 1:
+        raise RuntimeError("invalid precision: %s (expected a dict with one of: %s)"
+                           % (precision, ", ".join(precision_modes)))
+    mode, digits = next(iter(precision.items()))
+    if mode not in precision_modes:
+        raise RuntimeError("unknown precision mode: %s (expected one of: %s)" % (mode, ", ".join(precision_modes)))
+    if mode == "decimals" and not 0 <= digits <= 9:
+        raise RuntimeError("invalid nr. of decimal places: %s (expected 0 to 9)" % digits)
+    if mode == "bits" and not 1 <= digits <= 23:
+        raise RuntimeError("invalid nr. of significant bits: %s (expected 1 to 23)" % digits)
+    return mode, int(digits)
+
+
+# the fields of a tile array (the array itself, when not compound)
+
+
+def fields(values):
+    if values.dtype.names is None:
+        return [values]
+    return [values[name] for name in values.dtype.names]
+
+
+# the mask of the values to encode (neither the BAG nodata value nor NaN)
+
+
+def valid_mask(values):
+    return np.isfinite(values) & (values != vr_tiles.nodata_value)
+
+
+# the max absolute value to encode in a tile array (0 when only holding nodata)
+
+
+def max_abs(values):
+    result = 0.0
+    for field in fields(values):
+        valid = np.abs(field[valid_mask(field)])
+        if valid.size > 0:
+            result = max(result, float(valid.max()))
+    return result
+
+
+# round the values to the passed nr. of decimal places (as float32)
+
+
+def round_decimals(values, decimals):
+    rounded = np.round(values.astype(np.float64), decimals).astype(np.float32)
+    return np.where(valid_mask(values), rounded, values)
+
+
+# round the float32 mantissa of the values to the passed nr. of significant bits (round half to even)
+
+
+def round_bits(values, bits):
+    values = np.array(values, dtype=np.float32)
+    drop = 23 - bits
+    if drop == 0:
+        return values
+    raw = values.view(np.uint32)
+    half = np.uint32((1 << (drop - 1)) - 1)
+    mask = np.uint32((0xffffffff >> drop) << drop)
+    rounded = (raw + ((raw >> np.uint32(drop)) & np.uint32(1)) + half) & mask
+    valid = valid_mask(values)
+    raw[valid] = rounded[valid]
+    return values
+
+
+# the tile values to write with a precision setting
+# - filtered: whether the dataset is written with the scale-offset filter (which rounds the decimals itself)
+
+
+def quantize(values, precision, filtered=False):
+    mode, digits = precision
+    if mode == "decimals" and filtered:
+        return values
+    encode = round_decimals if mode == "decimals" else round_bits
+    if values.dtype.names is None:
+        return encode(values, digits)
+    result = np.empty_like(values)
+    for name in values.dtype.names:
+        result[name] = encode(values[name], digits)
+    return result
+
+
+# the max absolute error of the encoded values of a tile array with a precision setting
+# - decimals: half a unit in the last kept decimal place, plus the float32 rounding of the decoded values
+# - bits: half a unit in the last kept bit of the largest value
+
+
+def error_bound(values, precision):
+    mode, digits = precision
+    largest = max_abs(values)
+    if largest == 0.0:
+        return 0.0
+    if mode == "decimals":
+        return 0.5 * 10.0 ** -digits + float(np.spacing(np.float32(largest)))
+    _, exponent = np.frexp(largest)
+    return float(np.ldexp(1.0, int(exponent) - digits - 2))
+
+
+# the attributes of a tile dataset encoded with a precision setting
+
+
+def tile_attributes(precision, bound):
+    mode, digits = precision
+    return {"precision_" + mode: np.int32(digits), "error_bound": np.float64(bound)}
+
+
+# the max absolute error between the expected and decoded values of a tile (the nodata values must match exactly)
+
+
+def max_error(expected, values):
+    error = 0.0
+    for expected_field, field in zip(fields(expected), fields(values)):
+        valid = valid_mask(expected_field)
+        if not np.array_equal(expected_field[~valid], field[~valid], equal_nan=True):
+            return float("inf")
+        if np.any(valid):
+            error = max(error, float(np.abs(expected_field[valid].astype(np.float64) - field[valid]).max()))
+    return error
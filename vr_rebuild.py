@@ -0,0 +1,184 @@
+import logging
+import time
+
+import numpy as np
+
+import layout_readers
+import vr_tiles
+import vr_tracking
+
+logger = logging.getLogger(__name__)
+
+# rebuild the VR content of a BAG (varres_metadata, varres_refinements and varres_tracking_list under BAG_root) from an
+# output BAG of any layout (the inverse of layout_writers.convert)
+# - the tile catalog is retrieved from the tile positions stored by the layout (see layout_readers.LayoutReader), and
+#   the refinement indices are assigned by concatenating the tiles in row-major order
+# - varres_metadata is scattered from the catalog into a supergrid of empty records and written at once
+# - varres_refinements is preallocated with its final size and filled by blocks of `block_nodes` refinements: the tiles
+#   are concatenated into a buffer, flushed with a single contiguous write each time it fills up
+# - varres_tracking_list is the concatenation of the per-tile tracking lists (back to super cell and tile node)
+# the UNG and ATT layouts store the tile positions as float32 grids, so their SW corners are approximated
+
+default_block_nodes = 1024 * 1024
+
+# the varres_metadata record of the super cells without refinements
+empty_metadata = (vr_tiles.no_refinement_index, 0, 0, -1.0, -1.0, -1.0, -1.0)
+
+
+# copy the non-VR content of the BAG_root group (or, for the layouts without it, create BAG_root with the BAG version
+# and the BAG XML metadata stored under BAG_tiles)
+
+
+def copy_bag_root(fid, fod):
+    fod.create_group("BAG_root")
+    if "BAG_root" in fid:
+        for ka, kv in fid["BAG_root"].attrs.items():
+            fod["BAG_root"].attrs[ka] = kv
+        for name in fid["BAG_root"]:
+            if name == "BAG_tiles" or "varres" in name:
+                logger.info("- BAG_root/%s: skip" % name)
+                continue
+            fid.copy(fid["BAG_root/" + name], fod["BAG_root"], name=name)
+            logger.info("- BAG_root/%s: object copy" % name)
+        return
+
+    if "BAG_tiles/metadata" not in fid:
+        raise RuntimeError("unable to rebuild BAG_root: missing BAG_root and BAG_tiles/metadata")
+    fod["BAG_root"].attrs.create("Bag Version", fid["BAG_tiles"].attrs["Bag Version"], shape=(), dtype="S32")
+    fid.copy(fid["BAG_tiles/metadata"], fod["BAG_root"], name="metadata")
+    logger.info("- BAG_root/metadata: object copy (from BAG_tiles)")
+    logger.warning("the input has no BAG_root: the base elevation and uncertainty grids are not rebuilt")
+
+
+# write varres_metadata (with the ranges of the tile dimensions and resolutions as attributes)
+
+
+def write_metadata(fod, tiles, shape):
+    meta = np.empty(shape, dtype=vr_tiles.varres_metadata_dtype)
+    meta[...] = empty_metadata
+    rows = tiles["row"].astype(np.intp)
+    cols = tiles["col"].astype(np.intp)
+    for name in vr_tiles.varres_metadata_dtype.names:
+        meta[name][rows, cols] = tiles[name]
+    dataset = fod.create_dataset("BAG_root/varres_metadata", data=meta,
+                                 fillvalue=np.array(empty_metadata, dtype=vr_tiles.varres_metadata_dtype))
+    if len(tiles) == 0:
+        return
+    for name in ["dimensions_x", "dimensions_y", "resolution_x", "resolution_y"]:
+        dataset.attrs.create("max_" + name, tiles[name].max(), dtype=tiles.dtype[name])
+        dataset.attrs.create("min_" + name, tiles[name].min(), dtype=tiles.dtype[name])
+
+
+# the running ranges of the refinements with data (as the attributes of varres_refinements)
+
+
+class RefinementRanges:
+
+    def __init__(self):
+        self.ranges = {"depth": [np.inf, -np.inf], "uncrt": [np.inf, -np.inf]}
+
+    def update(self, block):
+        for key, name in [("depth", "depth"), ("uncrt", "depth_uncrt")]:
+            values = block[name][block[name] != vr_tiles.nodata_value]
+            if values.size > 0:
+                self.ranges[key][0] = min(self.ranges[key][0], float(values.min()))
+                self.ranges[key][1] = max(self.ranges[key][1], float(values.max()))
+
+    def write(self, dataset):
+        for key, (lower, upper) in self.ranges.items():
+            if lower > upper:
+                continue
+            dataset.attrs.create("max_" + key, upper, dtype="float32")
+            dataset.attrs.create("min_" + key, lower, dtype="float32")
+
+
+# rebuild the VR content of an output BAG
+# - fid: the output BAG (of any layout) to read
+# - fod: the file where the BAG is rebuilt
+# - layout: the layout name (None: detected from the file structure)
+# - block_nodes: the nr. of refinements written at once (bounding the memory footprint to a block and a tile)
+# - kwargs: the creation options of varres_refinements (e.g., compression)
+# return the statistics of the rebuild
+
+
+def rebuild(fid, fod, layout=None, block_nodes=default_block_nodes, **kwargs):
+    start_time = time.perf_counter()
+    layout = layout or layout_readers.detect_layout(fid)
+    reader = layout_readers.layouts[layout](fid)
+    logger.info("rebuilding the VR content from the %s layout" % layout)
+    if not reader.exact_tile_positions:
+        logger.warning("the %s layout stores the tile positions as float32: the SW corners are approximated" % layout)
+
+    supergrid = reader.supergrid()
+    shape = (int(supergrid["supergrid_rows"]), int(supergrid["supergrid_columns"]))
+    tiles = reader.tile_catalog()
+    nodes = tiles["dimensions_x"].astype(np.int64) * tiles["dimensions_y"]
+    nr_nodes = int(nodes.sum())
+    if nr_nodes >= vr_tiles.no_refinement_index:
+        raise RuntimeError("unable to index %d refinements with 32-bit indices" % nr_nodes)
+    tiles["index"] = np.cumsum(nodes) - nodes
+    logger.info("- %d tiles, %d refinements, supergrid: %s" % (len(tiles), nr_nodes, shape))
+
+    copy_bag_root(fid, fod)
+    write_metadata(fod, tiles, shape)
+
+    # the refinements are preallocated and filled by contiguous blocks
+    refs = fod.create_dataset("BAG_root/varres_refinements", (1, nr_nodes), dtype=vr_tiles.varres_refinements_dtype,
+                              fillvalue=np.array((vr_tiles.nodata_value, vr_tiles.nodata_value),
+                                                 dtype=vr_tiles.varres_refinements_dtype), **kwargs)
+    buffer = np.empty(max(min(block_nodes, nr_nodes), 1), dtype=vr_tiles.varres_refinements_dtype)
+    ranges = RefinementRanges()
+    statistics = {"layout": layout, "tiles": len(tiles), "nodes": nr_nodes, "writes": 0, "tracking_entries": 0}
+
+    def flush(block, start):
+        refs.write_direct(block, np.s_[:], np.s_[0, start:start + block.size])
+        ranges.update(block)
+        statistics["writes"] += 1
+
+    tracking = list()
+    block_start = 0
+    filled = 0
+    for tile in tiles:
+        name = "%d_%d" % (tile["row"], tile["col"])
+        depth, uncertainty = reader.read_tile(name)
+        if depth.shape != (tile["dimensions_y"], tile["dimensions_x"]):
+            raise RuntimeError("unexpected shape of tile %s: %s" % (name, depth.shape))
+
+        # the tiles larger than the buffer are written directly
+        if depth.size > buffer.size:
+            if filled > 0:
+                flush(buffer[:filled], block_start)
+                block_start += filled
+                filled = 0
+            block = np.empty(depth.size, dtype=vr_tiles.varres_refinements_dtype)
+            block["depth"] = depth.reshape(-1)
+            block["depth_uncrt"] = uncertainty.reshape(-1)
+            flush(block, block_start)
+            block_start += block.size
+        else:
+            if filled + depth.size > buffer.size:
+                flush(buffer[:filled], block_start)
+                block_start += filled
+                filled = 0
+            buffer["depth"][filled:filled + depth.size] = depth.reshape(-1)
+            buffer["depth_uncrt"][filled:filled + depth.size] = uncertainty.reshape(-1)
+            filled += depth.size
+
+        tile_tracking = reader.read_tracking_list(name)
+        if tile_tracking is not None and len(tile_tracking) > 0:
+            tracking.append(vr_tracking.varres_tracking_list(tile_tracking, tile))
+    if filled > 0:
+        flush(buffer[:filled], block_start)
+    ranges.write(refs)
+
+    if len(tracking) > 0:
+        tracking = np.concatenate(tracking)
+    else:
+        tracking = np.empty(0, dtype=vr_tracking.varres_tracking_list_dtype)
+    trk = fod.create_dataset("BAG_root/varres_tracking_list", data=tracking, chunks=(1024,), maxshape=(None,))
+    trk.attrs.create("VR Tracking List Length", len(tracking), dtype="uint32")
+    statistics["tracking_entries"] = len(tracking)
+
+    statistics["time"] = time.perf_counter() - start_time
+    statistics["nodes_per_s"] = nr_nodes / statistics["time"] if statistics["time"] > 0 else None
+    return statistics
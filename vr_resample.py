@@ -0,0 +1,199 @@
+import logging
+import time
+
+import numpy as np
+
+import vr_index
+import vr_tiles
+
+logger = logging.getLogger(__name__)
+
+# resample the VR refinements of an input BAG to a uniform grid (elevation and uncertainty datasets), where the node
+# (row, col) of the grid is at (west + col * res_x, south + row * res_y), as for the tile positions
+# the grid is populated by bands of rows (from south to north): the tiles overlapping a band are located with an
+# in-memory spatial index, read once (and kept until the bands move past them) and sampled with vectorized gathers
+# - nearest: the value of the nearest tile node, for the grid nodes within half a tile resolution from the tile nodes
+# - bilinear: the (nodata-aware) bilinear interpolation of the four surrounding tile nodes, with the tile border
+#   extended by half a tile resolution (as for nearest)
+# where tiles overlap, the finest one wins; the grid nodes without data hold the BAG nodata value
+
+resample_modes = ["nearest", "bilinear"]
+
+default_band_rows = 256
+
+
+# the grid nodes (along an axis) within the coverage of a tile (its nodes extended by half a resolution), as the range
+# of grid indices and the corresponding fractional tile indices
+
+
+def covered_nodes(origin, res, count, tile_origin, tile_res, tile_count):
+    lower = tile_origin - tile_res / 2.0
+    upper = tile_origin + (tile_count - 0.5) * tile_res
+    start = max(int(np.ceil((lower - origin) / res)), 0)
+    stop = min(int(np.ceil((upper - origin) / res)), count)
+    if start >= stop:
+        return start, start, np.empty(0)
+    return start, stop, (origin + np.arange(start, stop) * res - tile_origin) / tile_res
+
+
+# the nearest tile node of each fractional index
+
+
+def nearest_indices(fractions, count):
+    return np.clip(np.floor(fractions + 0.5).astype(np.intp), 0, count - 1)
+
+
+# the lower tile node and the weight of the upper node of each fractional index (clamped to the tile nodes)
+
+
+def linear_indices(fractions, count):
+    fractions = np.clip(fractions, 0.0, count - 1)
+    lower = np.clip(np.floor(fractions).astype(np.intp), 0, max(count - 2, 0))
+    return lower, np.minimum(lower + 1, count - 1), fractions - lower
+
+
+# sample a tile (elevation and uncertainty grids) at the passed fractional row and column indices
+# return the sampled (rows, cols) grids (nodata where no valid node contributes)
+
+
+def sample_tile(depth, uncertainty, row_fractions, col_fractions, mode):
+    dims_y, dims_x = depth.shape
+    if mode == "nearest":
+        cells = np.ix_(nearest_indices(row_fractions, dims_y), nearest_indices(col_fractions, dims_x))
+        return depth[cells], uncertainty[cells]
+
+    rows0, rows1, ty = linear_indices(row_fractions, dims_y)
+    cols0, cols1, tx = linear_indices(col_fractions, dims_x)
+    ty = ty[:, np.newaxis]
+    tx = tx[np.newaxis, :]
+    depth_sum = np.zeros((len(rows0), len(cols0)))
+    uncertainty_sum = np.zeros((len(rows0), len(cols0)))
+    weight_sum = np.zeros((len(rows0), len(cols0)))
+    for rows, wy in [(rows0, 1.0 - ty), (rows1, ty)]:
+        for cols, wx in [(cols0, 1.0 - tx), (cols1, tx)]:
+            cells = np.ix_(rows, cols)
+            corner_depth = depth[cells]
+            corner_uncertainty = uncertainty[cells]
+            weight = np.where((corner_depth != vr_tiles.nodata_value) &
+                              (corner_uncertainty != vr_tiles.nodata_value), wy * wx, 0.0)
+            depth_sum += weight * np.where(weight > 0, corner_depth, 0.0)
+            uncertainty_sum += weight * np.where(weight > 0, corner_uncertainty, 0.0)
+            weight_sum += weight
+    valid = weight_sum > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (np.where(valid, depth_sum / weight_sum, vr_tiles.nodata_value).astype(np.float32),
+                np.where(valid, uncertainty_sum / weight_sum, vr_tiles.nodata_value).astype(np.float32))
+
+
+# the extent (west, south, east, north) of the nodes of all the tiles
+
+
+def surface_extent(extents):
+    if len(extents) == 0:
+        raise RuntimeError("unable to compute the surface extent: no tiles")
+    return (float(extents["west"].min()), float(extents["south"].min()),
+            float(extents["east"].max()), float(extents["north"].max()))
+
+
+# resample the VR refinements of an input BAG to a uniform grid in the passed output group
+# - fid: the input BAG
+# - fod, group: the output file and the group where the elevation and uncertainty datasets are created
+# - supergrid: the (west, south, res_x, res_y) of the supergrid (e.g., from the BAG XML metadata)
+# - res_x, res_y: the resolution of the grid (res_y defaults to res_x)
+# - extent: the (west, south, east, north) of the grid nodes (by default, the extent of the tile nodes)
+# - mode: one of resample_modes
+# - band_rows: the nr. of grid rows populated at once (bounding the memory footprint to a band and its tiles)
+# - kwargs: the creation options of the grid datasets (e.g., compression)
+# return the statistics of the resampling
+
+
+def resample(fid, fod, group, supergrid, res_x, res_y=None, extent=None, mode="nearest",
+             band_rows=default_band_rows, **kwargs):
+    if mode not in resample_modes:
+        raise RuntimeError("unknown resampling mode: %s (expected one of: %s)" % (mode, ", ".join(resample_modes)))
+    res_x = float(res_x)
+    res_y = float(res_y or res_x)
+    if res_x <= 0.0 or res_y <= 0.0:
+        raise RuntimeError("invalid grid resolution: %s x %s" % (res_x, res_y))
+
+    start_time = time.perf_counter()
+    tiles = vr_tiles.load_tile_catalog(fid["BAG_root/varres_metadata"])
+    extents = vr_index.tile_extents(tiles, *supergrid)
+    entries, nodes, level_offsets = vr_index.build_packed_rtree(extents)
+    index = vr_index.SpatialIndex(entries, nodes, level_offsets)
+    # the tile coverage extends by half a resolution beyond the tile nodes
+    margin = float(max(tiles["resolution_x"].max(), tiles["resolution_y"].max())) / 2.0 if len(tiles) > 0 else 0.0
+
+    west, south, east, north = extent or surface_extent(extents)
+    cols = int(np.floor((east - west) / res_x + 1e-9)) + 1
+    rows = int(np.floor((north - south) / res_y + 1e-9)) + 1
+    logger.info("- resampling to %d x %d nodes at %s x %s (%s)" % (rows, cols, res_x, res_y, mode))
+
+    chunks = (min(band_rows, rows), min(band_rows, cols))
+    out_group = fod.require_group(group)
+    datasets = dict()
+    for name in ["elevation", "uncertainty"]:
+        datasets[name] = out_group.create_dataset(name, (rows, cols), dtype="float32", chunks=chunks,
+                                                  fillvalue=np.float32(vr_tiles.nodata_value), **kwargs)
+    for name, value in [("west", west), ("south", south), ("res_x", res_x), ("res_y", res_y), ("mode", mode)]:
+        out_group.attrs[name] = value
+
+    # the tiles are looked up by (row, col) in the catalog
+    catalog = dict()
+    for position, tile in enumerate(tiles):
+        catalog[(int(tile["row"]), int(tile["col"]))] = position
+    refs = fid["BAG_root/varres_refinements"]
+    cache = dict()
+    statistics = {"rows": rows, "cols": cols, "bands": 0, "tiles_read": 0, "filled_nodes": 0}
+
+    for band_start in range(0, rows, band_rows):
+        band_stop = min(band_start + band_rows, rows)
+        band_south = south + band_start * res_y
+        band_north = south + (band_stop - 1) * res_y
+        depth_band = np.full((band_stop - band_start, cols), vr_tiles.nodata_value, dtype=np.float32)
+        uncertainty_band = np.full((band_stop - band_start, cols), vr_tiles.nodata_value, dtype=np.float32)
+
+        # the tiles overlapping the band (with their coverage), from the coarsest to the finest
+        hits = [(int(entry["row"]), int(entry["col"])) for entry in
+                index.query(west - margin, band_south - margin, east + margin, band_north + margin)]
+        hits.sort(key=lambda key: -float(tiles[catalog[key]]["resolution_x"]))
+
+        # the tiles not overlapping the band (i.e., south of it) are dropped from the cache
+        hit_keys = set(hits)
+        for key in [key for key in cache if key not in hit_keys]:
+            del cache[key]
+
+        for key in hits:
+            tile = tiles[catalog[key]]
+            if key not in cache:
+                nr_nodes = int(tile["dimensions_x"]) * int(tile["dimensions_y"])
+                values = refs[0, int(tile["index"]):int(tile["index"]) + nr_nodes]
+                cache[key] = vr_tiles.split_tile(vr_tiles.tile_refinements(values, tile, offset=int(tile["index"])))
+                statistics["tiles_read"] += 1
+            depth, uncertainty = cache[key]
+
+            tile_west = supergrid[0] + tile["col"] * np.float64(supergrid[2]) + tile["sw_corner_x"]
+            tile_south = supergrid[1] + tile["row"] * np.float64(supergrid[3]) + tile["sw_corner_y"]
+            row_start, row_stop, row_fractions = covered_nodes(band_south, res_y, band_stop - band_start, tile_south,
+                                                               float(tile["resolution_y"]), depth.shape[0])
+            col_start, col_stop, col_fractions = covered_nodes(west, res_x, cols, tile_west,
+                                                               float(tile["resolution_x"]), depth.shape[1])
+            if row_start >= row_stop or col_start >= col_stop:
+                continue
+
+            sampled_depth, sampled_uncertainty = sample_tile(depth, uncertainty, row_fractions, col_fractions, mode)
+            valid = sampled_depth != vr_tiles.nodata_value
+            block = np.s_[row_start:row_stop, col_start:col_stop]
+            depth_band[block] = np.where(valid, sampled_depth, depth_band[block])
+            uncertainty_band[block] = np.where(valid, sampled_uncertainty, uncertainty_band[block])
+
+        filled = int(np.count_nonzero(depth_band != vr_tiles.nodata_value))
+        if filled > 0:
+            datasets["elevation"][band_start:band_stop] = depth_band
+            datasets["uncertainty"][band_start:band_stop] = uncertainty_band
+        statistics["filled_nodes"] += filled
+        statistics["bands"] += 1
+
+    statistics["time"] = time.perf_counter() - start_time
+    statistics["nodes_per_s"] = rows * cols / statistics["time"] if statistics["time"] > 0 else None
+    return statistics
@@ -0,0 +1,118 @@
+import logging
+import sys
+
+import numpy as np
+
+import vr_tiles
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+# retrieve the peak resident set size of the current process (in bytes, None if not available)
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # macOS reports bytes, Linux reports KiB
+        return peak
+    return peak * 1024
+
+
+def peak_rss_text():
+    peak = peak_rss()
+    if peak is None:
+        return "n/a"
+    return "%.1f MiB" % (peak / 1024 ** 2)
+
+
+# the nr. of nodes of the largest tile in a tile catalog
+
+
+def largest_tile_nodes(tiles):
+    if len(tiles) == 0:
+        return 0
+    return int((tiles["dimensions_x"].astype(np.int64) * tiles["dimensions_y"]).max())
+
+
+# evaluate the nr. of nodes to read for each window of the refinements list
+# - window_nodes: the requested nr. of nodes per window (None: the whole refinements list)
+# - max_memory: the hard ceiling (in bytes) for the window buffer
+# - tiles: the tile catalog (the window is never smaller than its largest tile)
+# the window is rounded up to a multiple of the refinements chunk size (when chunked), so that each read only touches
+# whole chunks; only max_memory can make it smaller than requested
+
+
+def window_size(refs, window_nodes=None, max_memory=None, tiles=None):
+    nodes = refs.shape[-1]
+    if window_nodes is None:
+        window_nodes = nodes
+    if tiles is not None:
+        window_nodes = max(window_nodes, largest_tile_nodes(tiles))
+
+    if refs.chunks is not None:
+        chunk_nodes = refs.chunks[-1]
+        window_nodes += -window_nodes % chunk_nodes
+
+    if max_memory is not None:
+        window_nodes = min(window_nodes, max_memory // refs.dtype.itemsize)
+
+    return max(min(window_nodes, nodes), 1)
+
+
+# raise when the largest tile does not fit the refinements window (i.e., the max_memory ceiling is too low)
+# (checked before writing any output)
+
+
+def check_window(refs, tiles, window_nodes=None, max_memory=None):
+    window = window_size(refs, window_nodes=window_nodes, max_memory=max_memory, tiles=tiles)
+    largest = largest_tile_nodes(tiles)
+    if largest > window:
+        raise RuntimeError("the largest tile has %d nodes, which do not fit the refinements window of %d nodes "
+                           "(%d bytes): raise max_memory" % (largest, window, window * refs.dtype.itemsize))
+    return window
+
+
+# iterate over the tiles in index order, reading the refinements list by windows
+# - refs: the varres_refinements dataset (with shape (1, nr. of nodes))
+# - tiles: the tile catalog
+# yield each tile catalog entry with its (dimensions_y, dimensions_x) refinements; the refinements are a view on
+# the window buffer, so they are only valid until the next tile is requested
+
+
+def iter_tile_refinements(refs, tiles, window_nodes=None, max_memory=None):
+    nodes = refs.shape[-1]
+    window = window_size(refs, window_nodes=window_nodes, max_memory=max_memory, tiles=tiles)
+    chunk_nodes = refs.chunks[-1] if refs.chunks is not None else 1
+    logger.info("- reading refinements by windows of %d nodes (%d bytes)" % (window, window * refs.dtype.itemsize))
+
+    buffer = np.empty(window, dtype=refs.dtype)
+    buffer_start = 0
+    buffer_stop = 0
+    nr_reads = 0
+
+    for tile in tiles[np.argsort(tiles["index"], kind="stable")]:
+        tile_start = int(tile["index"])
+        tile_stop = tile_start + int(tile["dimensions_x"]) * int(tile["dimensions_y"])
+        if tile_stop - tile_start > window:
+            raise RuntimeError("tile (%d, %d) with %d nodes does not fit the refinements window of %d nodes"
+                               % (tile["row"], tile["col"], tile_stop - tile_start, window))
+
+        # read a new window (starting from the chunk containing the tile) when the tile is not in the buffer
+        if tile_start < buffer_start or tile_stop > buffer_stop:
+            buffer_start = tile_start - tile_start % chunk_nodes
+            if tile_stop - buffer_start > window:
+                buffer_start = tile_start
+            buffer_stop = min(buffer_start + window, nodes)
+            refs.read_direct(buffer, np.s_[0, buffer_start:buffer_stop], np.s_[0:buffer_stop - buffer_start])
+            nr_reads += 1
+
+        yield tile, vr_tiles.tile_refinements(buffer, tile, offset=buffer_start)
+
+    logger.info("- refinements read with %d windows (peak RSS: %s)" % (nr_reads, peak_rss_text()))
@@ -0,0 +1,180 @@
+import itertools
+
+import numpy as np
+from numpy.lib import recfunctions
+
+# index value used in varres_metadata for the super cells without refinements
+no_refinement_index = 0xffffffff
+
+# elevation and uncertainty value of the refinement nodes without data
+nodata_value = 1000000.0
+
+# compound types of the VR datasets in the input BAG
+varres_metadata_dtype = np.dtype([("index", "<u4"), ("dimensions_x", "<u4"), ("dimensions_y", "<u4"),
+                                  ("resolution_x", "<f4"), ("resolution_y", "<f4"),
+                                  ("sw_corner_x", "<f4"), ("sw_corner_y", "<f4")])
+varres_refinements_dtype = np.dtype([("depth", "<f4"), ("depth_uncrt", "<f4")])
+
+
+# the tile catalog is a structured array with the position of each super cell with refinements (row, col)
+# followed by its varres_metadata fields
+
+
+def tile_catalog_dtype(meta_dtype):
+    return np.dtype([("row", "<u4"), ("col", "<u4")] + [(name, meta_dtype[name]) for name in meta_dtype.names])
+
+
+# build the tile catalog (in row-major order) by scanning the whole varres_metadata at once
+# - meta: the varres_metadata dataset (or array)
+# - block_rows: when passed, the supergrid is read in blocks of rows (to bound the memory footprint)
+
+
+def load_tile_catalog(meta, block_rows=None):
+    if block_rows is None:
+        block_rows = max(meta.shape[0], 1)
+
+    blocks = list()
+    for block_start in range(0, meta.shape[0], block_rows):
+        block = meta[block_start:block_start + block_rows]
+        rows, cols = np.nonzero(block["index"] != no_refinement_index)
+        entries = np.empty(rows.size, dtype=tile_catalog_dtype(meta.dtype))
+        entries["row"] = rows + block_start
+        entries["col"] = cols
+        for name in meta.dtype.names:
+            entries[name] = block[name][rows, cols]
+        blocks.append(entries)
+
+    if len(blocks) == 0:
+        return np.empty(0, dtype=tile_catalog_dtype(meta.dtype))
+    return np.concatenate(blocks)
+
+
+# slice the refinements of a super cell out of the VR refinements list and reshape them as a tile
+# - refs: the 1D refinements list (i.e., `fid["BAG_root/varres_refinements"][0]`)
+# - meta: the varres_metadata record (or tile catalog entry) of the super cell
+# - offset: the index of the first node in `refs` (when `refs` is a window of the refinements list)
+# the returned (dimensions_y, dimensions_x) array is a view on `refs` (no copy)
+
+
+def tile_refinements(refs, meta, offset=0):
+    start = int(meta["index"]) - offset
+    dims_x = int(meta["dimensions_x"])
+    dims_y = int(meta["dimensions_y"])
+    return refs[start:start + dims_x * dims_y].reshape(dims_y, dims_x)
+
+
+# split a tile of refinements in its elevation and uncertainty grids (field views, no copy)
+
+
+def split_tile(tile_refs):
+    depth_field, uncertainty_field = tile_refs.dtype.names[:2]
+    return tile_refs[depth_field], tile_refs[uncertainty_field]
+
+
+def tile_arrays(refs, meta):
+    return split_tile(tile_refinements(refs, meta))
+
+
+# retype a tile of refinements to the passed compound type (fields are matched by position)
+
+
+def tile_compound(tile_refs, dtype):
+    return tile_refs.astype(dtype)
+
+
+# stack elevation and uncertainty of a tile along a third axis (a view when the fields are contiguous)
+
+
+def tile_stacked(tile_refs):
+    return recfunctions.structured_to_unstructured(tile_refs, dtype=np.float32)
+
+
+# the fill value of a tile dataset of the passed type: the BAG nodata value (in every field of a compound type)
+
+
+def nodata_fill_value(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.names is None:
+        return dtype.type(nodata_value)
+    fill_value = np.empty((), dtype=dtype)
+    for name in dtype.names:
+        fill_value[name] = nodata_value
+    return fill_value
+
+
+# the slices of the chunks covering an array of the passed shape (in row-major order)
+
+
+def chunk_slices(shape, chunks):
+    ranges = [range(0, size, chunk) for size, chunk in zip(shape, chunks)]
+    return [tuple(slice(start, min(start + chunk, size)) for start, chunk, size in zip(starts, chunks, shape))
+            for starts in itertools.product(*ranges)]
+
+
+# whether all the values of a block of a tile (in every field of a compound type) are the BAG nodata value
+
+
+def is_nodata(block):
+    if block.dtype.names is None:
+        return bool(np.all(block == nodata_value))
+    return all(np.all(block[name] == nodata_value) for name in block.dtype.names)
+
+
+# compute the per-super cell grids (res_x, res_y, west, south, group_id) for a block of supergrid rows
+# - tiles: the tile catalog (the group_id of a tile is its position in the catalog)
+# - shape: the (rows, columns) shape of the supergrid
+# - west, south, res_x, res_y: the SW corner and the resolution of the supergrid
+# the super cells without refinements are left to zero
+
+
+supergrid_grid_dtypes = {
+    "res_x": "float32",
+    "res_y": "float32",
+    "west": "float32",
+    "south": "float32",
+    "group_id": "int",
+}
+
+
+def supergrid_grids(tiles, shape, west, south, res_x, res_y, row_start=0, row_stop=None):
+    if row_stop is None:
+        row_stop = shape[0]
+
+    grids = dict()
+    for name, dtype in supergrid_grid_dtypes.items():
+        grids[name] = np.zeros((row_stop - row_start, shape[1]), dtype=dtype)
+
+    first, last = np.searchsorted(tiles["row"], [row_start, row_stop])
+    block = tiles[first:last]
+    rows = block["row"].astype(np.intp) - row_start
+    cols = block["col"].astype(np.intp)
+
+    # position of the SW corner of the supergrid columns and (block) rows
+    node_west = west + np.arange(shape[1]) * res_x
+    node_south = south + np.arange(row_start, row_stop) * res_y
+
+    grids["res_x"][rows, cols] = block["resolution_x"]
+    grids["res_y"][rows, cols] = block["resolution_y"]
+    grids["west"][rows, cols] = node_west[cols] + block["sw_corner_x"]
+    grids["south"][rows, cols] = node_south[rows] + block["sw_corner_y"]
+    grids["group_id"][rows, cols] = np.arange(first, last)  # added group_id for clustering tiles
+    return grids
+
+
+# create and populate the per-super cell grids under the passed group (one write per grid)
+# - block_rows: when passed, the grids are computed and written in blocks of rows (for supergrids too large for RAM)
+# - kwargs: passed to the creation of the datasets (e.g., compression)
+
+
+def write_supergrid_grids(fod, group, tiles, shape, west, south, res_x, res_y, block_rows=None, **kwargs):
+    if block_rows is None:
+        block_rows = max(shape[0], 1)
+
+    for name, dtype in supergrid_grid_dtypes.items():
+        fod.create_dataset(group + "/" + name, shape, dtype=dtype, **kwargs)
+
+    for row_start in range(0, shape[0], block_rows):
+        row_stop = min(row_start + block_rows, shape[0])
+        grids = supergrid_grids(tiles, shape, west, south, res_x, res_y, row_start=row_start, row_stop=row_stop)
+        for name, grid in grids.items():
+            fod[group + "/" + name][row_start:row_stop] = grid
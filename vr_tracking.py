@@ -0,0 +1,99 @@
+import numpy as np
+
+# compound type of the VR tracking list in the input BAG
+
+varres_tracking_list_dtype = {'names': ['row', 'col', 'sub_row', 'sub_col', 'depth', 'uncertainty', 'track_code',
+                                        'list_series'],
+                              'formats': ['<u4', '<u4', '<u4', '<u4', '<f4', '<f4', 'u1', '<u2'],
+                              'offsets': [0, 4, 8, 12, 16, 20, 24, 26], 'itemsize': 28}
+
+
+# the VR tracking list partitioned by owning super cell: the entries are sorted once by super cell (row-major key),
+# so that the entries of a tile are a contiguous slice found with two binary searches
+# - entries: the varres_tracking_list entries (row, col: the super cell; sub_row, sub_col: the node in the tile)
+# - supergrid_shape: the (rows, columns) shape of the supergrid
+
+
+class TrackingList:
+
+    def __init__(self, entries, supergrid_shape):
+        self.columns = np.int64(supergrid_shape[1])
+        keys = entries["row"].astype(np.int64) * self.columns + entries["col"]
+        order = np.argsort(keys, kind="stable")
+        self.entries = entries[order]
+        self.keys = keys[order]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def tile_slice(self, row, col):
+        key = np.int64(row) * self.columns + np.int64(col)
+        start = np.searchsorted(self.keys, key, side="left")
+        stop = np.searchsorted(self.keys, key, side="right")
+        return start, stop
+
+    # the entries of the tile of the super cell at (row, col) (a view, no copy)
+
+    def tile_entries(self, tile):
+        start, stop = self.tile_slice(tile["row"], tile["col"])
+        return self.entries[start:stop]
+
+    # the nr. of entries of super cells without a tile in the passed catalog
+
+    def orphans(self, tiles):
+        tile_keys = np.sort(tiles["row"].astype(np.int64) * self.columns + tiles["col"])
+        if len(tile_keys) == 0:
+            return len(self.keys)
+        positions = np.minimum(np.searchsorted(tile_keys, self.keys), len(tile_keys) - 1)
+        return int(np.count_nonzero(tile_keys[positions] != self.keys))
+
+
+# read the VR tracking list (in blocks of entries) and partition it by super cell
+
+
+def load_tracking_list(trk, supergrid_shape, block_entries=1024 * 1024):
+    if trk.shape[0] == 0:
+        return TrackingList(np.empty(0, dtype=trk.dtype), supergrid_shape)
+
+    entries = np.empty(trk.shape[0], dtype=trk.dtype)
+    for start in range(0, trk.shape[0], block_entries):
+        stop = min(start + block_entries, trk.shape[0])
+        trk.read_direct(entries, np.s_[start:stop], np.s_[start:stop])
+    return TrackingList(entries, supergrid_shape)
+
+
+# the per-tile tracking list type, with the field types of the passed VR tracking list type (the node in the tile
+# becomes the row and column)
+
+
+def tile_tracking_list_dtype(dtype=varres_tracking_list_dtype):
+    dtype = np.dtype(dtype)
+    source_names = {"row": "sub_row", "col": "sub_col"}
+    names = ["row", "col", "depth", "uncertainty", "track_code", "list_series"]
+    return np.dtype([(name, dtype[source_names.get(name, name)]) for name in names], align=True)
+
+
+# convert VR tracking entries to the per-tile tracking list type (the node in the tile becomes the row and column)
+
+
+def tile_tracking_list(entries, dtype):
+    tracking = np.empty(len(entries), dtype=dtype)
+    tracking["row"] = entries["sub_row"]
+    tracking["col"] = entries["sub_col"]
+    for name in ["depth", "uncertainty", "track_code", "list_series"]:
+        tracking[name] = entries[name]
+    return tracking
+
+
+# convert the per-tile tracking list entries of a tile back to VR tracking entries (the inverse of tile_tracking_list)
+
+
+def varres_tracking_list(tile_entries, tile, dtype=varres_tracking_list_dtype):
+    tracking = np.empty(len(tile_entries), dtype=dtype)
+    tracking["row"] = tile["row"]
+    tracking["col"] = tile["col"]
+    tracking["sub_row"] = tile_entries["row"]
+    tracking["sub_col"] = tile_entries["col"]
+    for name in ["depth", "uncertainty", "track_code", "list_series"]:
+        tracking[name] = tile_entries[name]
+    return tracking
@@ -0,0 +1,248 @@
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+import zlib
+
+import h5py
+import numpy as np
+
+import layout_readers
+import vr_parallel
+import vr_stream
+import vr_tiles
+import vr_tracking
+
+logger = logging.getLogger(__name__)
+
+# verify that a converted BAG (of any layout) holds every refinement node of its source BAG
+# the source refinements are streamed by windows (see vr_stream) and each tile is compared with the converted one:
+# - the elevation and uncertainty grids, with a vectorized NaN-aware equality (NaN matches NaN)
+# - the per-tile tracking list, when the source has a VR tracking list
+# - the CRC-32 checksums of the source and converted grids (elevation followed by uncertainty)
+# the tile positions (dimensions, resolutions and SW corners) are compared from the two tile catalogs
+# with workers, the tiles are split in ranges with about the same nr. of nodes, each verified by a forked process with
+# its own read-only handles on both files (only the per-tile results go through the queue)
+
+# the default nr. of source refinements read at once (by each worker)
+default_window_nodes = 16 * 1024 * 1024
+
+# the nr. of per-tile results sent at once by the workers
+result_batch_size = 1024
+
+
+# the CRC-32 of the elevation and uncertainty grids of a tile (as contiguous float32 values)
+
+
+def tile_checksum(depth, uncertainty):
+    checksum = zlib.crc32(np.ascontiguousarray(depth, dtype=np.float32).data)
+    return zlib.crc32(np.ascontiguousarray(uncertainty, dtype=np.float32).data, checksum)
+
+
+# the nr. of mismatching values (where NaN matches NaN) and the max absolute error between two grids
+
+
+def grid_mismatches(expected, values):
+    mismatching = (expected != values) & ~(np.isnan(expected) & np.isnan(values))
+    count = int(np.count_nonzero(mismatching))
+    if count == 0:
+        return 0, 0.0
+    with np.errstate(invalid="ignore"):
+        errors = np.abs(expected[mismatching].astype(np.float64) - values[mismatching])
+    return count, float(np.nanmax(errors)) if np.any(~np.isnan(errors)) else float("nan")
+
+
+# compare a source tile with the converted one, return the per-tile result
+# - tracking: the source VR tracking list (see vr_tracking.TrackingList), None when the source has none
+
+
+def compare_tile(reader, tile, tile_refs, tracking=None):
+    name = "%d_%d" % (tile["row"], tile["col"])
+    depth, uncertainty = vr_tiles.split_tile(tile_refs)
+    result = {"tile": name, "nodes": int(depth.size), "source_checksum": tile_checksum(depth, uncertainty)}
+    if not reader.has_tile(name):
+        result["status"] = "missing"
+        return result
+
+    values = reader.read_tile(name)
+    result["output_checksum"] = tile_checksum(*values)
+    if values[0].shape != depth.shape or values[1].shape != uncertainty.shape:
+        result["status"] = "shape"
+        result["output_shape"] = list(values[0].shape)
+        return result
+
+    result["elevation_mismatches"], result["elevation_max_error"] = grid_mismatches(depth, values[0])
+    result["uncertainty_mismatches"], result["uncertainty_max_error"] = grid_mismatches(uncertainty, values[1])
+    matching = result["elevation_mismatches"] == 0 and result["uncertainty_mismatches"] == 0
+
+    if tracking is not None:
+        expected = tracking.tile_entries(tile)
+        entries = reader.read_tracking_list(name)
+        if entries is None:
+            entries = np.empty(0, dtype=expected.dtype)
+        else:
+            entries = vr_tracking.varres_tracking_list(entries, tile, dtype=expected.dtype)
+        result["tracking_entries"] = len(expected)
+        result["tracking_matching"] = len(entries) == len(expected) and bool(np.all(entries == expected))
+        matching = matching and result["tracking_matching"]
+
+    result["status"] = "ok" if matching else "mismatch"
+    return result
+
+
+# verify a range of tiles in the current process (yield the per-tile results)
+
+
+def iter_tile_results(fid, fod, layout, tiles, tracking=None, memmap=True, window_nodes=default_window_nodes,
+                      max_memory=None):
+    reader = layout_readers.layouts[layout](fod, memmap=memmap)
+    refs = fid["BAG_root/varres_refinements"]
+    for tile, tile_refs in vr_stream.iter_tile_refinements(refs, tiles, window_nodes=window_nodes,
+                                                           max_memory=max_memory):
+        yield compare_tile(reader, tile, tile_refs, tracking)
+
+
+# worker process: verify a range of tiles with its own read-only handles, passing the results by batches
+
+
+def _verify_tiles(worker_id, source_path, output_path, layout, tiles, tracking, queue, memmap, window_nodes,
+                  max_memory):
+    try:
+        with h5py.File(source_path, 'r') as fid, h5py.File(output_path, 'r') as fod:
+            batch = list()
+            for result in iter_tile_results(fid, fod, layout, tiles, tracking, memmap=memmap,
+                                            window_nodes=window_nodes, max_memory=max_memory):
+                batch.append(result)
+                if len(batch) == result_batch_size:
+                    queue.put(("results", worker_id, batch))
+                    batch = list()
+            queue.put(("results", worker_id, batch))
+        queue.put(("done", worker_id, None))
+    except Exception:
+        queue.put(("error", worker_id, traceback.format_exc()))
+
+
+# iterate over the per-tile results, as iter_tile_results
+# - workers: the nr. of verifying processes (None: verify in the current process, 0: one process per core)
+# the results are yielded in completion order with workers
+
+
+def iter_results(fid, fod, layout, tiles, tracking=None, workers=None, memmap=True, window_nodes=default_window_nodes,
+                 max_memory=None):
+    if workers is None:
+        yield from iter_tile_results(fid, fod, layout, tiles, tracking, memmap=memmap, window_nodes=window_nodes,
+                                     max_memory=max_memory)
+        return
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("parallel verification requires the 'fork' start method")
+    ctx = multiprocessing.get_context("fork")
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    parts = vr_parallel.split_tiles(tiles, workers)
+    logger.info("- verifying %d tiles with %d worker processes" % (len(tiles), len(parts)))
+
+    queue = ctx.Queue(maxsize=4 * len(parts))
+    processes = list()
+    for worker_id, part in enumerate(parts):
+        process = ctx.Process(target=_verify_tiles, args=(worker_id, fid.filename, fod.filename, layout, part,
+                                                          tracking, queue, memmap, window_nodes, max_memory),
+                              daemon=True)
+        process.start()
+        processes.append(process)
+
+    pending = set(range(len(processes)))
+    try:
+        while len(pending) > 0:
+            kind, worker_id, data = vr_parallel.next_message(queue, processes, parts, pending)
+            if kind == "results":
+                yield from data
+            elif kind == "done":
+                pending.discard(worker_id)
+            else:
+                raise RuntimeError("worker #%d failed:\n%s" % (worker_id, data))
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+# compare the tile positions of the source catalog with the converted one
+# (the SW corners are only required to match for the layouts storing them exactly)
+# return the names of the tiles with mismatching positions and the max SW corner error
+
+
+def position_mismatches(tiles, output_tiles, columns, exact):
+    keys = tiles["row"].astype(np.int64) * columns + tiles["col"]
+    output_keys = output_tiles["row"].astype(np.int64) * columns + output_tiles["col"]
+    _, positions, output_positions = np.intersect1d(keys, output_keys, assume_unique=True, return_indices=True)
+    expected = tiles[positions]
+    found = output_tiles[output_positions]
+
+    mismatching = np.zeros(len(expected), dtype=bool)
+    for name in ["dimensions_x", "dimensions_y", "resolution_x", "resolution_y"]:
+        mismatching |= expected[name] != found[name]
+    error = np.zeros(len(expected))
+    for name in ["sw_corner_x", "sw_corner_y"]:
+        error = np.maximum(error, np.abs(expected[name].astype(np.float64) - found[name]))
+        if exact:
+            mismatching |= expected[name] != found[name]
+    names = ["%d_%d" % (tile["row"], tile["col"]) for tile in expected[mismatching]]
+    return names, float(error.max()) if len(error) > 0 else 0.0
+
+
+# verify a converted BAG against its source BAG
+# - fid: the source BAG
+# - fod: the converted BAG (both opened from files, to be reopened by the workers)
+# - layout: the layout name of the converted BAG (None: detected from the file structure)
+# - workers, memmap, window_nodes, max_memory: see iter_results and layout_readers.LayoutReader
+# - all_results: whether to keep the results of all the tiles (O(tiles) in memory), not only the failing ones
+# return the verification report (the totals, with the per-tile results of the failing tiles under "results")
+
+
+def verify(fid, fod, layout=None, workers=None, memmap=True, window_nodes=default_window_nodes, max_memory=None,
+           all_results=False):
+    start_time = time.perf_counter()
+    layout = layout or layout_readers.detect_layout(fod)
+    reader = layout_readers.layouts[layout](fod)
+    meta = fid["BAG_root/varres_metadata"]
+    tiles = vr_tiles.load_tile_catalog(meta)
+    trk = fid["BAG_root/varres_tracking_list"]
+    tracking = vr_tracking.load_tracking_list(trk, meta.shape) if trk.shape[0] != 0 else None
+    logger.info("verifying %d tiles against the %s layout" % (len(tiles), layout))
+
+    report = {"layout": layout, "tiles": len(tiles), "nodes": 0, "matching_tiles": 0, "mismatching_nodes": 0,
+              "max_error": 0.0, "missing_tiles": list(), "mismatching_tiles": list(), "extra_tiles": list()}
+    results = list()
+    for result in iter_results(fid, fod, layout, tiles, tracking, workers=workers, memmap=memmap,
+                               window_nodes=window_nodes, max_memory=max_memory):
+        if all_results or result["status"] != "ok":
+            results.append(result)
+        report["nodes"] += result["nodes"]
+        if result["status"] == "ok":
+            report["matching_tiles"] += 1
+            continue
+        if result["status"] == "missing":
+            report["missing_tiles"].append(result["tile"])
+            continue
+        report["mismatching_tiles"].append(result["tile"])
+        report["mismatching_nodes"] += result.get("elevation_mismatches", 0) + result.get("uncertainty_mismatches", 0)
+        report["max_error"] = max(report["max_error"], result.get("elevation_max_error", 0.0),
+                                  result.get("uncertainty_max_error", 0.0))
+        logger.warning("- tile %s: %s" % (result["tile"], result))
+    results.sort(key=lambda result: tuple(int(token) for token in result["tile"].split("_")))
+    report["results"] = results
+
+    source_names = set("%d_%d" % (tile["row"], tile["col"]) for tile in tiles)
+    report["extra_tiles"] = sorted(name for name in reader.tile_names() if name not in source_names)
+    report["position_mismatches"], report["max_position_error"] = \
+        position_mismatches(tiles, reader.tile_catalog(), meta.shape[1], reader.exact_tile_positions)
+
+    report["equivalent"] = report["matching_tiles"] == len(tiles) and len(report["extra_tiles"]) == 0 and \
+        len(report["position_mismatches"]) == 0
+    report["time"] = time.perf_counter() - start_time
+    report["nodes_per_s"] = report["nodes"] / report["time"] if report["time"] > 0 else None
+    return report